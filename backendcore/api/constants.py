@@ -8,6 +8,7 @@ from backendcore.common.constants import (  # noqa F401
 
 AC_EXPOSE_HEADERS = 'access-control-expose-headers'
 ADD_FILE = 'add_file'
+CACHE_METRICS = 'cache_metrics'
 FIELDS = 'fields'
 FILE = 'file'
 FILETYPE = 'filetype'
@@ -8,6 +8,14 @@ from flask import Flask
 from flask_cors import CORS
 from flask_restx import Resource, Namespace
 from werkzeug.routing import Rule
+import werkzeug.exceptions as wz
+
+import backendcore.data.caching as cach
+import backendcore.data.db_connect as dbc
+import backendcore.security.feature_password as ftpw
+import backendcore.security.sec_manager2 as sm
+import backendcore.text.query as tqry
+import backendcore.users.query as uqry
 
 from backendcore.emailer.contact_form import ( # noqa F401
     MESSAGE,
@@ -21,6 +29,7 @@ from backendcore.common.constants import (  # noqa F401
     AUTH_KEY,
 )
 from backendcore.api.constants import (  # noqa F401
+    CACHE_METRICS,
     CONTACT,
     CREATE,
     DELETE,
@@ -64,6 +73,13 @@ app.config['JSON_SORT_KEYS'] = False
 
 CORS(app)
 api.init_app(app)
+# the indexes our lookups need, for dbc.init_app() to make:
+uqry.declare_indexes()
+sm.declare_indexes()
+ftpw.declare_indexes()
+tqry.declare_indexes()
+cach.declare_indexes()
+dbc.init_app(app)
 
 DEF_PORT = 8000
 LOCAL_HOST = '127.0.0.1'
@@ -71,6 +87,8 @@ LOCAL_HOST = '127.0.0.1'
 # Endpoint constants
 ENDPOINT_STR = 'Available endpoints'
 
+CACHE_METRICS_W_NS = f'/{ENDPOINTS}/{CACHE_METRICS}'
+
 # security manager
 SEC_MANAGER_IS_PERMITTED_W_NS = f'/{SEC_MANAGER}/{IS_PERMITTED}'
 SEC_MANAGER_RETRIEVE_W_NS = f'/{SEC_MANAGER}/{RETRIEVE}'
@@ -115,6 +133,33 @@ class Hello(Resource):
         return {MESSAGE: "Hello, World!"}
 
 
+@endpoints.route(f'/{CACHE_METRICS}')
+class CacheMetrics(Resource):
+    """
+    How our data caches are doing.
+    """
+    def get(self):
+        """
+        Returns hit, miss, load time, and size metrics for every cache.
+        """
+        return cach.get_metrics()
+
+
+@endpoints.route(f'/{CACHE_METRICS}/<cache_nm>')
+class CacheMetricsOne(Resource):
+    """
+    How one data cache is doing.
+    """
+    def get(self, cache_nm):
+        """
+        Returns hit, miss, load time, and size metrics for one cache.
+        """
+        try:
+            return cach.get_metrics(cache_nm)
+        except ValueError as e:
+            raise wz.NotFound(str(e))
+
+
 EP_READ_KEY = 'Endpoint Map'
 
 
@@ -0,0 +1,41 @@
+from http.client import (
+    NOT_FOUND,
+    OK,
+)
+
+from unittest.mock import patch
+
+import backendcore.api.endpoints as ep
+
+TEST_CLIENT = ep.app.test_client()
+
+CACHING = 'backendcore.data.caching'
+
+METRICS = {'a_cache': {'hits': 1, 'misses': 1}}
+
+
+def test_hello():
+    resp = TEST_CLIENT.get(f'/{ep.HELLO}')
+    assert resp.status_code == OK
+
+
+@patch(f'{CACHING}.get_metrics', autospec=True, return_value=METRICS)
+def test_cache_metrics(mock_get_metrics):
+    resp = TEST_CLIENT.get(ep.CACHE_METRICS_W_NS)
+    assert resp.status_code == OK
+    assert resp.get_json() == METRICS
+
+
+@patch(f'{CACHING}.get_metrics', autospec=True,
+       return_value=METRICS['a_cache'])
+def test_cache_metrics_one(mock_get_metrics):
+    resp = TEST_CLIENT.get(f'{ep.CACHE_METRICS_W_NS}/a_cache')
+    assert resp.status_code == OK
+    mock_get_metrics.assert_called_once_with('a_cache')
+
+
+@patch(f'{CACHING}.get_metrics', autospec=True,
+       side_effect=ValueError('No such cache'))
+def test_cache_metrics_not_there(mock_get_metrics):
+    resp = TEST_CLIENT.get(f'{ep.CACHE_METRICS_W_NS}/no_cache')
+    assert resp.status_code == NOT_FOUND
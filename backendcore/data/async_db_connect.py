@@ -0,0 +1,129 @@
+"""
+This is the asyncio interface to our database, whatever our database may
+be. It mirrors the core of db_connect, but its functions are coroutines,
+so a worker can have many DB calls in flight at once.
+The async drivers are optional: see the databases/async_* modules.
+"""
+import os
+
+import backendcore.data.db_connect as dbc
+import backendcore.data.databases.async_mongo_connect as amdb
+import backendcore.data.databases.async_sql_connect as asdb
+
+from backendcore.data.db_connect import (  # noqa F401
+    ASC,
+    DESC,
+    DOC_LIMIT,
+    MONGO,
+    NO_PROJ,
+    NO_SORT,
+    delete_success,
+    num_deleted,
+    num_updated,
+    update_success,
+)
+
+
+def get_db(db_type):
+    """
+    Sets up an async connection to the appropriate DB.
+    """
+    if db_type == dbc.MONGO:
+        local = os.environ.get("LOCAL_MONGO", dbc.REMOTE) == dbc.LOCAL
+        return amdb.AsyncMongoDB(local_db=local)
+    return asdb.AsyncSqlDB(variant=db_type)
+
+
+connections = dbc.ConnectionManager(dbc.db_type, make_db=get_db)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=connections.after_fork)
+
+
+database = dbc.DatabaseProxy(connections)
+# needs_db handles coroutines too:
+needs_db = dbc.needs_db
+
+
+@needs_db
+async def read_one(db_nm, clct_nm, filters={}, no_id=False):
+    """
+    Fetch one record that meets filters.
+    """
+    return await database.read_one(db_nm, clct_nm, filters=filters,
+                                   no_id=no_id)
+
+
+@needs_db
+async def read(db_nm: str, clct_nm: str, sort: int = NO_SORT,
+               sort_fld: str = None, no_id: bool = False, limit: int = None,
+               filters: dict = {}, proj: list = NO_PROJ,
+               exclude_flds: list = None):
+    return await database.read(db_nm, clct_nm,
+                               sort=sort,
+                               sort_fld=sort_fld,
+                               no_id=no_id,
+                               limit=limit,
+                               filters=filters,
+                               proj=proj,
+                               exclude_flds=exclude_flds)
+
+
+@needs_db
+async def count_documents(db_nm, clct_nm, filters={}) -> int:
+    return await database.count_documents(db_nm, clct_nm, filters=filters)
+
+
+@needs_db
+async def exists(db_nm, clct_nm, filters={}) -> bool:
+    return await database.exists(db_nm, clct_nm, filters=filters)
+
+
+async def fetch_all(db_nm, clct_nm, sort=NO_SORT, sort_fld=None,
+                    no_id=False, proj=NO_PROJ, exclude_flds=None):
+    return await read(db_nm, clct_nm, sort=sort, sort_fld=sort_fld,
+                      no_id=no_id, proj=proj, exclude_flds=exclude_flds)
+
+
+@needs_db
+async def select(db_nm, clct_nm, filters={}, sort=NO_SORT, sort_fld='_id',
+                 proj=NO_PROJ, limit=DOC_LIMIT, no_id=False,
+                 exclude_flds=None, skip=0):
+    """
+    Select records from a collection matching filters.
+    """
+    return await database.select(db_nm, clct_nm,
+                                 filters=filters,
+                                 sort=sort,
+                                 sort_fld=sort_fld,
+                                 proj=proj,
+                                 limit=limit,
+                                 no_id=no_id,
+                                 exclude_flds=exclude_flds,
+                                 skip=skip)
+
+
+@needs_db
+async def create(db_nm: str, clct_nm: str, doc: dict, with_date=False):
+    return await database.create(db_nm, clct_nm, doc, with_date=with_date)
+
+
+@needs_db
+async def update(db_nm, clct_nm, filters, update_dict, upsert=False):
+    return await database.update(db_nm, clct_nm, filters, update_dict,
+                                 upsert=upsert)
+
+
+@needs_db
+async def delete(db_nm, clct_nm, filters={}):
+    """
+    Delete one record that meets filters.
+    """
+    return await database.delete(db_nm, clct_nm, filters=filters)
+
+
+@needs_db
+async def aggregate(db_nm, clct_nm, pipeline) -> list:
+    """
+    MongoDB only: SQL has no aggregation pipelines.
+    """
+    return await database.aggregate(db_nm, clct_nm, pipeline)
@@ -1,9 +1,18 @@
 """
 Our interface to a collection of data.
 """
+import asyncio
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from functools import wraps
 
+import backendcore.data.async_db_connect as adbc
 import backendcore.data.db_connect as dbc
 
 from backendcore.common.constants import (
@@ -14,6 +23,17 @@ from backendcore.common.constants import (
 
 import backendcore.data.query as qry
 
+# Where versioned caches publish their versions, so that other processes
+# can tell their caches are stale:
+VERSION_COLLECT = 'cache_versions'
+CACHE_NM = 'cache_nm'
+VERSION = 'version'
+# How often (in seconds) a versioned cache checks for a new version:
+DEF_VERSION_CHECK_SECS = 1.0
+
+# For paged collections:
+DEF_PAGE_SIZE = 100
+DEF_MAX_HOT_RECS = 1000
 
 """
 A little utility function.
@@ -24,6 +44,282 @@ def can_do_math(record, fld):
     return fld in record and isinstance(record[fld], (int, float))
 
 
+def locked(fn):
+    """
+    Runs a DataCollection method while holding the collection's lock.
+    """
+    @wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return fn(self, *args, **kwargs)
+    return wrapper
+
+
+def is_hashable(val) -> bool:
+    try:
+        hash(val)
+    except TypeError:
+        return False
+    return True
+
+
+"""
+Read-only views of our caches.
+These let callers look at cached data without copying the whole cache.
+"""
+
+
+class CowRecord(MutableMapping):
+    """
+    A copy-on-write wrapper around a cached record.
+    Reads go straight to the cached record; the first write copies it,
+    so the cache itself is never changed through the wrapper.
+    We can't see writes to nested values (lists, dicts), so handing one
+    out counts as a write: the caller gets our own copy of it.
+    """
+    def __init__(self, rec: dict):
+        self._rec = rec
+        self._copied = False
+
+    def _own(self):
+        if not self._copied:
+            self._rec = deepcopy(self._rec)
+            self._copied = True
+
+    def __getitem__(self, fld):
+        if not is_hashable(self._rec[fld]):
+            # a mutable container, which the caller might change:
+            self._own()
+        return self._rec[fld]
+
+    def __setitem__(self, fld, val):
+        self._own()
+        self._rec[fld] = val
+
+    def __delitem__(self, fld):
+        self._own()
+        del self._rec[fld]
+
+    def __iter__(self):
+        return iter(self._rec)
+
+    def __len__(self):
+        return len(self._rec)
+
+    def __repr__(self):
+        return repr(self._rec)
+
+    def to_dict(self) -> dict:
+        """
+        A plain (deep) copy of the record, e.g., for JSON.
+        """
+        return deepcopy(self._rec)
+
+
+class ListView(Sequence):
+    """
+    A read-only view of a cached list of records.
+    """
+    def __init__(self, recs: list):
+        self._recs = recs
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [CowRecord(rec) for rec in self._recs[i]]
+        return CowRecord(self._recs[i])
+
+    def __len__(self):
+        return len(self._recs)
+
+    def __repr__(self):
+        return repr(self._recs)
+
+    def to_list(self) -> list:
+        return deepcopy(self._recs)
+
+
+class DictView(Mapping):
+    """
+    A read-only view of a cached dict of records.
+    """
+    def __init__(self, recs: dict):
+        self._recs = recs
+
+    def __getitem__(self, key_val):
+        return CowRecord(self._recs[key_val])
+
+    def __contains__(self, key_val):
+        return key_val in self._recs
+
+    def __iter__(self):
+        return iter(self._recs)
+
+    def __len__(self):
+        return len(self._recs)
+
+    def __repr__(self):
+        return repr(self._recs)
+
+    def to_dict(self) -> dict:
+        return deepcopy(self._recs)
+
+
+class FldIndex(object):
+    """
+    An in-memory index on one field of a cache.
+    `vals` is a hash index from field value to the keys of matching records;
+    `members` is an inverted index from the members of list-valued fields.
+    Records whose values we can't index that way are kept in the `*_scan`
+    sets and checked one by one.
+    Key sets are dicts, so they keep insertion order.
+    Once readers may be using an index, change a copy() of it instead.
+    """
+    def __init__(self, fld_nm: str):
+        self.fld_nm = fld_nm
+        self.vals = {}
+        self.members = {}
+        self.vals_scan = {}
+        self.members_scan = {}
+        # the (index name, value) key sets this index doesn't share:
+        self.owned = None
+
+    def copy(self):
+        """
+        A copy we can change without disturbing readers of this one.
+        Key sets are shared until the copy changes them.
+        """
+        new_index = FldIndex(self.fld_nm)
+        new_index.vals = dict(self.vals)
+        new_index.members = dict(self.members)
+        new_index.vals_scan = dict(self.vals_scan)
+        new_index.members_scan = dict(self.members_scan)
+        new_index.owned = set()
+        return new_index
+
+    def _keys(self, index_nm: str, val) -> dict:
+        index = getattr(self, index_nm)
+        keys = index.get(val)
+        if self.owned is not None and (index_nm, val) not in self.owned:
+            keys = dict(keys) if keys is not None else {}
+            index[val] = keys
+            self.owned.add((index_nm, val))
+        elif keys is None:
+            keys = index[val] = {}
+        return keys
+
+    def add(self, key_val, rec: dict):
+        val = rec.get(self.fld_nm)
+        if isinstance(val, list):
+            self.vals_scan[key_val] = None
+            for member in val:
+                if is_hashable(member):
+                    self._keys('members', member)[key_val] = None
+                else:
+                    self.members_scan[key_val] = None
+        elif is_hashable(val):
+            self._keys('vals', val)[key_val] = None
+            if val is not None:
+                self.members_scan[key_val] = None
+        else:
+            self.vals_scan[key_val] = None
+            self.members_scan[key_val] = None
+
+    def remove(self, key_val, rec: dict):
+        val = rec.get(self.fld_nm)
+        to_check = [('vals', val)]
+        if isinstance(val, list):
+            to_check = [('members', member) for member in val]
+        for index_nm, index_val in to_check:
+            index = getattr(self, index_nm)
+            if is_hashable(index_val) and index_val in index:
+                keys = self._keys(index_nm, index_val)
+                keys.pop(key_val, None)
+                if not keys:
+                    del index[index_val]
+        self.vals_scan.pop(key_val, None)
+        self.members_scan.pop(key_val, None)
+
+    def lookup(self, val, data_dict: dict, test_membership=False) -> dict:
+        """
+        Returns the records in data_dict matching val, just as
+        `query.fetch_by_fld_val()` would.
+        Returns None if val itself can't be looked up.
+        """
+        if not is_hashable(val):
+            return None
+        if test_membership:
+            keys, scan = self.members.get(val, {}), self.members_scan
+        else:
+            keys, scan = self.vals.get(val, {}), self.vals_scan
+        matches = {key_val: data_dict[key_val] for key_val in keys}
+        to_scan = {key_val: data_dict[key_val] for key_val in scan}
+        matches.update(qry.fetch_by_fld_val(self.fld_nm, val, to_scan,
+                                            test_membership))
+        return matches
+
+
+# Metric names:
+HITS = 'hits'
+MISSES = 'misses'
+LOADS = 'loads'
+CLEARS = 'clears'
+STALE_RELOADS = 'stale_reloads'
+LOCAL_WRITES = 'local_writes'
+LAST_LOAD_SECS = 'last_load_secs'
+TOTAL_LOAD_SECS = 'total_load_secs'
+NUM_RECS = 'num_recs'
+APPROX_BYTES = 'approx_bytes'
+
+
+def approx_size(obj) -> int:
+    """
+    A rough count of the bytes held by a cache: containers plus their
+    records' fields, one level down.
+    """
+    size = sys.getsizeof(obj)
+    recs = obj.values() if isinstance(obj, dict) else obj
+    for rec in recs:
+        size += sys.getsizeof(rec)
+        if isinstance(rec, dict):
+            for fld_nm, val in rec.items():
+                size += sys.getsizeof(fld_nm) + sys.getsizeof(val)
+    return size
+
+
+class CacheMetrics(object):
+    """
+    Counts how a cache is used.
+    Counts are not locked: under threads they may be slightly off,
+    which is fine for what they are for.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.clears = 0
+        self.stale_reloads = 0
+        self.local_writes = 0
+        self.last_load_secs = 0.0
+        self.total_load_secs = 0.0
+
+    def record_load(self, secs: float):
+        self.loads += 1
+        self.last_load_secs = secs
+        self.total_load_secs += secs
+
+    def to_json(self) -> dict:
+        return {
+            HITS: self.hits,
+            MISSES: self.misses,
+            LOADS: self.loads,
+            CLEARS: self.clears,
+            STALE_RELOADS: self.stale_reloads,
+            LOCAL_WRITES: self.local_writes,
+            LAST_LOAD_SECS: self.last_load_secs,
+            TOTAL_LOAD_SECS: self.total_load_secs,
+        }
+
+
 class DataCollection(object):
     caches: dict = {}
 
@@ -53,7 +349,32 @@ class DataCollection(object):
                  key_fld: str = CODE,
                  sort_fld: str = NAME,
                  sort_order=dbc.ASC,
-                 no_id=True):
+                 no_id=True,
+                 read_only=False,
+                 ttl: float = None,
+                 versioned=False,
+                 version_check_secs: float = DEF_VERSION_CHECK_SECS,
+                 index_flds: list = None,
+                 search_flds: list = None,
+                 proj: list = None,
+                 exclude_flds: list = None,
+                 unique_key=False):
+        """
+        `ttl` is the most seconds to keep a cache before reloading it.
+        If `versioned`, every write publishes a new version of the cache
+        in the DB, and we reload when another process has published one.
+        `index_flds` are fields to keep in-memory indexes on, for fast
+        `fetch_by_fld_val()` lookups.
+        `search_flds` are fields to keep an n-gram index on, for fast
+        `regex_search()`.
+        `proj` lists the only fields to cache (the key is always cached);
+        `exclude_flds` fields not to cache. The DB doesn't send us the
+        rest.
+        If `unique_key`, declare_indexes() asks for a unique index on the
+        key: only ask once the collection has no duplicate keys.
+        """
+        if exclude_flds and key_fld in exclude_flds:
+            raise ValueError(f'Cannot exclude the key field {key_fld}')
         # db_nm might be adjusted when testing.
         caches = []
         for cache in self.caches:
@@ -68,15 +389,73 @@ class DataCollection(object):
                              + f'{cache_nm=}')
         else:
             self.caches[cache_nm] = self
+        self.cache_nm = cache_nm
         self.db_nm = db_nm
         self.collect_nm = collect_nm
         self.key_fld = key_fld
         self.sort_fld = sort_fld
         self.sort_order = sort_order
         self.no_id = no_id
+        self.proj = list(dict.fromkeys([key_fld, *proj])) if proj else []
+        self.exclude_flds = exclude_flds
+        # If read_only, fetches return views of the cache, not deep copies:
+        self.read_only = read_only
+        # Guards filling and changing the caches. Readers don't take it on
+        # the fast path: we swap in new objects rather than mutate them.
+        self.lock = threading.RLock()
+        # so a refresh can tell whether writes happened while it read:
+        self.write_count = 0
+        self.metrics = CacheMetrics()
         # our data caches:
         self.data_list = None
         self.data_dict = None
+        # the filters, if any, the cache was loaded with:
+        self.load_filters = None
+        # staleness:
+        self.ttl = ttl
+        self.versioned = versioned
+        self.version_check_secs = version_check_secs
+        self.loaded_at = None
+        self.version = None
+        self.version_checked_at = None
+        # the loaded_at of a load we found had a new version:
+        self.stale_load = None
+        self.index_flds = index_flds if index_flds else []
+        self.search_flds = search_flds if search_flds else []
+        # (data_dict, indexes by field name, search index), swapped in
+        # as one so lock-free readers never mix up dicts and indexes:
+        self.indexed = None
+        self.unique_key = unique_key
+
+    @property
+    def indexes(self):
+        return self.indexed[1] if self.indexed is not None else None
+
+    @property
+    def search_index(self):
+        return self.indexed[2] if self.indexed is not None else None
+
+    def declare_indexes(self):
+        """
+        Declares the indexes our key lookups and version checks need, for
+        dbc.ensure_indexes().
+        A unique key index also lets SQL upsert on the key in one
+        statement.
+        """
+        if not DataCollection.is_db_id(self.key_fld):
+            dbc.declare_index(self.db_nm, self.collect_nm, [self.key_fld],
+                              unique=self.unique_key)
+        if self.versioned:
+            dbc.declare_index(self.db_nm, VERSION_COLLECT, [CACHE_NM])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
 
     def __str__(self):
         return str(self.data_list)
@@ -93,77 +472,478 @@ class DataCollection(object):
         """
         pass
 
-    def fetch_list(self, filters=None):
+    def _fetch_version(self):
+        rec = dbc.read_one(self.db_nm, VERSION_COLLECT,
+                           filters={CACHE_NM: self.cache_nm}, no_id=True)
+        if rec:
+            return rec.get(VERSION)
+        return None
+
+    def _publish_version(self):
+        """
+        Tells other processes we have changed the collection.
+        Returns the (old, new) versions for _install_version(), or None
+        if we aren't versioned.
+        This is DB I/O, so don't call it holding the lock.
+        There is a small window between reading and writing the version
+        where we could miss another process's write: the TTL bounds that.
+        """
+        if not self.versioned:
+            return None
+        old_version = self._fetch_version()
+        new_version = uuid.uuid4().hex
+        dbc.upsert(self.db_nm, VERSION_COLLECT,
+                   {CACHE_NM: self.cache_nm},
+                   {CACHE_NM: self.cache_nm, VERSION: new_version})
+        return old_version, new_version
+
+    def _install_version(self, versions):
+        """
+        Call holding the lock.
+        If someone else changed the collection since we loaded (even
+        another of our threads), our cache is stale too.
+        """
+        if versions is None:
+            return
+        old_version, new_version = versions
+        if old_version != self.version:
+            self.clear_cache()
+        self.version = new_version
+
+    def _publish_write(self):
+        versions = self._publish_version()
+        with self.lock:
+            self._install_version(versions)
+
+    def is_stale(self) -> bool:
+        """
+        Has our cache outlived its TTL, or has another process written
+        a new version of it?
+        """
+        if self.data_list is None or self.loaded_at is None:
+            return False
+        now = time.monotonic()
+        if self.ttl is not None and now - self.loaded_at >= self.ttl:
+            return True
+        if self.versioned:
+            if self.stale_load == self.loaded_at:
+                return True
+            if now - self.version_checked_at >= self.version_check_secs:
+                self.version_checked_at = now
+                if self._fetch_version() != self.version:
+                    # remember, since the next check may not go to the DB:
+                    self.stale_load = self.loaded_at
+                    return True
+        return False
+
+    def _load_list(self, filters=None) -> list:
+        """
+        Fills the cache if needed and returns the cached list itself.
+        Callers must not mutate what this returns!
+        Fills are single-flight: one thread loads while the others wait
+        for its result.
+        """
+        data_list = self.data_list
+        if data_list is not None and not self.is_stale():
+            self.metrics.hits += 1
+            return data_list
+        with self.lock:
+            return self._fill_list(filters)
+
+    def _clear_if_stale(self):
+        if self.is_stale():
+            self.metrics.stale_reloads += 1
+            self.clear_cache()
+
+    def _fill_list(self, filters=None) -> list:
+        self._clear_if_stale()
         if self.data_list is None:
-            if filters is None:
-                self.data_list = dbc.fetch_all(self.db_nm,
-                                               self.collect_nm,
-                                               no_id=self.no_id,
-                                               sort=self.sort_order,
-                                               sort_fld=self.sort_fld)
-            else:
-                self.data_list = dbc.select(self.db_nm,
-                                            self.collect_nm,
-                                            filters=filters,
-                                            sort=dbc.ASC,
-                                            sort_fld=self.sort_fld,
-                                            no_id=self.no_id)
-            self._post_fetch()
-        return deepcopy(self.data_list)
+            self.metrics.misses += 1
+            if self.versioned:
+                # fetch the version first, so we can't miss a write:
+                self.version = self._fetch_version()
+            loaded_at = time.monotonic()
+            self._install_list(self._fetch_from_db(filters), filters,
+                               loaded_at)
+        else:
+            self.metrics.hits += 1
+        return self.data_list
+
+    def _install_list(self, data_list: list, filters, loaded_at: float):
+        self.loaded_at = loaded_at
+        self.version_checked_at = loaded_at
+        self.data_list = data_list
+        self.load_filters = filters
+        self._post_fetch()
+        self.metrics.record_load(time.monotonic() - loaded_at)
 
-    def fetch_dict(self, filters=None):
+    def _fetch_from_db(self, filters=None) -> list:
+        if filters is None:
+            return dbc.fetch_all(self.db_nm,
+                                 self.collect_nm,
+                                 no_id=self.no_id,
+                                 sort=self.sort_order,
+                                 sort_fld=self.sort_fld,
+                                 proj=self.proj,
+                                 exclude_flds=self.exclude_flds)
+        return dbc.select(self.db_nm,
+                          self.collect_nm,
+                          filters=filters,
+                          sort=dbc.ASC,
+                          sort_fld=self.sort_fld,
+                          no_id=self.no_id,
+                          proj=self.proj,
+                          exclude_flds=self.exclude_flds)
+
+    def _project(self, rec: dict) -> dict:
         """
-        Sometimes it is more convenient to have a dictionary than a list!
+        Cuts a record down to the fields we cache, in place.
+        """
+        if self.proj:
+            keep = set(self.proj)
+            keep.add(OBJ_ID_NM)
+            for fld_nm in [fld_nm for fld_nm in rec if fld_nm not in keep]:
+                del rec[fld_nm]
+        if self.exclude_flds:
+            for fld_nm in self.exclude_flds:
+                rec.pop(fld_nm, None)
+        return rec
+
+    def warm_up(self):
+        """
+        Loads the cache now, rather than on the first request.
+        """
+        self._load_dict()
+        return len(self)
+
+    async def warm_up_async(self):
+        """
+        Loads the cache through the async DB API, so we don't block an
+        event loop while the DB answers.
+        We can't hold our lock across an await, so tasks that find the
+        cache cold at the same time may each read the DB: the first to
+        finish fills the cache, and the rest use it.
+        """
+        if self.data_list is None or self.is_stale():
+            version = None
+            if self.versioned:
+                rec = await adbc.read_one(self.db_nm, VERSION_COLLECT,
+                                          filters={CACHE_NM: self.cache_nm},
+                                          no_id=True)
+                version = rec.get(VERSION) if rec else None
+            loaded_at = time.monotonic()
+            data_list = await adbc.fetch_all(self.db_nm,
+                                             self.collect_nm,
+                                             no_id=self.no_id,
+                                             sort=self.sort_order,
+                                             sort_fld=self.sort_fld,
+                                             proj=self.proj,
+                                             exclude_flds=self.exclude_flds)
+            with self.lock:
+                self._clear_if_stale()
+                if self.data_list is None:
+                    self.metrics.misses += 1
+                    self.version = version
+                    self._install_list(data_list, None, loaded_at)
+        # the list is loaded, so this is just CPU work:
+        return self.warm_up()
+
+    def refresh(self):
+        """
+        Reloads the cache from the DB.
+        We build the new list, dict, and indexes off to the side and then
+        swap them in, so readers keep using the old cache until the new one
+        is complete, rather than finding it cold.
+        """
+        if type(self)._post_fetch is not DataCollection._post_fetch:
+            # _post_fetch() works on the live cache, so just reload:
+            self.clear_cache()
+            return self.warm_up()
+        write_count = self.write_count
+        version = self._fetch_version() if self.versioned else None
+        loaded_at = time.monotonic()
+        new_list = self._fetch_from_db(self.load_filters)
+        new_dict = qry.list_to_dict(self.key_fld, new_list)
+        indexed = self._make_indexes(new_dict)
+        self.metrics.record_load(time.monotonic() - loaded_at)
+        with self.lock:
+            if self.write_count != write_count:
+                # we may have read from before a write the cache has:
+                return len(self)
+            (self.data_list, self.data_dict, self.indexed,
+             self.version, self.loaded_at,
+             self.version_checked_at) = (new_list, new_dict, indexed,
+                                         version, loaded_at, loaded_at)
+        return len(self)
+
+    def _load_dict(self, filters=None) -> dict:
+        """
+        Fills the cache if needed and returns the cached dict itself.
+        Callers must not mutate what this returns!
         """
+        data_dict = self.data_dict
+        if data_dict is not None and not self.is_stale():
+            self.metrics.hits += 1
+            return data_dict
+        with self.lock:
+            return self._fill_dict(filters)
+
+    def _fill_dict(self, filters=None) -> dict:
+        self._clear_if_stale()
         if self.data_dict is None:
             self.data_dict = qry.list_to_dict(self.key_fld,
-                                              self.fetch_list(filters))
-        return deepcopy(self.data_dict)
+                                              self._fill_list(filters))
+            self._build_indexes()
+        else:
+            self.metrics.hits += 1
+        return self.data_dict
+
+    def _make_indexes(self, data_dict: dict):
+        indexes = {}
+        for fld_nm in self.index_flds:
+            index = FldIndex(fld_nm)
+            for key_val, rec in data_dict.items():
+                index.add(key_val, rec)
+            indexes[fld_nm] = index
+        search_index = None
+        if self.search_flds:
+            search_index = qry.NgramIndex(self.search_flds)
+            for key_val, rec in data_dict.items():
+                search_index.add(key_val, rec)
+        return data_dict, indexes, search_index
+
+    def _build_indexes(self):
+        self.indexed = self._make_indexes(self.data_dict)
+
+    def _reindex(self, new_dict: dict, removed=(), added=()):
+        """
+        Moves the indexes from the current dict to new_dict, which has
+        the (key, record) pairs in `removed` and `added` changed.
+        Readers may be using the old indexes, so we change copies.
+        """
+        if self.indexed is None:
+            return
+        old_dict, indexes, search_index = self.indexed
+        if old_dict is not self.data_dict:
+            # out of date anyway: the next indexed read rebuilds them
+            self.indexed = None
+            return
+        indexes = {fld_nm: index.copy() for fld_nm, index in indexes.items()}
+        if search_index is not None:
+            search_index = search_index.copy()
+        for key_val, rec in removed:
+            for index in indexes.values():
+                index.remove(key_val, rec)
+            if search_index is not None:
+                search_index.remove(key_val, rec)
+        for key_val, rec in added:
+            for index in indexes.values():
+                index.add(key_val, rec)
+            if search_index is not None:
+                search_index.add(key_val, rec)
+        self.indexed = (new_dict, indexes, search_index)
+
+    def _load_indexed(self):
+        """
+        Returns the cached dict with its indexes, as one consistent
+        snapshot. We only take the lock if they need (re)building.
+        """
+        indexed = self.indexed
+        if (indexed is not None and indexed[0] is self.data_dict
+                and not self.is_stale()):
+            self.metrics.hits += 1
+            return indexed
+        with self.lock:
+            self._fill_dict()
+            if self.indexed is None or self.indexed[0] is not self.data_dict:
+                self._build_indexes()
+            return self.indexed
 
-    def fetch_by_key(self, key_val: str):
+    def _use_views(self, read_only):
+        if read_only is None:
+            return self.read_only
+        return read_only
+
+    def fetch_list(self, filters=None, read_only=None):
+        """
+        Returns a deep copy of the cached list, or, if `read_only`,
+        a view of it that copies nothing.
+        `read_only=None` means use the collection's setting.
+        """
+        data_list = self._load_list(filters)
+        if self._use_views(read_only):
+            return ListView(data_list)
+        return deepcopy(data_list)
+
+    def fetch_dict(self, filters=None, read_only=None):
+        """
+        Sometimes it is more convenient to have a dictionary than a list!
+        `read_only` works as for `fetch_list()`.
+        """
+        data_dict = self._load_dict(filters)
+        if self._use_views(read_only):
+            return DictView(data_dict)
+        return deepcopy(data_dict)
+
+    def fetch_by_key(self, key_val: str, read_only=None):
         """
         The key must be unique in our db, so we can fetch a unique
         record based on just it.
+        Only the record found is copied, not the whole cache.
         """
-        data_dict = self.fetch_dict()
-        return data_dict.get(key_val)
+        rec = self._load_dict().get(key_val)
+        if rec is None:
+            return None
+        if self._use_views(read_only):
+            return CowRecord(rec)
+        return deepcopy(rec)
 
     def fetch_keys(self):
         """
         Fetches a list of the keys
         """
-        data_dict = self.fetch_dict()
-        return list(data_dict.keys())
+        return list(self._load_dict().keys())
 
-    def fetch_by_fld_val(self, fld, val, test_membership=False):
+    def fetch_by_fld_val(self, fld, val, test_membership=False,
+                         read_only=None):
         """
         Fetches records with a field that matches a specific value.
         Returns a dict.
         """
-        data_dict = self.fetch_dict()
-        return qry.fetch_by_fld_val(fld, val, data_dict, test_membership)
+        matches = None
+        if fld in self.index_flds:
+            data_dict, indexes, _ = self._load_indexed()
+            matches = indexes[fld].lookup(val, data_dict, test_membership)
+        else:
+            data_dict = self._load_dict()
+        if matches is None:
+            matches = qry.fetch_by_fld_val(fld, val, data_dict,
+                                           test_membership)
+        if self._use_views(read_only):
+            return DictView(matches)
+        return deepcopy(matches)
+
+    def regex_search(self, fld_dict: dict, read_only=None):
+        """
+        Fetches records matching all the (case-insensitive) regexes in
+        fld_dict, which maps field names to patterns.
+        Returns a dict.
+        """
+        data_dict, _, search_index = self._load_indexed()
+        candidates = qry.SearchEngine(search_index).candidates(fld_dict,
+                                                               data_dict)
+        matches = qry.SearchEngine().search(fld_dict, candidates)
+        if self._use_views(read_only):
+            return DictView(matches)
+        return deepcopy(matches)
 
     def exists(self, key_val: str):
         """
         Is a record with this code already in the factor DB?
         Returns True if so, else False.
         """
-        return self.fetch_by_key(key_val) is not None
+        return key_val in self._load_dict()
 
     def get_choices(self):
         """
         For pick lists.
         """
-        return qry.get_choices(self.fetch_list(), self.key_fld, self.sort_fld)
+        return qry.get_choices(self._load_list(), self.key_fld,
+                               self.sort_fld)
 
+    @locked
     def clear_cache(self):
+        if self.data_list is not None:
+            self.metrics.clears += 1
         self.data_list = None
         self.data_dict = None
+        self.indexed = None
+
+    def get_metrics(self) -> dict:
+        """
+        How this cache has been used, and how big it is.
+        """
+        metrics = self.metrics.to_json()
+        data_list, data_dict = self.data_list, self.data_dict
+        metrics[NUM_RECS] = len(data_list) if data_list else 0
+        metrics[APPROX_BYTES] = 0
+        if data_list is not None:
+            metrics[APPROX_BYTES] += approx_size(data_list)
+        if data_dict is not None:
+            # the records are shared with the list:
+            metrics[APPROX_BYTES] += sys.getsizeof(data_dict)
+        return metrics
 
+    @locked
     def empty_cache(self):  # for testing only!
         self.data_list = []
         self.data_dict = {}
+        self.indexed = None
+
+    """
+    Incremental cache maintenance.
+    Writes go to the DB first, and are then applied to the cache in place
+    of reloading it. Where a change can't be applied locally, we fall back
+    to clearing the cache, and the next read reloads it.
+    We never mutate the cached list, dict, indexes, or records: we build
+    new ones and swap them in, so views handed out earlier, and readers
+    that don't take the lock, stay consistent.
+    """
+
+    def _is_cached(self):
+        return self.data_list is not None
+
+    def _can_maintain(self):
+        """
+        Can we apply changes to the cache without reloading it?
+        Not if the cache was loaded with filters, or a sub-class
+        post-processes what it fetches.
+        """
+        return (self._is_cached()
+                and self.load_filters is None
+                and type(self)._post_fetch is DataCollection._post_fetch)
+
+    def _sort_pos(self, recs: list, rec: dict) -> int:
+        """
+        Where does rec go in recs to keep them in sort order?
+        Raises KeyError or TypeError if rec can't be placed.
+        """
+        if self.sort_order == dbc.NO_SORT or self.sort_fld is None:
+            return len(recs)
+        val = rec[self.sort_fld]
+        lo, hi = 0, len(recs)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_val = recs[mid][self.sort_fld]
+            if self.sort_order == dbc.DESC:
+                goes_after = mid_val >= val
+            else:
+                goes_after = mid_val <= val
+            if goes_after:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _list_pos(self, rec: dict) -> int:
+        for i, cached_rec in enumerate(self.data_list):
+            if cached_rec is rec:
+                return i
+        raise ValueError(f'Record not in cache list: {rec=}')
 
+    def _cache_rec(self, rec: dict, rec_id=None) -> dict:
+        """
+        Makes the version of a record we just wrote that a reload would give.
+        """
+        cache_rec = self._project(deepcopy(rec))
+        cache_rec.pop(OBJ_ID_NM, None)
+        if not self.no_id:
+            if rec_id is None:
+                raise ValueError('Record id needed for the cache.')
+            cache_rec[OBJ_ID_NM] = rec_id
+        return cache_rec
+
+    @locked
     def _add_to_cache(self, rec: dict):
         """
         For cases where it is expensive to update the entire cache.
@@ -171,22 +951,172 @@ class DataCollection(object):
         key_val = rec.get(self.key_fld, None)
         if not key_val:
             raise ValueError('Attempt to add rec with missing key to cache')
-        if self.data_dict:
-            if key_val in self.data_dict:
-                raise ValueError(f'Attempt to add dup {key_val} to cache')
-        if not self.data_list:
+        if self.data_list is None:
             self.data_list = []
-        self.data_list.append(rec)
-        if not self.data_dict:
-            self.data_dict = {}
-        self.data_dict[key_val] = rec
+        if self.data_dict is None:
+            self.data_dict = qry.list_to_dict(self.key_fld, self.data_list)
+        if key_val in self.data_dict:
+            raise ValueError(f'Attempt to add dup {key_val} to cache')
+        new_list = list(self.data_list)
+        new_list.insert(self._sort_pos(new_list, rec), rec)
+        new_dict = dict(self.data_dict)
+        new_dict[key_val] = rec
+        self.data_list = new_list
+        self._reindex(new_dict, added=[(key_val, rec)])
+        self.data_dict = new_dict
+
+    @locked
+    def _replace_in_cache(self, key_val, new_rec: dict):
+        """
+        Swaps the cached record for key_val for new_rec, which may have
+        a new key value or sort position.
+        """
+        self._load_dict()
+        old_rec = self.data_dict[key_val]
+        new_list = list(self.data_list)
+        del new_list[self._list_pos(old_rec)]
+        new_list.insert(self._sort_pos(new_list, new_rec), new_rec)
+        new_dict = dict(self.data_dict)
+        del new_dict[key_val]
+        new_key_val = new_rec.get(self.key_fld)
+        if new_key_val is None:
+            raise ValueError(f'Update removes key from {key_val=}')
+        if new_key_val in new_dict:
+            raise ValueError(f'Update duplicates {new_key_val=}')
+        new_dict[new_key_val] = new_rec
+        self.data_list = new_list
+        self._reindex(new_dict, removed=[(key_val, old_rec)],
+                      added=[(new_key_val, new_rec)])
+        self.data_dict = new_dict
+
+    @locked
+    def _remove_from_cache(self, key_vals: list):
+        self._load_dict()
+        removed = []
+        new_dict = dict(self.data_dict)
+        for key_val in key_vals:
+            rec = new_dict.pop(key_val, None)
+            if rec is not None:
+                removed.append((key_val, rec))
+        doomed = {id(rec) for _, rec in removed}
+        self.data_list = [rec for rec in self.data_list
+                          if id(rec) not in doomed]
+        self._reindex(new_dict, removed=removed)
+        self.data_dict = new_dict
+
+    def _key_for_id(self, rec_id):
+        """
+        Finds the key of the cached record with a DB id.
+        """
+        if self.key_fld == OBJ_ID_NM:
+            return rec_id
+        if self.no_id:
+            raise ValueError('Ids are not cached.')
+        for key_val, rec in self._load_dict().items():
+            if str(rec.get(OBJ_ID_NM)) == str(rec_id):
+                return key_val
+        raise ValueError(f'No cached record with {rec_id=}')
+
+    def _write_failed(self):
+        """
+        A write failed part way, so some of it may be in the DB: drop our
+        cache, and tell other processes to drop theirs.
+        """
+        with self.lock:
+            self.write_count += 1
+            self.clear_cache()
+        self._publish_write()
+
+    def _maintain(self, change, *args):
+        """
+        Applies a change to the cache, or clears the cache if we can't.
+        We publish the new version before taking the lock, so readers
+        don't wait on its DB round trips.
+        """
+        versions = self._publish_version()
+        with self.lock:
+            self._install_version(versions)
+            self.write_count += 1
+            if not self._is_cached():
+                return
+            if not self._can_maintain():
+                self.clear_cache()
+                return
+            try:
+                change(*args)
+                self.metrics.local_writes += 1
+            except (KeyError, TypeError, ValueError) as e:
+                print(f'Reloading {self.collect_nm} cache: {e}')
+                self.clear_cache()
+
+    def _cache_add(self, rec: dict, rec_id):
+        cache_rec = self._cache_rec(rec, rec_id)
+        if self.key_fld not in cache_rec:
+            raise ValueError('Key field value not in record')
+        self._add_to_cache(cache_rec)
+
+    def _cache_add_many(self, recs: list, rec_ids: list):
+        """
+        Merges a batch of new records into the cache with a single sort.
+        """
+        cache_recs = [self._cache_rec(rec, rec_id)
+                      for rec, rec_id in zip(recs, rec_ids)]
+        data_dict = self._load_dict()
+        new_dict = dict(data_dict)
+        for rec in cache_recs:
+            key_val = rec.get(self.key_fld)
+            if key_val is None or key_val in new_dict:
+                raise ValueError(f'Cannot add {key_val=} to cache')
+            new_dict[key_val] = rec
+        new_list = self.data_list + cache_recs
+        if self.sort_order != dbc.NO_SORT and self.sort_fld is not None:
+            new_list.sort(key=lambda rec: rec[self.sort_fld],
+                          reverse=(self.sort_order == dbc.DESC))
+        self.data_list = new_list
+        self._reindex(new_dict,
+                      added=[(rec[self.key_fld], rec) for rec in cache_recs])
+        self.data_dict = new_dict
+
+    def _cache_update(self, key_val, update_dict: dict, by_id: bool,
+                      upsert: bool):
+        for fld_nm in update_dict:
+            # dotted names and operators need the DB to interpret them:
+            if '.' in fld_nm or fld_nm.startswith('$'):
+                raise ValueError(f'Cannot apply {fld_nm=} locally')
+        if by_id:
+            key_val = self._key_for_id(key_val)
+        old_rec = self._load_dict().get(key_val)
+        if old_rec is not None:
+            new_rec = dict(old_rec)
+            new_rec.update(deepcopy(update_dict))
+            self._replace_in_cache(key_val, self._project(new_rec))
+        elif upsert and not by_id and self.no_id:
+            new_rec = {self.key_fld: key_val}
+            new_rec.update(deepcopy(update_dict))
+            self._add_to_cache(self._project(new_rec))
+        else:
+            raise ValueError(f'Cannot upsert {key_val=} locally')
+
+    def _cache_delete(self, key_val, by_id: bool):
+        if by_id:
+            key_val = self._key_for_id(key_val)
+        self._remove_from_cache([key_val])
+
+    def _cache_delete_many(self, filters: dict):
+        for fld_nm, val in filters.items():
+            if fld_nm.startswith('$') or isinstance(val, dict):
+                raise ValueError(f'Cannot apply {filters=} locally')
+        doomed = [key_val for key_val, rec in self._load_dict().items()
+                  if all(rec.get(fld_nm) == val
+                         for fld_nm, val in filters.items())]
+        self._remove_from_cache(doomed)
 
     def add(self, rec: dict, clear_cache=True):
         """
         Creates a new record.
         If a record already has the given key_val, raise ValueError.
-        By default we just clear the cache but if it is large we might not
-        want to do that.
+        By default we add the new record to the cache, but if it is large
+        we might not want to do that.
         """
         key_val = rec.get(self.key_fld, None)
         # A little kludgey: If we are using MONGODB, and we want to use the
@@ -197,17 +1127,41 @@ class DataCollection(object):
             raise ValueError(f'Attempt to add an existing {key_val=}')
         ret = dbc.insert_doc(self.db_nm, self.collect_nm, rec)
         if clear_cache:
-            self.clear_cache()
+            self._maintain(self._cache_add, rec, ret)
+        else:
+            self._publish_write()
         return ret
 
-    def add_many(self, recs: list, clear_cache=True):
+    def add_many(self, recs: list, clear_cache=True, ordered=True,
+                 chunk_size=dbc.DEF_CHUNK_SIZE):
         """
         Creates many new records based on a list of record dicts.
-        Returns DB result of the insert.
+        We check every key against the cache (and each other) before
+        inserting, then send the records in batches of `chunk_size`.
+        If a batch fails, the ones before it are still in the DB.
+        Returns the list of inserted IDs.
         """
-        ret = dbc.insert_many(recs)
+        key_vals = set()
+        data_dict = self._load_dict()
+        for rec in recs:
+            key_val = rec.get(self.key_fld, None)
+            if key_val is None:
+                if not DataCollection.is_db_id(self.key_fld):
+                    raise ValueError(f'Key field value not provided: {rec=}')
+                continue
+            if key_val in data_dict or key_val in key_vals:
+                raise ValueError(f'Attempt to add an existing {key_val=}')
+            key_vals.add(key_val)
+        try:
+            ret = dbc.insert_many(self.db_nm, self.collect_nm, recs,
+                                  ordered=ordered, chunk_size=chunk_size)
+        except Exception:
+            self._write_failed()
+            raise
         if clear_cache:
-            self.clear_cache()
+            self._maintain(self._cache_add_many, recs, ret)
+        else:
+            self._publish_write()
         return ret
 
     def update(self,
@@ -227,7 +1181,8 @@ class DataCollection(object):
                              update_dict,
                              upsert=upsert,
                              )
-        self.clear_cache()
+        self._maintain(self._cache_update, key_val, update_dict, by_id,
+                       upsert)
         return dbc.update_success(ret)
 
     def update_fld(self, key_val: str, fld_nm: str, fld_val: str, by_id: bool =
@@ -251,7 +1206,7 @@ class DataCollection(object):
             ret = dbc.del_one(self.db_nm,
                               self.collect_nm,
                               {self.key_fld: key_val})
-        self.clear_cache()
+        self._maintain(self._cache_delete, key_val, by_id)
         return ret
 
     def delete_many(self, filters={}):
@@ -262,13 +1217,263 @@ class DataCollection(object):
         ret = dbc.delete_many(self.db_nm,
                               self.collect_nm,
                               filters)
-        self.clear_cache()
+        self._maintain(self._cache_delete_many, filters)
         return ret
 
     def aggregate(self, pipeline):
         return dbc.aggregate(self.db_nm, self.collect_nm, pipeline)
 
 
+class PagedCollection(DataCollection):
+    """
+    For collections too big to hold in memory.
+    Instead of caching the whole collection, we stream it from the DB,
+    or serve it a page at a time, and keep a bounded LRU cache of
+    recently used records for key lookups.
+    `fetch_list()` returns a generator here. What needs the whole
+    collection at once (`fetch_dict()`, `regex_search()`) reads it from
+    the DB a page at a time on every call, in id order.
+    """
+    def __init__(self, db_nm: str, collect_nm: str,
+                 page_size: int = DEF_PAGE_SIZE,
+                 max_hot_recs: int = DEF_MAX_HOT_RECS,
+                 **kwargs):
+        super().__init__(db_nm, collect_nm, **kwargs)
+        self.page_size = page_size
+        self.max_hot_recs = max_hot_recs
+        # key_val -> rec, least recently used first:
+        self.hot_recs = OrderedDict()
+
+    def __len__(self):
+        return len(self.hot_recs)
+
+    def _pages(self, filters=None):
+        """
+        Yields the (filtered) collection a page at a time.
+        We page by id, not `sort_fld`: ids are never null, and never
+        change under us, so no record is skipped or seen twice.
+        """
+        page_token = None
+        while True:
+            page, page_token = dbc.select_page(
+                self.db_nm, self.collect_nm,
+                filters=filters if filters else {},
+                sort=dbc.ASC,
+                sort_fld=OBJ_ID_NM,
+                page_size=self.page_size,
+                page_token=page_token,
+                no_id=self.no_id,
+                proj=self.proj,
+                exclude_flds=self.exclude_flds)
+            yield page
+            if page_token is None:
+                return
+
+    def _load_list(self, filters=None) -> list:
+        """
+        We aren't held whole, so this reads the whole (filtered) collection
+        every time: prefer fetch_list() or fetch_page() for big ones.
+        """
+        return [rec for page in self._pages(filters) for rec in page]
+
+    def _load_dict(self, filters=None) -> dict:
+        return qry.list_to_dict(self.key_fld, self._load_list(filters))
+
+    def warm_up(self):
+        return 0
+
+    async def warm_up_async(self):
+        return 0
+
+    def refresh(self):
+        self.clear_cache()
+        return 0
+
+    @locked
+    def _remember(self, rec: dict):
+        key_val = rec.get(self.key_fld)
+        if key_val is None:
+            return
+        self.hot_recs[key_val] = rec
+        self.hot_recs.move_to_end(key_val)
+        while len(self.hot_recs) > self.max_hot_recs:
+            self.hot_recs.popitem(last=False)
+
+    @locked
+    def _forget(self, key_val):
+        self.hot_recs.pop(key_val, None)
+
+    def get_metrics(self) -> dict:
+        metrics = self.metrics.to_json()
+        hot_recs = self.hot_recs
+        metrics[NUM_RECS] = len(hot_recs)
+        metrics[APPROX_BYTES] = approx_size(hot_recs)
+        return metrics
+
+    @locked
+    def clear_cache(self):
+        super().clear_cache()
+        self.hot_recs = OrderedDict()
+
+    def _stream(self, filters=None):
+        return dbc.stream(self.db_nm, self.collect_nm,
+                          filters=filters if filters else {},
+                          sort=self.sort_order,
+                          sort_fld=self.sort_fld,
+                          no_id=self.no_id,
+                          proj=self.proj,
+                          exclude_flds=self.exclude_flds,
+                          batch_size=self.page_size)
+
+    def fetch_list(self, filters=None, read_only=None):
+        """
+        A generator over the (filtered) collection, in sort order.
+        """
+        return self._stream(filters)
+
+    def fetch_page(self, page_num: int, page_size: int = None,
+                   filters=None) -> list:
+        """
+        Fetches page `page_num` (counting from 0) of the collection,
+        in sort order.
+        """
+        if page_num < 0:
+            raise ValueError(f'Bad {page_num=}')
+        if page_size is None:
+            page_size = self.page_size
+        page = dbc.select(self.db_nm, self.collect_nm,
+                          filters=filters if filters else {},
+                          sort=self.sort_order,
+                          sort_fld=self.sort_fld,
+                          no_id=self.no_id,
+                          proj=self.proj,
+                          exclude_flds=self.exclude_flds,
+                          skip=page_num * page_size,
+                          limit=page_size)
+        for rec in page:
+            self._remember(rec)
+        return deepcopy(page)
+
+    def fetch_dict(self, filters=None, read_only=None):
+        """
+        What we return is fresh from the DB, so it needs no copying.
+        """
+        data_dict = self._load_dict(filters)
+        if self._use_views(read_only):
+            return DictView(data_dict)
+        return data_dict
+
+    def fetch_by_key(self, key_val: str, read_only=None):
+        """
+        Serve from our hot records if we can, else ask the DB.
+        """
+        with self.lock:
+            rec = self.hot_recs.get(key_val)
+            if rec is not None:
+                self.metrics.hits += 1
+                self.hot_recs.move_to_end(key_val)
+        if rec is None:
+            self.metrics.misses += 1
+            rec = dbc.read_one(self.db_nm, self.collect_nm,
+                               filters={self.key_fld: key_val},
+                               no_id=self.no_id)
+            if rec is None:
+                return None
+            rec = self._project(rec)
+            self._remember(rec)
+        if self._use_views(read_only):
+            return CowRecord(rec)
+        return deepcopy(rec)
+
+    def exists(self, key_val: str):
+        """
+        Our hot records can answer, else the DB does: we don't read the
+        record just to see if it's there.
+        """
+        with self.lock:
+            if key_val in self.hot_recs:
+                self.metrics.hits += 1
+                return True
+        self.metrics.misses += 1
+        return dbc.exists(self.db_nm, self.collect_nm,
+                          filters={self.key_fld: key_val})
+
+    def fetch_keys(self):
+        for rec in self._stream():
+            yield rec.get(self.key_fld)
+
+    def fetch_by_fld_val(self, fld, val, test_membership=False,
+                         read_only=None):
+        """
+        We let the DB do the matching.
+        For list fields, the DBs that have them match members anyway.
+        """
+        matches = qry.list_to_dict(self.key_fld,
+                                   list(self._stream({fld: val})))
+        if self._use_views(read_only):
+            return DictView(matches)
+        return matches
+
+    def regex_search(self, fld_dict: dict, read_only=None):
+        """
+        We search a page at a time, so only the matches are held at once.
+        """
+        engine = qry.SearchEngine()
+        matches = {}
+        for page in self._pages():
+            matches.update(engine.search(fld_dict,
+                                         qry.list_to_dict(self.key_fld,
+                                                          page)))
+        if self._use_views(read_only):
+            return DictView(matches)
+        return matches
+
+    def get_choices(self):
+        return qry.get_choices(self._stream(), self.key_fld, self.sort_fld)
+
+    def add_many(self, recs: list, clear_cache=True, ordered=True,
+                 chunk_size=dbc.DEF_CHUNK_SIZE):
+        """
+        We can't check keys against a cache we don't have: we check the
+        batch itself, and leave the rest to the DB's unique indexes.
+        """
+        key_vals = [rec.get(self.key_fld) for rec in recs
+                    if rec.get(self.key_fld) is not None]
+        if len(key_vals) != len(set(key_vals)):
+            raise ValueError('Duplicate keys in batch.')
+        try:
+            ret = dbc.insert_many(self.db_nm, self.collect_nm, recs,
+                                  ordered=ordered, chunk_size=chunk_size)
+        except Exception:
+            self._write_failed()
+            raise
+        self._publish_write()
+        return ret
+
+    def update(self, key_val: str, update_dict: dict, by_id: bool = False,
+               upsert=False):
+        ret = super().update(key_val, update_dict, by_id=by_id,
+                             upsert=upsert)
+        if by_id:
+            self.hot_recs = OrderedDict()
+        else:
+            self._forget(key_val)
+        return ret
+
+    def delete(self, key_val: str, by_id: bool = False):
+        ret = super().delete(key_val, by_id=by_id)
+        if by_id:
+            self.hot_recs = OrderedDict()
+        else:
+            self._forget(key_val)
+        return ret
+
+    def delete_many(self, filters={}):
+        ret = super().delete_many(filters)
+        self.hot_recs = OrderedDict()
+        return ret
+
+
 def get_cache(cache_nm):
     """
     Provide a functional interface to DataCollection.get_cache.
@@ -283,21 +1488,182 @@ def is_registered(cache_nm):
     return DataCollection.is_registered(cache_nm)
 
 
+def get_metrics(cache_nm=None) -> dict:
+    """
+    Metrics for one cache, or, by default, for every registered cache,
+    by cache name.
+    """
+    if cache_nm is not None:
+        cache = DataCollection.get_cache(cache_nm)
+        if cache is None:
+            raise ValueError(f'No such cache: {cache_nm}')
+        return cache.get_metrics()
+    return {nm: cache.get_metrics()
+            for nm, cache in list(DataCollection.caches.items())}
+
+
+# Caches declared through `needs_cache()`, which may not be created yet:
+# cache_nm -> (db_nm, collect_nm, DataCollection kwargs)
+declared_caches: dict = {}
+# so two threads can't both create the same cache:
+registry_lock = threading.Lock()
+
+
+def declare_cache(cache_nm, db_nm, collect_nm, **kwargs):
+    """
+    Records how to create a cache, without creating it yet.
+    """
+    declared_caches[cache_nm] = (db_nm, collect_nm, kwargs)
+
+
+def create_declared(cache_nm):
+    """
+    Creates a declared cache if it isn't registered yet.
+    Returns the cache.
+    """
+    with registry_lock:
+        if not DataCollection.is_registered(cache_nm):
+            db_nm, collect_nm, kwargs = declared_caches[cache_nm]
+            DataCollection(db_nm, collect_nm, cache_nm=cache_nm, **kwargs)
+    return DataCollection.get_cache(cache_nm)
+
+
 def needs_cache(fn, cache_nm, db_nm, collect_nm,
                 key_fld=CODE, sort_order=dbc.ASC,
-                sort_fld=NAME, no_id=True):
+                sort_fld=NAME, no_id=True, read_only=False,
+                ttl=None, versioned=False, index_flds=None,
+                search_flds=None, proj=None, exclude_flds=None,
+                unique_key=False):
     """
     Should be used to decorate any function that uses data.collection methods.
     """
+    declare_cache(cache_nm, db_nm, collect_nm,
+                  key_fld=key_fld,
+                  sort_order=sort_order,
+                  sort_fld=sort_fld,
+                  no_id=no_id,
+                  read_only=read_only,
+                  ttl=ttl,
+                  versioned=versioned,
+                  index_flds=index_flds,
+                  search_flds=search_flds,
+                  proj=proj,
+                  exclude_flds=exclude_flds,
+                  unique_key=unique_key)
+
     @wraps(fn)
     def wrapper(*args, **kwargs):
         if not DataCollection.is_registered(cache_nm):
-            DataCollection(db_nm,
-                           collect_nm,
-                           cache_nm=cache_nm,
-                           key_fld=key_fld,
-                           sort_order=sort_order,
-                           sort_fld=sort_fld,
-                           no_id=no_id)
+            create_declared(cache_nm)
         return fn(*args, **kwargs)
     return wrapper
+
+
+def _get_caches(cache_nms=None) -> dict:
+    """
+    The named caches (by default, all declared and registered caches),
+    creating any declared ones not created yet.
+    """
+    if cache_nms is None:
+        cache_nms = list(dict.fromkeys(list(declared_caches)
+                                       + list(DataCollection.caches)))
+    caches = {}
+    for cache_nm in cache_nms:
+        if cache_nm in declared_caches:
+            caches[cache_nm] = create_declared(cache_nm)
+        else:
+            caches[cache_nm] = DataCollection.get_cache(cache_nm)
+    return caches
+
+
+def _run_on_caches(action: str, cache_nms=None, max_workers=1) -> dict:
+    """
+    Runs the method named action on each named cache (by default, all
+    declared and registered caches), optionally in a thread pool.
+    Returns a dict of cache name to the action's result, or to the
+    exception it raised: one bad cache shouldn't stop the others.
+    """
+    caches = _get_caches(cache_nms)
+
+    def run(cache):
+        try:
+            return getattr(cache, action)()
+        except Exception as e:
+            print(f'Failed to {action} {cache.cache_nm}: {e}')
+            return e
+
+    if max_workers > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = pool.map(run, caches.values())
+            return dict(zip(caches.keys(), results))
+    return {cache_nm: run(cache) for cache_nm, cache in caches.items()}
+
+
+def warm_up(cache_nms=None, max_workers=1) -> dict:
+    """
+    Loads caches at app startup, so the first requests don't pay for it.
+    Returns a dict of cache name to number of records loaded.
+    """
+    return _run_on_caches('warm_up', cache_nms, max_workers)
+
+
+async def warm_up_async(cache_nms=None) -> dict:
+    """
+    Loads caches concurrently through the async DB API.
+    Returns a dict of cache name to number of records loaded, or to the
+    exception loading raised.
+    """
+    caches = _get_caches(cache_nms)
+    results = await asyncio.gather(*[cache.warm_up_async()
+                                     for cache in caches.values()],
+                                   return_exceptions=True)
+    return dict(zip(caches.keys(), results))
+
+
+def declare_indexes(cache_nms=None):
+    """
+    Declares the indexes our caches need: call at startup, before
+    dbc.init_app() makes them.
+    """
+    _run_on_caches('declare_indexes', cache_nms)
+
+
+def refresh(cache_nms=None, max_workers=1) -> dict:
+    """
+    Reloads caches without ever leaving them cold.
+    """
+    return _run_on_caches('refresh', cache_nms, max_workers)
+
+
+class CacheRefresher(object):
+    """
+    Refreshes caches every `interval` seconds on a background thread.
+    """
+    def __init__(self, interval: float, cache_nms=None, max_workers=1):
+        self.interval = interval
+        self.cache_nms = cache_nms
+        self.max_workers = max_workers
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name='CacheRefresher')
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            refresh(self.cache_nms, self.max_workers)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        self.thread.join(timeout)
+
+
+def start_refresher(interval: float, cache_nms=None,
+                    max_workers=1) -> CacheRefresher:
+    """
+    Starts refreshing caches in the background: call `stop()` on what
+    this returns to stop.
+    """
+    return CacheRefresher(interval, cache_nms, max_workers).start()
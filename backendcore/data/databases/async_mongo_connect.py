@@ -0,0 +1,146 @@
+"""
+This is the asyncio interface to MongoDB.
+It needs the motor driver, which is optional: `pip install motor`.
+It shares its settings and helpers with mongo_connect.
+"""
+import os
+import threading
+
+import certifi
+
+try:
+    import motor.motor_asyncio as motor
+except ImportError:
+    motor = None
+
+import backendcore.data.databases.mongo_connect as mdb
+
+from backendcore.common.constants import OBJ_ID_NM
+
+# The client holds the connection pool, so there is one per process,
+# shared by every AsyncMongoDB object.
+client = None
+client_lock = threading.Lock()
+client_local = True
+
+
+def drop_client():
+    """
+    Forgets the client: a forked child can't use its parent's sockets.
+    """
+    global client
+    client = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=drop_client)
+
+
+def get_client():
+    global client
+    if client is None:
+        with client_lock:
+            if client is None:
+                if client_local:
+                    print("Connecting to Mongo locally (async).")
+                    client = motor.AsyncIOMotorClient(
+                        **mdb.get_pool_settings(only_set=True))
+                else:
+                    print("Connecting to Mongo remotely (async).")
+                    client = motor.AsyncIOMotorClient(
+                        mdb.remote_conn_str(),
+                        tlsCAFile=certifi.where(),
+                        **mdb.MongoDB._get_server_settings())
+    return client
+
+
+class AsyncMongoDB():
+    """
+    Encapsulates an asyncio connection to MongoDB.
+    Its methods match MongoDB's, but are coroutines.
+    """
+    def __init__(self, local_db=True):
+        if motor is None:
+            raise ImportError('Async MongoDB needs motor: '
+                              + 'pip install motor')
+        global client_local
+        client_local = local_db
+        self.client = get_client()
+
+    @staticmethod
+    def is_valid_id(rec_id):
+        return mdb.is_valid_id(rec_id)
+
+    async def read_one(self, db_nm, clct_nm, filters={}, no_id=False):
+        """
+        Fetch one record that meets filters.
+        """
+        rec = await get_client()[db_nm][clct_nm].find_one(filters)
+        return mdb.to_rec(rec, no_id)
+
+    async def exists(self, db_nm, clct_nm, filters={}) -> bool:
+        return await get_client()[db_nm][clct_nm].find_one(
+            filters, projection={mdb.DB_ID: 1}) is not None
+
+    async def count_documents(self, db_nm, clct_nm, filters={}) -> int:
+        return await get_client()[db_nm][clct_nm].count_documents(filters)
+
+    async def read(self, db_nm: str, clct_nm: str, sort: int = mdb.NO_SORT,
+                   sort_fld: str = OBJ_ID_NM, no_id: bool = False,
+                   limit: int = None, filters: dict = {},
+                   proj: list = mdb.NO_PROJ,
+                   exclude_flds: list = None, skip: int = 0) -> list:
+        """
+        Returns all docs from a collection.
+        """
+        scond = mdb._asmbl_sort_cond(sort=sort, sort_fld=sort_fld)
+        doc_limit = limit if limit else mdb.DOC_LIMIT
+        projection = mdb._asmbl_proj(proj, exclude_flds, no_id)
+        cursor = get_client()[db_nm][clct_nm].find(filters, sort=scond,
+                                                   projection=projection)
+        return [mdb.to_rec(doc, no_id)
+                async for doc in cursor.skip(skip).limit(doc_limit)]
+
+    async def select(self, db_nm, clct_nm, filters={}, sort=mdb.NO_SORT,
+                     sort_fld='_id', proj=mdb.NO_PROJ, limit=mdb.DOC_LIMIT,
+                     no_id=False, exclude_flds=None, skip=0):
+        """
+        Select records from a collection matching filters.
+        """
+        return await self.read(db_nm, clct_nm, sort=sort, sort_fld=sort_fld,
+                               no_id=no_id, limit=limit, filters=filters,
+                               proj=proj, exclude_flds=exclude_flds,
+                               skip=skip)
+
+    async def create(self, db_nm: str, clct_nm: str, doc: dict,
+                     with_date=False):
+        """
+        Returns the str() of the inserted ID.
+        """
+        if with_date:
+            print('with_date format is not supported at present time')
+        ret = await get_client()[db_nm][clct_nm].insert_one(doc)
+        return str(ret.inserted_id)
+
+    async def update(self, db_nm, clct_nm, filters, update_dict,
+                     upsert=False):
+        ret = await get_client()[db_nm][clct_nm].update_one(
+            filters,
+            {mdb.SET: update_dict},
+            upsert=upsert)
+        return mdb.create_update_ret(ret)
+
+    async def delete(self, db_nm, clct_nm, filters={}):
+        """
+        Delete one record that meets filters.
+        """
+        ret = await get_client()[db_nm][clct_nm].delete_one(filters)
+        return mdb.create_del_ret(ret)
+
+    async def aggregate(self, db_nm, clct_nm, pipeline) -> list:
+        """
+        Unlike MongoDB.aggregate(), this returns the results, not a cursor.
+        """
+        cursor = get_client()[db_nm][clct_nm].aggregate(pipeline,
+                                                        allowDiskUse=True)
+        return [doc async for doc in cursor]
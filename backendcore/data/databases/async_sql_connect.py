@@ -0,0 +1,214 @@
+"""
+This is the asyncio interface to SQL databases.
+It needs SQLAlchemy's asyncio extra and an async driver, which are
+optional: `pip install sqlalchemy[asyncio] aiosqlite`.
+SqlDB still builds our statements and owns the schema: creating tables
+and columns is rare, so that stays synchronous. Reading and writing
+data runs on an async engine over the same DB.
+"""
+import threading
+
+import sqlalchemy as sqla
+
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine
+    import aiosqlite  # noqa F401
+except ImportError:
+    create_async_engine = None
+
+import backendcore.data.databases.common as cmn
+import backendcore.data.databases.sql_connect as sdb
+
+from backendcore.common.constants import OBJ_ID_NM
+
+ASYNC_SQLITE_BASE = 'sqlite+aiosqlite:///'
+
+ASYNC_DB_TABLE = {
+    sdb.SQLITE_MEM: ASYNC_SQLITE_BASE + sdb.SQLITE_MEM_URI,
+    sdb.SQLITE: ASYNC_SQLITE_BASE + sdb.db_loc + '/' + sdb.db_nm,
+}
+
+async_engine = None
+engine_lock = threading.Lock()
+
+
+def get_engine(variant):
+    global async_engine
+    if async_engine is None:
+        with engine_lock:
+            if async_engine is None:
+                in_mem = variant == sdb.SQLITE_MEM
+                # our SqlDB keeps the in-memory DB alive for us:
+                async_engine = create_async_engine(ASYNC_DB_TABLE[variant],
+                                                   echo=False)
+                sdb.set_pragmas(async_engine.sync_engine,
+                                sdb.get_sqlite_pragmas(in_mem))
+    return async_engine
+
+
+async def execute_upsert(conn, stmt):
+    """
+    As sdb.execute_upsert().
+    """
+    try:
+        return await conn.execute(stmt)
+    except sqla.exc.OperationalError as e:
+        if not sdb.is_stale_schema(e):
+            raise
+        (await conn.exec_driver_sql(sdb.SCHEMA_READ)).all()
+        return await conn.execute(stmt)
+
+
+class AsyncSqlDB():
+    """
+    Encapsulates an asyncio connection to a SQL Server.
+    Its methods match SqlDB's, but are coroutines.
+    """
+    def __init__(self, variant=sdb.SQLITE):
+        if create_async_engine is None:
+            raise ImportError('Async SQL needs aiosqlite: '
+                              + 'pip install sqlalchemy[asyncio] aiosqlite')
+        self.sync_db = sdb.SqlDB(variant=variant)
+        if self.sync_db.variant not in ASYNC_DB_TABLE:
+            raise ValueError(f'No async support for {self.sync_db.variant}')
+        self.engine = get_engine(self.sync_db.variant)
+
+    async def read(self, db_nm: str, clct_nm: str, filters: dict = {},
+                   sort: int = sdb.NO_SORT, sort_fld: str = OBJ_ID_NM,
+                   no_id: bool = False, limit: int = None,
+                   proj: list = sdb.NO_PROJ,
+                   exclude_flds: list = None, skip: int = 0) -> list:
+        """
+        Returns all docs from a collection.
+        """
+        clct = self.sync_db.get_collect(clct_nm)
+        if clct is None:
+            return []
+        stmt, params = self.sync_db._read_stmt(clct, filters, sort,
+                                               sort_fld, limit, proj,
+                                               exclude_flds, no_id, skip)
+        async with self.engine.connect() as conn:
+            res = await conn.execute(stmt, params)
+            all_docs = self.sync_db._read_recs_to_objs(res)
+        if no_id:
+            for rec in all_docs:
+                self.sync_db._id_handler(rec, no_id)
+        return all_docs
+
+    async def read_one(self, db_nm, clct_nm, filters={}, no_id=False):
+        res = await self.read(db_nm, clct_nm, filters=filters, no_id=no_id)
+        if len(res):
+            return res.pop()
+        return None
+
+    async def count_documents(self, db_nm, clct_nm, filters={}) -> int:
+        clct = self.sync_db.get_collect(clct_nm)
+        if clct is None:
+            return 0
+        stmt = sqla.select(sqla.func.count()).select_from(clct)
+        stmt = self.sync_db._filter_to_where(clct, stmt, filters)
+        async with self.engine.connect() as conn:
+            return (await conn.execute(stmt)).scalar()
+
+    async def exists(self, db_nm, clct_nm, filters={}) -> bool:
+        clct = self.sync_db.get_collect(clct_nm)
+        if clct is None:
+            return False
+        stmt = sqla.select(clct.c[OBJ_ID_NM])
+        stmt = self.sync_db._filter_to_where(clct, stmt, filters)
+        async with self.engine.connect() as conn:
+            res = await conn.execute(sqla.select(stmt.exists()))
+            return bool(res.scalar())
+
+    async def select(self, db_nm, clct_nm, filters={}, sort=sdb.NO_SORT,
+                     sort_fld='_id', proj=sdb.NO_PROJ, limit=sdb.DOC_LIMIT,
+                     no_id=False, exclude_flds=None, skip=0):
+        """
+        Select records from a collection matching filters.
+        """
+        return await self.read(db_nm, clct_nm, filters=filters, sort=sort,
+                               sort_fld=sort_fld, no_id=no_id, limit=limit,
+                               proj=proj, exclude_flds=exclude_flds,
+                               skip=skip)
+
+    async def create(self, db_nm: str, clct_nm: str, doc, with_date=False):
+        """
+        Enter a document or set of documents into a table.
+        """
+        if with_date:
+            raise NotImplementedError(
+                'with_date format is not supported at present time')
+        doc = self.sync_db.add_ids(doc)
+        collect = self.sync_db.get_collect(clct_nm, doc=doc,
+                                           create_if_none=True)
+        self.sync_db._add_cols(collect,
+                               [doc] if isinstance(doc, dict) else doc)
+        async with self.engine.begin() as conn:
+            await conn.execute(sqla.insert(collect), doc)
+        if isinstance(doc, dict):
+            return doc[OBJ_ID_NM]
+        return doc[0][OBJ_ID_NM]
+
+    async def update(self, db_nm: str, clct_nm: str, filters: dict,
+                     update_dict: dict, upsert: bool = False):
+        if upsert:
+            await self.upsert(db_nm, clct_nm, filters, update_dict)
+            return cmn.UpdateReturn(1, 1)
+        collect = self.sync_db.get_collect(clct_nm)
+        if collect is None:
+            raise ValueError(f'Cannot update; {clct_nm} does not exist.')
+        stmt = self.sync_db._filter_to_where(collect, sqla.update(collect),
+                                             filters, update_dict)
+        async with self.engine.begin() as conn:
+            res = await conn.execute(stmt)
+        return sdb.create_update_ret(res)
+
+    async def upsert(self, db_nm, clct_nm, filters, update_dict):
+        """
+        Updates a record if it exists, otherwise creates it.
+        Returns its id.
+        As SqlDB.upsert(): in one statement if we can.
+        """
+        collect = self.sync_db.get_collect(clct_nm)
+        key_flds = None
+        if collect is not None:
+            key_flds = self.sync_db._upsert_key(collect, filters,
+                                                update_dict)
+        if key_flds is None:
+            return await self._upsert_by_read(db_nm, clct_nm, filters,
+                                              update_dict)
+        row = self.sync_db.add_ids({**filters, **update_dict})
+        stmt, returning = self.sync_db._upsert_stmt(collect, [row], key_flds,
+                                                    list(update_dict))
+        async with self.engine.begin() as conn:
+            res = await execute_upsert(conn, stmt)
+            if returning:
+                return res.scalar_one()
+        if OBJ_ID_NM in key_flds:
+            return row[OBJ_ID_NM]
+        rec = await self.read_one(db_nm, clct_nm, filters=filters)
+        return rec[OBJ_ID_NM]
+
+    async def _upsert_by_read(self, db_nm, clct_nm, filters, update_dict):
+        read_filters = filters
+        if update_dict.get(OBJ_ID_NM):
+            read_filters = {OBJ_ID_NM: update_dict[OBJ_ID_NM]}
+        readres = await self.read_one(db_nm, clct_nm, filters=read_filters)
+        if not readres:
+            return await self.create(db_nm, clct_nm,
+                                     {**filters, **update_dict})
+        await self.update(db_nm, clct_nm, filters, update_dict)
+        return readres[OBJ_ID_NM]
+
+    async def delete(self, db_nm, clct_nm, filters={}):
+        """
+        Deletes documents matching the filters.
+        """
+        collect = self.sync_db.get_collect(clct_nm)
+        if collect is None:
+            raise ValueError(f'Cannot delete; {clct_nm} does not exist.')
+        stmt = self.sync_db._filter_to_where(collect, sqla.delete(collect),
+                                             filters)
+        async with self.engine.begin() as conn:
+            res = await conn.execute(stmt)
+        return sdb.create_del_ret(res)
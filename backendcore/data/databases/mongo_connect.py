@@ -1,19 +1,24 @@
 """
 This is the interface to MongoDB.
 """
+import datetime
+import math
 import os
 import json
+import threading
 
 import certifi
 
 import pymongo as pm
 from pymongo.server_api import ServerApi
+from pymongo.errors import ConnectionFailure
 from pymongo.errors import ServerSelectionTimeoutError as MongoConnectError # noqa F401
 
 from bson.objectid import ObjectId
 import bson.json_util as bsutil
 
 import backendcore.data.databases.common as cmn
+import backendcore.env.env_utils as envu
 
 from backendcore.common.constants import OBJ_ID_NM
 
@@ -30,6 +35,7 @@ LTE = '$lte'
 PULL = '$pull'
 PUSH = '$push'
 SET = '$set'
+SET_ON_INSERT = '$setOnInsert'
 
 DATE_KEY = '$date'
 
@@ -51,6 +57,8 @@ USER_DB = 'userDB'
 TEST_PREFIX = 'test_'
 
 DOC_LIMIT = 100000
+# How many docs a streaming read fetches per round trip:
+DEF_BATCH_SIZE = 1000
 
 # parameter names of mongo client settings
 SERVER_API_PARAM = 'server_api'
@@ -58,16 +66,30 @@ CONN_TIMEOUT = 'connectTimeoutMS'
 SOCK_TIMEOUT = 'socketTimeoutMS'
 CONNECT = 'connect'
 MAX_POOL_SIZE = 'maxPoolSize'
+MIN_POOL_SIZE = 'minPoolSize'
+MAX_IDLE_TIME = 'maxIdleTimeMS'
+WAIT_QUEUE_TIMEOUT = 'waitQueueTimeoutMS'
+
+DEF_CONN_TIMEOUT = 30000
+DEF_MAX_POOL_SIZE = 100  # pymongo's own default
+DEF_MIN_POOL_SIZE = 0
 
 # Recommended Python Anywhere settings.
-# We will use them eveywhere for now, until we determine some
-# other site needs different settings.
-PA_MONGO = os.getenv('PA_MONGO', True)
-PA_SETTINGS = {
-    CONN_TIMEOUT: os.getenv('MONGO_CONN_TIMEOUT', 30000),
-    SOCK_TIMEOUT: os.getenv('MONGO_SOCK_TIMEOUT', None),
-    CONNECT: os.getenv('MONGO_CONNECT', False),
-    MAX_POOL_SIZE: os.getenv('MONGO_MAX_POOL_SIZE', 1),
+# Python Anywhere workers are single-threaded, so one socket each is
+# enough there: turn PA_MONGO on for it. Anywhere else, leave it off and
+# size the pool to the worker's threads.
+PA_MONGO = envu.is_flag_on('PA_MONGO')
+PA_MAX_POOL_SIZE = 1
+
+# The env var for each setting:
+SETTINGS_ENV = {
+    CONN_TIMEOUT: 'MONGO_CONN_TIMEOUT',
+    SOCK_TIMEOUT: 'MONGO_SOCK_TIMEOUT',
+    CONNECT: 'MONGO_CONNECT',
+    MAX_POOL_SIZE: 'MONGO_MAX_POOL_SIZE',
+    MIN_POOL_SIZE: 'MONGO_MIN_POOL_SIZE',
+    MAX_IDLE_TIME: 'MONGO_MAX_IDLE_TIME_MS',
+    WAIT_QUEUE_TIMEOUT: 'MONGO_WAIT_QUEUE_TIMEOUT_MS',
 }
 
 MONGO_ID_NM = '_id'
@@ -87,15 +109,97 @@ FAILURE = -1
 # DB messages:
 DUP = "Can't add duplicate"
 
-# For now, client is a global singleton.
-# Maybe one day we will need a... client per thread? I dunno.
+# Errors worth retrying: the DB may answer next time.
+# (These include timeouts and failing to find a server.)
+TRANSIENT_ERRORS = (ConnectionFailure, )
+
+
+def get_pool_settings(only_set: bool = False) -> dict:
+    """
+    Connection and pool settings, from the env.
+    Unset timeouts are None: wait forever.
+    With `only_set`, we leave out what the env doesn't set (PA_MONGO
+    sets the max pool size), so pymongo uses its own defaults for those.
+    """
+    def_max_pool_size = PA_MAX_POOL_SIZE if PA_MONGO else DEF_MAX_POOL_SIZE
+    settings = {
+        CONN_TIMEOUT: envu.get_int(SETTINGS_ENV[CONN_TIMEOUT],
+                                   DEF_CONN_TIMEOUT),
+        SOCK_TIMEOUT: envu.get_int(SETTINGS_ENV[SOCK_TIMEOUT]),
+        CONNECT: envu.is_flag_on(SETTINGS_ENV[CONNECT]),
+        MAX_POOL_SIZE: envu.get_int(SETTINGS_ENV[MAX_POOL_SIZE],
+                                    def_max_pool_size),
+        MIN_POOL_SIZE: envu.get_int(SETTINGS_ENV[MIN_POOL_SIZE],
+                                    DEF_MIN_POOL_SIZE),
+        MAX_IDLE_TIME: envu.get_int(SETTINGS_ENV[MAX_IDLE_TIME]),
+        WAIT_QUEUE_TIMEOUT: envu.get_int(SETTINGS_ENV[WAIT_QUEUE_TIMEOUT]),
+    }
+    if settings[MIN_POOL_SIZE] > settings[MAX_POOL_SIZE] > 0:
+        raise ValueError(f'{MIN_POOL_SIZE} is more than {MAX_POOL_SIZE}: '
+                         + f'{settings}')
+    if only_set:
+        settings = {setting: val for setting, val in settings.items()
+                    if os.getenv(SETTINGS_ENV[setting], '') != ''
+                    or (setting == MAX_POOL_SIZE and PA_MONGO)}
+    return settings
+
+
+def remote_conn_str() -> str:
+    return (f"{cloud_mdb}://{user_nm}:{passwd}@{cloud_svc}/{API_DB}?"
+            + "retryWrites=false")
+
+
+# The client is thread-safe and holds the connection pool, so there is
+# one per process, shared by every MongoDB object.
 client = None
+client_lock = threading.Lock()
+# so we can re-create the client the same way:
+client_local = True
+
+
+def drop_client():
+    """
+    Forgets the client, so the next use makes a new one.
+    A forked child must do this: it can't use its parent's sockets.
+    """
+    global client
+    client = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=drop_client)
+
+
+def get_client():
+    """
+    The client, created if we don't have one (yet, or since a fork).
+    """
+    if client is None:
+        return MongoDB._connectDB(local_db=client_local)
+    return client
 
 
 def create_del_ret(mongo_ret):
     return cmn.DeleteReturn(mongo_ret.deleted_count)
 
 
+def _asmbl_upsert(doc: dict, key_flds: list) -> dict:
+    """
+    The update for upserting doc.
+    We can't $set an existing doc's _id, even to the same value, so a
+    doc's _id only goes in if we insert it.
+    """
+    rest = {fld_nm: val for fld_nm, val in doc.items() if fld_nm != DB_ID}
+    if not rest:
+        # an update must change something: the key is safe to set
+        rest = {fld_nm: doc.get(fld_nm) for fld_nm in key_flds
+                if fld_nm != DB_ID}
+    update = {SET: rest} if rest else {}
+    if DB_ID in doc and DB_ID not in key_flds:
+        update[SET_ON_INSERT] = {DB_ID: doc[DB_ID]}
+    return update
+
+
 def create_update_ret(mongo_ret):
     return cmn.UpdateReturn(mongo_ret.modified_count,
                             mongo_ret.matched_count)
@@ -105,11 +209,66 @@ def is_valid_id(rec_id: str):
     return isinstance(rec_id, str) and (len(rec_id) == DB_ID_LEN)
 
 
+# Types that are already JSON-safe:
+JSON_TYPES = (str, bool, type(None))
+
+
+def to_native(val):
+    """
+    Converts a BSON value to what a trip through JSON would give us
+    (ObjectIds become {"$oid": ...}, dates {"$date": ...}, etc.) in one
+    pass, without writing and re-parsing a string.
+    Rare types take the slow route, so they come out exactly the same.
+    """
+    if isinstance(val, JSON_TYPES):
+        return val
+    if isinstance(val, dict):
+        return {fld_nm: to_native(fld_val) for fld_nm, fld_val in val.items()}
+    if isinstance(val, (list, tuple)):
+        return [to_native(item) for item in val]
+    if isinstance(val, int):
+        return int(val)  # Int64 is an int subclass
+    if isinstance(val, float) and math.isfinite(val):
+        return val
+    if isinstance(val, ObjectId):
+        return {INNER_DB_ID: str(val)}
+    if isinstance(val, datetime.datetime):
+        return bsutil.default(val)
+    return json.loads(bsutil.dumps(val))
+
+
+def from_native(val):
+    """
+    The inverse of to_native(): {"$date": ...} back to a date, and so on.
+    """
+    return bsutil.loads(json.dumps(val))
+
+
 def to_json(doc):
     """
     Turn doc to json.
     """
-    return json.loads(bsutil.dumps(doc))
+    return to_native(doc)
+
+
+def to_rec(doc, no_id=False):
+    """
+    Turns a doc into the record our reads return: to_json() plus
+    _id_handler(), but we don't convert an _id only to drop or unwrap it.
+    """
+    if doc is None:
+        return None
+    rec = {}
+    for fld_nm, fld_val in doc.items():
+        if fld_nm != DB_ID:
+            rec[fld_nm] = to_native(fld_val)
+        elif not no_id:
+            if isinstance(fld_val, ObjectId):
+                rec[DB_ID] = str(fld_val)
+            else:
+                rec[DB_ID] = to_native(fld_val)
+                _id_handler(rec, no_id)
+    return rec
 
 
 def get_collect(db_nm, clct_nm):
@@ -121,7 +280,7 @@ def get_collect(db_nm, clct_nm):
         raise ValueError(f'Bad db name: {db_nm}')
     if not isinstance(clct_nm, str) or not len(clct_nm):
         raise ValueError(f'Bad collection name: {clct_nm}')
-    return client[db_nm][clct_nm]
+    return get_client()[db_nm][clct_nm]
 
 
 def _id_handler(rec, no_id):
@@ -135,6 +294,27 @@ def _id_handler(rec, no_id):
     return rec
 
 
+def _asmbl_proj(proj=NO_PROJ, exclude_flds=None, no_id=False):
+    """
+    Builds a Mongo projection from fields to include (`proj`) and fields
+    to exclude. Mongo can't mix the two, so given both we include `proj`
+    less `exclude_flds`.
+    Returns None for "all fields".
+    """
+    exclude_flds = exclude_flds if exclude_flds else []
+    if proj:
+        projection = {fld_nm: 1 for fld_nm in proj
+                      if fld_nm not in exclude_flds}
+        if not projection:
+            # an empty projection would mean all fields!
+            projection[DB_ID] = 1
+    else:
+        projection = {fld_nm: 0 for fld_nm in exclude_flds}
+    if no_id:
+        projection[DB_ID] = 0
+    return projection if projection else None
+
+
 def _asmbl_sort_cond(sort=NO_SORT, sort_fld='_id'):
     sort_cond = []
     if sort != NO_SORT:
@@ -142,25 +322,46 @@ def _asmbl_sort_cond(sort=NO_SORT, sort_fld='_id'):
     return sort_cond
 
 
+def _asmbl_after_filter(sort, sort_fld, after):
+    """
+    A filter for the records that sort after `after`, a (sort value, id)
+    pair taken from a record we have read.
+    Null (or missing) sorts lowest, but `$gt: null` matches nothing, so
+    nulls need their own branches.
+    """
+    sort_val, _id = after
+    if is_valid_id(_id):
+        _id = ObjectId(_id)
+    past = '$lt' if sort == DESC else '$gt'
+    if sort_fld == DB_ID:
+        return {DB_ID: {past: _id}}
+    if sort_val is None:
+        after_nulls = {sort_fld: None, DB_ID: {past: _id}}
+        if sort == DESC:
+            return after_nulls
+        return {'$or': [after_nulls, {sort_fld: {'$ne': None}}]}
+    sort_val = from_native(sort_val)
+    conds = [{sort_fld: {past: sort_val}},
+             {sort_fld: sort_val, DB_ID: {past: _id}}]
+    if sort == DESC:
+        conds.append({sort_fld: None})
+    return {'$or': conds}
+
+
 class MongoDB():
     """
     Encaspulates a connection to MongoDB.
     """
-    def _get_server_settings(self):
-        settings = {
-            "connectTimeoutMS": 15000,
-            "socketTimeoutMS": None,
-            "connect": False,
-            "maxPoolsize": 1,
-        }
+    @staticmethod
+    def _get_server_settings():
+        settings = get_pool_settings()
         SERVER_API = os.getenv("MONGO_SERVER_API")
         if SERVER_API:
             settings[SERVER_API_PARAM] = ServerApi(SERVER_API)
-        if PA_MONGO:
-            settings.update(PA_SETTINGS)
         return settings
 
-    def _connectDB(self, local_db=True):
+    @staticmethod
+    def _connectDB(local_db=True):
         """
         This provides a uniform way to connect to the DB across all uses.
         Returns a mongo client object... maybe we shouldn't?
@@ -168,22 +369,23 @@ class MongoDB():
         We should probably either return a client OR set a
         client global.
         """
-        global client
-        if client is None:  # not connected yet!
-            print("Setting client because it is None.")
-            if local_db:
-                print("Connecting to Mongo locally.")
-                client = pm.MongoClient()
-            else:
-                print("Connecting to Mongo remotely.")
-                settings = self._get_server_settings()
-                # some of the below params are just Mongo default:
-                # we don't know what they mean!
-                client = pm.MongoClient(f"{cloud_mdb}://{user_nm}:{passwd}@"
-                                        + f"{cloud_svc}/{API_DB}?"
-                                        + "retryWrites=false",
-                                        tlsCAFile=certifi.where(),
-                                        **settings)
+        global client, client_local
+        with client_lock:
+            client_local = local_db
+            if client is None:  # not connected yet!
+                print("Setting client because it is None.")
+                if local_db:
+                    print("Connecting to Mongo locally.")
+                    client = pm.MongoClient(
+                        **get_pool_settings(only_set=True))
+                else:
+                    print("Connecting to Mongo remotely.")
+                    settings = MongoDB._get_server_settings()
+                    # some of the below params are just Mongo default:
+                    # we don't know what they mean!
+                    client = pm.MongoClient(remote_conn_str(),
+                                            tlsCAFile=certifi.where(),
+                                            **settings)
         return client
 
     @staticmethod
@@ -204,10 +406,16 @@ class MongoDB():
         """
         Fetch one record that meets filters.
         """
-        rec = client[db_nm][clct_nm].find_one(filters)
-        rec = to_json(rec)
-        rec = _id_handler(rec, no_id)
-        return rec
+        rec = get_client()[db_nm][clct_nm].find_one(filters)
+        return to_rec(rec, no_id)
+
+    def exists(self, db_nm, clct_nm, filters={}) -> bool:
+        """
+        Does any doc meet filters?
+        We only ask for the _id, so the server sends no doc body.
+        """
+        return get_client()[db_nm][clct_nm].find_one(
+            filters, projection={DB_ID: 1}) is not None
 
     def time_str_from_rec(self, date_rec: dict):
         return date_rec.get(DATE_KEY)
@@ -233,23 +441,21 @@ class MongoDB():
         We convert the passed in string to an ID for our user.
         """
         filter = self.create_id_filter(_id)
-        ret = client[db_nm][clct_nm].find_one(filter)
-        rec = to_json(ret)
-        rec = _id_handler(rec, no_id)
-        return rec
+        ret = get_client()[db_nm][clct_nm].find_one(filter)
+        return to_rec(ret, no_id)
 
     def delete(self, db_nm, clct_nm, filters={}):
         """
         Delete one record that meets filters.
         """
-        mongo_del_obj = client[db_nm][clct_nm].delete_one(filters)
+        mongo_del_obj = get_client()[db_nm][clct_nm].delete_one(filters)
         return create_del_ret(mongo_del_obj)
 
     def delete_many(self, db_nm, clct_nm, filters={}):
         """
         Delete many records that meet filters.
         """
-        mongo_del_obj = client[db_nm][clct_nm].delete_many(filters)
+        mongo_del_obj = get_client()[db_nm][clct_nm].delete_many(filters)
         return create_del_ret(mongo_del_obj)
 
     def delete_by_id(self, db_nm, clct_nm, _id: str):
@@ -258,7 +464,7 @@ class MongoDB():
         We convert the passed in string to an ID for our user.
         """
         filter = self.create_id_filter(_id)
-        mongo_del_obj = client[db_nm][clct_nm].delete_one(filter)
+        mongo_del_obj = get_client()[db_nm][clct_nm].delete_one(filter)
         return create_del_ret(mongo_del_obj)
 
     def read(
@@ -269,56 +475,116 @@ class MongoDB():
         sort_fld: str = OBJ_ID_NM,
         no_id: bool = False,
         limit: int = None,
-        filters: dict = {}
+        filters: dict = {},
+        proj: list = NO_PROJ,
+        exclude_flds: list = None,
     ) -> list:
         """
         Returns all docs from a collection.
         `sort` can be DESC, NO_SORT, or ASC.
+        `proj` lists the only fields to read; `exclude_flds` fields not
+        to read.
         """
         all_docs = []
         scond = _asmbl_sort_cond(sort=sort, sort_fld=sort_fld)
         doc_limit = limit if limit else DOC_LIMIT
-        for doc in client[db_nm][clct_nm].find(
+        for doc in get_client()[db_nm][clct_nm].find(
             filters,
-            sort=scond
+            sort=scond,
+            projection=_asmbl_proj(proj, exclude_flds, no_id),
         ).limit(doc_limit):
-            rec = to_json(doc)
-            rec = _id_handler(rec, no_id)
-            all_docs.append(rec)
+            all_docs.append(to_rec(doc, no_id))
         return all_docs
 
     def select_cursor(self, db_nm, clct_nm, filters={}, sort=NO_SORT,
-                      sort_fld='_id', proj=NO_PROJ, limit=MAX_DB_INT):
+                      sort_fld='_id', proj=NO_PROJ, limit=MAX_DB_INT,
+                      skip=0, exclude_flds=None):
         """
         A select that directly returns the mongo cursor.
         """
         sort_cond = _asmbl_sort_cond(sort=sort, sort_fld=sort_fld)
-        return client[db_nm][clct_nm].find(filters, sort=sort_cond,
-                                           projection=proj).limit(limit)
+        projection = _asmbl_proj(proj, exclude_flds)
+        cursor = get_client()[db_nm][clct_nm].find(filters,
+                                                   sort=sort_cond,
+                                                   projection=projection)
+        if skip:
+            cursor = cursor.skip(skip)
+        return cursor.limit(limit)
+
+    def doc_to_rec(self, doc, no_id=False) -> dict:
+        """
+        Turns a doc from a cursor into the record our reads return.
+        """
+        return to_rec(doc, no_id)
+
+    def stream(self, db_nm, clct_nm, filters={}, sort=NO_SORT,
+               sort_fld='_id', no_id=False, proj=NO_PROJ, exclude_flds=None,
+               batch_size=DEF_BATCH_SIZE):
+        """
+        A generator over the matching records.
+        The server sends them `batch_size` at a time, and we convert each
+        as we go, so we never hold more than a batch.
+        """
+        sort_cond = _asmbl_sort_cond(sort=sort, sort_fld=sort_fld)
+        projection = _asmbl_proj(proj, exclude_flds, no_id)
+        cursor = get_client()[db_nm][clct_nm].find(filters,
+                                                   sort=sort_cond,
+                                                   projection=projection)
+        for doc in cursor.batch_size(batch_size):
+            yield to_rec(doc, no_id)
 
     def select(self, db_nm, clct_nm, filters={}, sort=NO_SORT, sort_fld='_id',
-               proj=NO_PROJ, limit=DOC_LIMIT, no_id=False, exclude_flds=None):
+               proj=NO_PROJ, limit=DOC_LIMIT, no_id=False, exclude_flds=None,
+               skip=0):
         """
         Select records from a collection matching filters.
         """
-        selected_docs = []
-        cursor = self.select_cursor(db_nm, clct_nm,
-                                    filters=filters, sort=sort,
-                                    proj=proj, limit=limit)
-        for doc in cursor:
-            rec = to_json(doc)
-            rec = _id_handler(rec, no_id)
-            if exclude_flds:
-                for fld_nm in exclude_flds:
-                    del rec[fld_nm]
-            selected_docs.append(rec)
-        return selected_docs
+        sort_cond = _asmbl_sort_cond(sort=sort, sort_fld=sort_fld)
+        cursor = get_client()[db_nm][clct_nm].find(
+            filters,
+            sort=sort_cond,
+            projection=_asmbl_proj(proj, exclude_flds, no_id),
+        ).skip(skip).limit(limit)
+        return [to_rec(doc, no_id) for doc in cursor]
+
+    def select_page(self, db_nm, clct_nm, filters={}, sort=ASC,
+                    sort_fld=DB_ID, page_size=DOC_LIMIT, after=None,
+                    proj=NO_PROJ, exclude_flds=None):
+        """
+        Keyset (seek) pagination: reads the `page_size` records that
+        sort after `after`, the (sort value, id) of the last record of
+        the previous page.
+        We sort on the id too, so ties on `sort_fld` still page in a
+        fixed order.
+        Unlike skip(), the server can walk the index straight to the page.
+        """
+        sort = DESC if sort == DESC else ASC
+        sort_cond = _asmbl_sort_cond(sort=sort, sort_fld=sort_fld)
+        if sort_fld != DB_ID:
+            sort_cond.append((DB_ID, sort))
+        if after is not None:
+            after_filter = _asmbl_after_filter(sort, sort_fld, after)
+            filters = ({'$and': [filters, after_filter]} if filters
+                       else after_filter)
+        cursor = get_client()[db_nm][clct_nm].find(
+            filters,
+            sort=sort_cond,
+            projection=_asmbl_proj(proj, exclude_flds, False),
+        ).limit(page_size)
+        return [to_rec(doc) for doc in cursor]
+
+    def ensure_index(self, db_nm, clct_nm, flds: list, unique=False) -> str:
+        """
+        create_index() does nothing if the index is already there.
+        """
+        return get_client()[db_nm][clct_nm].create_index(
+            [(fld_nm, pm.ASCENDING) for fld_nm in flds], unique=unique)
 
     def count_documents(self, db_nm, clct_nm, filters={}):
         """
         Counts the documents in a collection, with an optional filter applied.
         """
-        return client[db_nm][clct_nm].count_documents(filters)
+        return get_client()[db_nm][clct_nm].count_documents(filters)
 
     def rename(self, db_nm: str, clct_nm: str, nm_map: dict):
         """
@@ -338,7 +604,7 @@ class MongoDB():
                 "old_nm2": "new_nm2",
             }
         """
-        collect = client[db_nm][clct_nm]
+        collect = get_client()[db_nm][clct_nm]
         return collect.update_many({},
                                    {'$rename': nm_map})
 
@@ -349,9 +615,20 @@ class MongoDB():
         """
         if with_date:
             print('with_date format is not supported at present time')
-        ret = client[db_nm][clct_nm].insert_one(doc)
+        ret = get_client()[db_nm][clct_nm].insert_one(doc)
         return str(ret.inserted_id)
 
+    def insert_many(self, db_nm: str, clct_nm: str, docs: list,
+                    ordered=True) -> list:
+        """
+        Inserts a batch of docs in one round trip.
+        If `ordered`, we stop at the first failure; otherwise we insert all
+        the docs we can before raising.
+        Returns the str() of the inserted IDs.
+        """
+        ret = get_client()[db_nm][clct_nm].insert_many(docs, ordered=ordered)
+        return [str(_id) for _id in ret.inserted_ids]
+
     def add_fld_to_all(self, db_nm, clct_nm, new_fld, value):
         collect = get_collect(db_nm, clct_nm)
         return collect.update_many({}, {SET: {new_fld: value}},
@@ -396,6 +673,22 @@ class MongoDB():
             rec_id = rec[DB_ID]
         return str(rec_id)
 
+    def upsert_many(self, db_nm, clct_nm, docs: list, key_flds: list):
+        """
+        Upserts a batch of docs, each matched on its `key_flds`, in one
+        round trip.
+        Our return counts the docs inserted or changed (mod_count), and
+        the docs matched or inserted (match_count).
+        """
+        if not docs:
+            return cmn.UpdateReturn(0, 0)
+        ops = [pm.UpdateOne({fld_nm: doc.get(fld_nm) for fld_nm in key_flds},
+                            _asmbl_upsert(doc, key_flds), upsert=True)
+               for doc in docs]
+        ret = get_client()[db_nm][clct_nm].bulk_write(ops, ordered=False)
+        return cmn.UpdateReturn(ret.modified_count + ret.upserted_count,
+                                ret.matched_count + ret.upserted_count)
+
     def search_collection(self, db_nm, clct_nm, fld_nm, regex, active=False):
         """
         Searches a collection for occurences of regex in fld_nm.
@@ -435,4 +728,5 @@ class MongoDB():
         return create_update_ret(mongo_update_obj)
 
     def aggregate(self, db_nm, clct_nm, pipeline):
-        return client[db_nm][clct_nm].aggregate(pipeline, allowDiskUse=True)
+        return get_client()[db_nm][clct_nm].aggregate(pipeline,
+                                                      allowDiskUse=True)
@@ -1,10 +1,15 @@
 import sqlalchemy as sqla
 from sqlalchemy import desc, asc
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from icecream import ic
+import operator
+import sqlite3
+import threading
 import time
 import os
 
 import backendcore.data.databases.common as cmn
+import backendcore.env.env_utils as envu
 
 from backendcore.common.constants import OBJ_ID_NM
 
@@ -19,7 +24,13 @@ db_nm = os.environ.get('SQL_DB_NM', SQL_DB_NM)
 db_loc = os.environ.get('SQLITE_LOC', './database')
 force_mem = os.environ.get('FORCE_MEM', 0)
 SQLITE_BASE = 'sqlite+pysqlite:///'
-SQLITE_MEM_STR = SQLITE_BASE + ':memory:'
+# A named in-memory DB on SQLite's memdb VFS: every connection in the
+# process, sync or async, opens the same DB. Unlike a shared-cache DB,
+# it locks the whole DB the usual way, so busy_timeout applies, rather
+# than failing on table locks. It lives while any connection to it is
+# open: see mem_keeper.
+SQLITE_MEM_URI = 'file:/backendcore_mem?vfs=memdb&uri=true'
+SQLITE_MEM_STR = SQLITE_BASE + SQLITE_MEM_URI
 SQLITE_STR = SQLITE_BASE + db_loc + "/" + db_nm
 
 DB_TABLE = {
@@ -27,13 +38,33 @@ DB_TABLE = {
     SQLITE: SQLITE_STR,
 }
 
+# One engine, and so one connection pool, per process, shared by every
+# SqlDB object. The schema metadata is shared the same way, so a table one
+# thread creates is known to all.
 engine = None
+# keeps our in-memory DB alive, whatever the pools do:
+mem_keeper = None
+mdata = None
+engine_lock = threading.Lock()
+# Guards changes to the schema:
+schema_lock = threading.RLock()
+# When we last re-read each table's schema, by table name:
+schema_checked_at = {}
+# Our statements, by shape: see SqlDB._shaped_stmt().
+stmt_cache = {}
+STMT_CACHE_SIZE = 512
+# Indexes asked for, by table, as (index name, fields, unique). We can
+# only make one once its table and columns exist, and those come with the
+# first doc written, so we keep them to make then:
+wanted_indexes = {}
 
 NO_SORT = 0
 DESC = -1
 ASC = 1
 NO_PROJ = []
 DOC_LIMIT = 100000
+# How many rows a streaming read fetches at a time:
+DEF_BATCH_SIZE = 1000
 INNER_DB_ID = '$oid'
 
 # SQL doesn't have the db/collection that Mongo has,
@@ -43,6 +74,83 @@ DB_NAME = 'db'
 
 DATE_KEY = '$date'
 
+# How often (in seconds) we may re-read a table's schema, looking for a
+# column another process added:
+SCHEMA_CHECK_SECS = 60.0
+
+# Our SQLite profile, set on each new connection: see get_sqlite_pragmas().
+# WAL lets readers go on while one writer writes, and with it NORMAL
+# sync only fsyncs at checkpoints, not on every commit.
+JOURNAL_MODE = 'journal_mode'
+SYNCHRONOUS = 'synchronous'
+MMAP_SIZE = 'mmap_size'
+CACHE_SIZE = 'cache_size'
+BUSY_TIMEOUT = 'busy_timeout'
+
+DEF_JOURNAL_MODE = 'WAL'
+DEF_SYNCHRONOUS = 'NORMAL'
+DEF_MMAP_SIZE = 256 * 1024 * 1024  # in bytes
+DEF_CACHE_SIZE = -64 * 1024  # negative means KiB: so this is 64MB
+DEF_BUSY_TIMEOUT = 5000  # in ms
+
+JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+SYNC_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+# The Mongo filter operators we can turn into SQL:
+AND = '$and'
+OR = '$or'
+EQ = '$eq'
+NE = '$ne'
+IN = '$in'
+NIN = '$nin'
+EXISTS = '$exists'
+REGEX = '$regex'
+OPTIONS = '$options'
+
+
+def _in(field, vals):
+    """
+    Mongo's $in can look for None, which SQL's IN can't.
+    """
+    in_vals = field.in_([val for val in vals if val is not None])
+    if None in vals:
+        return sqla.or_(in_vals, field.is_(None))
+    return in_vals
+
+
+def _ne(field, val):
+    """
+    Mongo's $ne also matches a missing field.
+    """
+    if val is None:
+        return field.is_not(None)
+    return sqla.or_(field != val, field.is_(None))
+
+
+def _nin(field, vals):
+    """
+    And $nin matches a missing field, unless it lists None.
+    """
+    not_in = sqla.not_(field.in_([val for val in vals if val is not None]))
+    if None in vals:
+        return sqla.and_(not_in, field.is_not(None))
+    return sqla.or_(not_in, field.is_(None))
+
+
+FILTER_OPS = {
+    EQ: lambda field, val: field == val,
+    NE: _ne,
+    '$gt': operator.gt,
+    '$gte': operator.ge,
+    '$lt': operator.lt,
+    '$lte': operator.le,
+    IN: _in,
+    NIN: _nin,
+    EXISTS: lambda field, pred: (field.is_not(None) if pred
+                                 else field.is_(None)),
+    REGEX: lambda field, pattern: field.regexp_match(pattern),
+}
+
 _type_py2sql_dict = {
  int: sqla.sql.sqltypes.BigInteger,
  str: sqla.sql.sqltypes.Unicode,
@@ -96,6 +204,109 @@ def create_update_ret(sql_ret):
                             sql_ret.rowcount)
 
 
+# The dialects that can upsert in one statement, and their INSERTs that
+# know how:
+UPSERT_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+    'mysql': mysql.insert,
+}
+
+
+# Errors worth retrying: the DB may answer next time.
+TRANSIENT_ERRORS = (sqla.exc.DisconnectionError, sqla.exc.TimeoutError)
+
+
+def is_transient(err: Exception) -> bool:
+    """
+    OperationalError also covers things like a missing table, so we only
+    retry those when SQLAlchemy says the connection went bad.
+    """
+    if isinstance(err, TRANSIENT_ERRORS):
+        return True
+    return (isinstance(err, sqla.exc.DBAPIError)
+            and err.connection_invalidated)
+
+
+def get_sqlite_pragmas(in_mem: bool = False) -> dict:
+    """
+    The PRAGMAs for our SQLite connections, from the env.
+    An in-memory DB has no journal or file to map, so it only gets the
+    cache size and busy timeout.
+    """
+    pragmas = {}
+    if not in_mem:
+        pragmas[JOURNAL_MODE] = os.getenv('SQLITE_JOURNAL_MODE',
+                                          DEF_JOURNAL_MODE).upper()
+        pragmas[SYNCHRONOUS] = os.getenv('SQLITE_SYNCHRONOUS',
+                                         DEF_SYNCHRONOUS).upper()
+        pragmas[MMAP_SIZE] = envu.get_int('SQLITE_MMAP_SIZE', DEF_MMAP_SIZE)
+        if pragmas[JOURNAL_MODE] not in JOURNAL_MODES:
+            raise ValueError(f'Bad {JOURNAL_MODE}: {pragmas}')
+        if pragmas[SYNCHRONOUS] not in SYNC_MODES:
+            raise ValueError(f'Bad {SYNCHRONOUS}: {pragmas}')
+    pragmas[CACHE_SIZE] = envu.get_int('SQLITE_CACHE_SIZE', DEF_CACHE_SIZE)
+    pragmas[BUSY_TIMEOUT] = envu.get_int('SQLITE_BUSY_TIMEOUT_MS',
+                                         DEF_BUSY_TIMEOUT)
+    return pragmas
+
+
+def set_pragmas(engine, pragmas: dict):
+    """
+    PRAGMAs (but journal_mode) last only as long as the connection, so
+    we set them on every new one.
+    """
+    def on_connect(dbapi_conn, conn_record):
+        cursor = dbapi_conn.cursor()
+        for pragma, val in pragmas.items():
+            cursor.execute(f'PRAGMA {pragma} = {val}')
+        cursor.close()
+
+    sqla.event.listen(engine, 'connect', on_connect)
+    return engine
+
+
+def schema_changed():
+    """
+    Our cached statements may name tables or columns that have changed.
+    """
+    stmt_cache.clear()
+
+
+# What SQLite says when a connection hasn't yet seen the unique index
+# an upsert keys on:
+STALE_SCHEMA_ERR = 'ON CONFLICT clause does not match'
+SCHEMA_READ = 'SELECT 1 FROM sqlite_master LIMIT 1'
+
+
+def is_stale_schema(err) -> bool:
+    return STALE_SCHEMA_ERR in str(err.orig)
+
+
+def execute_upsert(conn, stmt):
+    """
+    A SQLite connection only sees another connection's schema changes
+    when it next reads the schema, and an upsert fails before that if
+    its unique index was made elsewhere. If so, read it and try again.
+    """
+    try:
+        return conn.execute(stmt)
+    except sqla.exc.OperationalError as e:
+        if not is_stale_schema(e):
+            raise
+        conn.exec_driver_sql(SCHEMA_READ).all()
+        return conn.execute(stmt)
+
+
+def dispose_engine():
+    """
+    Forgets the pooled connections without closing them: for a forked
+    child, whose parent is still using them.
+    """
+    if engine is not None:
+        engine.dispose(close=False)
+
+
 class SqlDB():
     """
     Encaspulates a connection to a SQL Server.
@@ -104,18 +315,37 @@ class SqlDB():
         if force_mem:
             variant = SQLITE_MEM
         self.variant = variant
-        global engine
-        self.mdata = sqla.MetaData()
-        if engine is None:
-            engine = self._connectDB()
+        global engine, mdata
+        with engine_lock:
+            if engine is None:
+                engine = self._connectDB()
+                # Load existing metadata
+                mdata = sqla.MetaData()
+                mdata.reflect(engine)
         self.id_counter = os.urandom(3)
-        # Load existing metadata
-        self.mdata.reflect(engine)
+        # threads share this object:
+        self.id_lock = threading.Lock()
 
     def _connectDB(self):
         connect_str = DB_TABLE[self.variant]
         print(f'{connect_str=}')
-        return sqla.create_engine(connect_str, echo=False)
+        if self.variant == SQLITE_MEM:
+            global mem_keeper
+            if mem_keeper is None:
+                mem_keeper = sqlite3.connect(SQLITE_MEM_URI, uri=True,
+                                             check_same_thread=False)
+            # each thread gets its own connection to the one DB:
+            new_engine = sqla.create_engine(
+                connect_str, echo=False,
+                connect_args={'check_same_thread': False})
+        else:
+            new_engine = sqla.create_engine(connect_str, echo=False)
+        return set_pragmas(new_engine,
+                           get_sqlite_pragmas(self.variant == SQLITE_MEM))
+
+    @property
+    def mdata(self):
+        return mdata
 
     def _get_metadata(self):
         return self.mdata
@@ -124,7 +354,9 @@ class SqlDB():
         return engine
 
     def _clear_mdata(self):
-        self.mdata = sqla.MetaData()
+        global mdata
+        mdata = sqla.MetaData()
+        schema_changed()
 
     def _clear_table(self, clct_nm):
         collect = self.get_collect(clct_nm)
@@ -134,9 +366,10 @@ class SqlDB():
     def _obj_id(self):
         timestr = int(time.time()).to_bytes(4, 'big')
         randbytes = os.urandom(1)
-        ctrstr = self.id_counter
-        self.id_counter = int.from_bytes(ctrstr, 'big') + 1
-        self.id_counter = self.id_counter.to_bytes(3, 'big')
+        with self.id_lock:
+            ctrstr = self.id_counter
+            self.id_counter = (int.from_bytes(ctrstr, 'big') + 1) % 2**24
+            self.id_counter = self.id_counter.to_bytes(3, 'big')
         id = timestr + randbytes + ctrstr
         id = int.from_bytes(id, 'big')
         return id
@@ -162,6 +395,8 @@ class SqlDB():
                 replace_existing=True,
             )
         self.mdata.create_all(engine)
+        schema_changed()
+        self._make_indexes(new_table)
         return new_table
 
     def get_collect(self, clct_nm: str, doc={}, create_if_none=False):
@@ -191,13 +426,89 @@ class SqlDB():
             return field
         raise ValueError(f'No such field: {col_nm}')
 
+    def _known_field(self, collect, col_nm: str):
+        """
+        The column, or None if there is no such column: for reads, which
+        must never change the schema.
+        Our schema is cached, and another process may have added the
+        column since we read it, so on a miss we re-read the table's
+        schema, but no more than once every SCHEMA_CHECK_SECS.
+        """
+        field = collect.c.get(col_nm)
+        if field is not None:
+            return field
+        now = time.monotonic()
+        checked_at = schema_checked_at.get(collect.name)
+        if checked_at is not None and now - checked_at < SCHEMA_CHECK_SECS:
+            return None
+        schema_checked_at[collect.name] = now
+        self._reflect_table(collect.name)
+        return collect.c.get(col_nm)
+
+    def _reflect_table(self, clct_nm: str):
+        with schema_lock:
+            schema_changed()
+            return sqla.Table(clct_nm, self.mdata, autoload_with=engine,
+                              extend_existing=True)
+
+    def refresh_schema(self):
+        """
+        Re-reads the whole schema, for when another process has changed it.
+        """
+        with schema_lock:
+            self.mdata.reflect(engine, extend_existing=True)
+            schema_checked_at.clear()
+            schema_changed()
+
+    @staticmethod
+    def _col_type(fld_val):
+        """
+        The python type to make a new column for fld_val.
+        We can't tell from None, so then we default to text.
+        """
+        tp = type(fld_val)
+        return tp if tp in _type_py2sqltext_dict else str
+
+    def _add_cols(self, collect, docs: list):
+        """
+        Adds the columns docs have that our table lacks, as one migration
+        step: one transaction for the new fields, whatever their number.
+        Another process may have added some already, so we ask the DB
+        which it has.
+        Returns the table.
+        """
+        new_flds = {}
+        for doc in docs:
+            for fld_nm, fld_val in doc.items():
+                if fld_nm not in collect.c and new_flds.get(fld_nm) is None:
+                    new_flds[fld_nm] = fld_val
+        if not new_flds:
+            return collect
+        with schema_lock:
+            with engine.begin() as conn:
+                have = {col['name'] for col
+                        in sqla.inspect(conn).get_columns(collect.name)}
+                for fld_nm, fld_val in new_flds.items():
+                    if fld_nm not in have:
+                        sql_tp = _type_py2sqltext(self._col_type(fld_val))
+                        conn.execute(sqla.text(
+                            f'alter table {collect.name} add column '
+                            + f'{fld_nm} {sql_tp}'))
+            for fld_nm, fld_val in new_flds.items():
+                column = sqla.Column(fld_nm,
+                                     _type_py2sql(self._col_type(fld_val)))
+                collect.append_column(column, replace_existing=True)
+            schema_changed()
+        self._make_indexes(collect)
+        return collect
+
     def _create_clct_from_doc(self, clct_nm: str, doc: dict):
         """
         Creates a new table where each field is the datatype
         of that field in the supplied document.
         """
         if isinstance(doc, list):
-            doc = doc.pop()
+            doc = doc[0]
         columns = self._doc_to_cols(doc)
         self.create_table(clct_nm, columns)
         return self.get_collect(clct_nm)
@@ -216,9 +527,7 @@ class SqlDB():
         return columns
 
     def _add_extra_flds_from_doc(self, collect, doc: dict):
-        for fld in doc:
-            self.get_field(collect, fld, create_if_none=True)
-        return collect
+        return self._add_cols(collect, [doc])
 
     def create(self, db_nm: str, clct_nm: str, doc, with_date=False):
         """
@@ -230,6 +539,7 @@ class SqlDB():
         doc_with_ids = self.add_ids(doc)
         collect = self.get_collect(clct_nm, doc=doc_with_ids,
                                    create_if_none=True)
+        self._add_cols(collect, [doc] if isinstance(doc, dict) else doc)
         with engine.begin() as conn:
             conn.execute(sqla.insert(collect), doc)
             conn.commit()
@@ -237,6 +547,28 @@ class SqlDB():
             return doc[OBJ_ID_NM]
         return doc[0][OBJ_ID_NM]
 
+    def insert_many(self, db_nm: str, clct_nm: str, docs: list,
+                    ordered=True) -> list:
+        """
+        Inserts a batch of docs with a single executemany.
+        The batch goes in one transaction, so it is always `ordered`:
+        one failure rolls back the whole batch.
+        Returns the inserted IDs.
+        """
+        if not docs:
+            return []
+        docs = self.add_ids(docs)
+        collect = self.get_collect(clct_nm, doc=docs[0],
+                                   create_if_none=True)
+        self._add_cols(collect, docs)
+        fld_nms = {fld_nm: None for doc in docs for fld_nm in doc}
+        # executemany needs every row to have the same columns:
+        rows = [{fld_nm: doc.get(fld_nm) for fld_nm in fld_nms}
+                for doc in docs]
+        with engine.begin() as conn:
+            conn.execute(sqla.insert(collect), rows)
+        return [doc[OBJ_ID_NM] for doc in docs]
+
     def add_ids(self, doc):
         if isinstance(doc, dict):
             if doc.get(OBJ_ID_NM) is None:
@@ -260,10 +592,38 @@ class SqlDB():
     def _text_wrap(self, name):
         return sqla.text(f"\'{name}\'")
 
-    def _asmbl_sort_slct(self, collect, sort=NO_SORT, sort_fld=OBJ_ID_NM):
-        stmt = sqla.select(collect)
-        if sort_fld is not None:
-            field = self.get_field(collect, sort_fld, create_if_none=True)
+    def _proj_cols(self, collect, proj=NO_PROJ, exclude_flds=None,
+                   no_id=False) -> list:
+        """
+        The columns to read: those in `proj` (plus the id, as Mongo does)
+        or else all of them, less `exclude_flds`.
+        """
+        exclude_flds = set(exclude_flds) if exclude_flds else set()
+        if no_id:
+            exclude_flds.add(OBJ_ID_NM)
+        if proj:
+            keep = {OBJ_ID_NM, *proj}
+            cols = [col for col in collect.c if col.name in keep]
+        else:
+            cols = list(collect.c)
+        cols = [col for col in cols if col.name not in exclude_flds]
+        if not cols:
+            # we must select something:
+            cols = [collect.c[OBJ_ID_NM]]
+        return cols
+
+    def _asmbl_sort_slct(self, collect, sort=NO_SORT, sort_fld=OBJ_ID_NM,
+                         cols=None):
+        if cols:
+            stmt = sqla.select(*cols)
+        else:
+            stmt = sqla.select(collect)
+        if sort == NO_SORT or sort_fld is None:
+            return stmt
+        field = self._known_field(collect, sort_fld)
+        if field is None:
+            # no such column: every row would sort the same
+            return stmt
         if sort == ASC:
             return stmt.order_by(asc(field))
         elif sort == DESC:
@@ -271,45 +631,133 @@ class SqlDB():
         return stmt
 
     def _update_dict_to_vals(self, clct, update_dict):
-        vals = {}
-        for key in update_dict:
-            field = self.get_field(clct, key, create_if_none=True)
-            vals[field] = update_dict[key]
-        return vals
+        self._add_cols(clct, [update_dict])
+        return {clct.c[key]: val for key, val in update_dict.items()}
 
     def _filter_to_where(self, clct, stmt, filter={}, vals=None):
         """
-        Converts a basic {field: val} filter to a WHERE clause
-        Should add other mongo operators.
+        Converts a Mongo-style filter to a WHERE clause: see
+        _compile_filter() for what we understand.
         """
-        if not len(filter.keys()):
-            return stmt
-        for fld_nm in list(filter.keys()):
-            field = self.get_field(clct, fld_nm, create_if_none=True)
-            stmt = stmt.where(field == filter[fld_nm])
+        if len(filter.keys()):
+            stmt = stmt.where(self._compile_filter(clct, filter))
         if vals is not None:
             stmt = stmt.values(self._update_dict_to_vals(clct, vals))
         return stmt
 
+    def _compile_filter(self, clct, filter: dict):
+        """
+        Turns a Mongo-style filter into a SQL condition.
+        We handle {field: val} equality, the field operators in
+        FILTER_OPS, and $and / $or over lists of filters.
+        """
+        conds = []
+        for key, val in filter.items():
+            if key in (AND, OR):
+                subconds = [self._compile_filter(clct, sub) for sub in val]
+                if key == AND:
+                    conds.append(sqla.and_(sqla.true(), *subconds))
+                else:
+                    conds.append(sqla.or_(sqla.false(), *subconds))
+            elif key.startswith('$'):
+                raise ValueError(f'Unsupported filter operator: {key}')
+            else:
+                conds.append(self._compile_fld(clct, key, val))
+        if len(conds) == 1:
+            return conds[0]
+        return sqla.and_(sqla.true(), *conds)
+
+    def _compile_fld(self, clct, fld_nm: str, val):
+        """
+        The condition for one field: `val` is a value to match, or a dict
+        of operators, such as {'$gte': 1, '$lt': 10}.
+        A field we have no column for is missing from every row, and
+        matches as Mongo would match a missing field: we don't add a
+        column just to look in it.
+        SQL can't tell a missing field from a null one, so to us they
+        are the same.
+        """
+        field = self._known_field(clct, fld_nm)
+        if not (isinstance(val, dict) and val
+                and all(op.startswith('$') for op in val)):
+            val = {EQ: val}
+        conds = []
+        for op, arg in val.items():
+            if op == OPTIONS:
+                # goes with $regex
+                continue
+            if op not in FILTER_OPS:
+                raise ValueError(f'Unsupported filter operator: {op}')
+            if op == REGEX:
+                arg = self._regex(arg, val.get(OPTIONS))
+            if field is None:
+                conds.append(sqla.true() if self._missing_matches(op, arg)
+                             else sqla.false())
+            else:
+                conds.append(FILTER_OPS[op](field, arg))
+        if len(conds) == 1:
+            return conds[0]
+        return sqla.and_(sqla.true(), *conds)
+
+    @staticmethod
+    def _missing_matches(op: str, arg) -> bool:
+        """
+        Does a missing field match `{op: arg}`?
+        """
+        if op == EQ:
+            return arg is None
+        if op == NE:
+            return arg is not None
+        if op == IN:
+            return None in arg
+        if op == NIN:
+            return None not in arg
+        if op == EXISTS:
+            return not arg
+        # comparisons and $regex need a value
+        return False
+
+    @staticmethod
+    def _regex(pattern: str, options: str = None) -> str:
+        """
+        Mongo passes regex flags in $options; SQL wants them inline.
+        """
+        flags = ''.join(flag for flag in (options or '') if flag in 'imsx')
+        if flags:
+            return f'(?{flags}){pattern}'
+        return pattern
+
+    def create_in_filter(self, fld_nm: str, values: list):
+        return {fld_nm: {IN: values}}
+
+    def create_exists_filter(self, fld_nm: str, predicate: bool = True):
+        return {fld_nm: {EXISTS: predicate}}
+
+    def create_or_filter(self, filt1: dict, filt2: dict):
+        return {OR: [filt1, filt2]}
+
+    def create_and_filter(self, filt1: dict, filt2: dict):
+        return {AND: [filt1, filt2]}
+
     def _id_handler(self, rec, no_id):
         if rec:
             # if no_id:
-            if rec.get(OBJ_ID_NM):
-                del rec[OBJ_ID_NM]
+            rec.pop(OBJ_ID_NM, None)
             # else:
             #     # eliminate the ID nesting if it's not already a string:
             #     if not isinstance(rec[OBJ_ID_NM], str):
             #         rec[OBJ_ID_NM] = rec[OBJ_ID_NM][INNER_DB_ID]
         return rec
 
-    def _filter_limit(self, stmt, limit: int = None):
+    def _filter_limit(self, stmt, limit: int = None, skip: int = 0):
         """
-        Simple wrapper for the limit method
+        Simple wrapper for the limit and offset methods
         """
         if limit:
-            return stmt.limit(limit)
-        else:
-            return stmt
+            stmt = stmt.limit(limit)
+        if skip:
+            stmt = stmt.offset(skip)
+        return stmt
 
     def _asmbl_read_stmt(
         self,
@@ -318,12 +766,107 @@ class SqlDB():
         sort: int = NO_SORT,
         sort_fld: str = OBJ_ID_NM,
         limit: int = None,
+        proj: list = NO_PROJ,
+        exclude_flds: list = None,
+        no_id: bool = False,
+        skip: int = 0,
     ):
-        stmt = self._asmbl_sort_slct(collect, sort=sort, sort_fld=sort_fld)
+        cols = None
+        if proj or exclude_flds or no_id:
+            cols = self._proj_cols(collect, proj, exclude_flds, no_id)
+        stmt = self._asmbl_sort_slct(collect, sort=sort, sort_fld=sort_fld,
+                                     cols=cols)
         stmt = self._filter_to_where(collect, stmt, filters)
-        stmt = self._filter_limit(stmt, limit)
+        stmt = self._filter_limit(stmt, limit, skip)
+        return stmt
+
+    def _shaped_stmt(self, key: tuple, collect, filters: dict, build):
+        """
+        Statements of the same shape (same table, filter fields, sort and
+        so on) differ only in their values. So we build one with the
+        filter values as bound parameters, keep it, and pass the values
+        when we run it: we skip rebuilding it, and SQLAlchemy finds its
+        compiled form in its cache.
+        `build(where)` makes the statement, using `where(stmt)` to add the
+        WHERE clause.
+        Returns (statement, parameters), or None if the filter won't bind
+        (a field we have no column for, or an operator): build the
+        statement the old way then.
+        """
+        shape = []
+        for fld_nm, val in filters.items():
+            if fld_nm not in collect.c or isinstance(val, (dict, list)):
+                return None
+            shape.append((fld_nm, val is None))
+        shape = tuple(shape)
+        key = (*key, collect.name, shape)
+        stmt = stmt_cache.get(key)
+        if stmt is None:
+            stmt = build(lambda stmt: self._bind_where(collect, stmt, shape))
+            if len(stmt_cache) >= STMT_CACHE_SIZE:
+                stmt_cache.clear()
+            stmt_cache[key] = stmt
+        params = {f'_w{i}': val for i, val in enumerate(filters.values())
+                  if val is not None}
+        return stmt, params
+
+    def _bind_where(self, collect, stmt, shape: tuple):
+        for i, (fld_nm, is_none) in enumerate(shape):
+            field = collect.c[fld_nm]
+            if is_none:
+                stmt = stmt.where(field.is_(None))
+            else:
+                stmt = stmt.where(field == sqla.bindparam(f'_w{i}'))
         return stmt
 
+    def _read_stmt(self, collect, filters: dict = {}, sort: int = NO_SORT,
+                   sort_fld: str = OBJ_ID_NM, limit: int = None,
+                   proj: list = NO_PROJ, exclude_flds: list = None,
+                   no_id: bool = False, skip: int = 0):
+        """
+        _asmbl_read_stmt(), but from our cache when we can.
+        Returns (statement, parameters).
+        """
+        if sort == NO_SORT:
+            sort_fld = None
+        shaped = None
+        if sort_fld is None or sort_fld in collect.c:
+            def build(where):
+                stmt = where(self._asmbl_read_stmt(
+                    collect, {}, sort, sort_fld, None, proj, exclude_flds,
+                    no_id))
+                if limit:
+                    stmt = stmt.limit(sqla.bindparam('_limit'))
+                if skip:
+                    stmt = stmt.offset(sqla.bindparam('_skip'))
+                return stmt
+
+            key = ('read', sort, sort_fld, bool(limit), bool(skip),
+                   tuple(proj) if proj else (),
+                   tuple(exclude_flds) if exclude_flds else (), no_id)
+            shaped = self._shaped_stmt(key, collect, filters, build)
+        if shaped is None:
+            return self._asmbl_read_stmt(collect, filters, sort, sort_fld,
+                                         limit, proj, exclude_flds, no_id,
+                                         skip), {}
+        stmt, params = shaped
+        if limit:
+            params['_limit'] = limit
+        if skip:
+            params['_skip'] = skip
+        return stmt, params
+
+    def _where_stmt(self, kind: str, collect, filters: dict, build):
+        """
+        For statements that are just `build()` plus a WHERE clause.
+        Returns (statement, parameters).
+        """
+        shaped = self._shaped_stmt((kind,), collect, filters,
+                                   lambda where: where(build()))
+        if shaped is None:
+            return self._filter_to_where(collect, build(), filters), {}
+        return shaped
+
     def read(
         self,
         db_nm: str,
@@ -333,18 +876,25 @@ class SqlDB():
         sort_fld: str = OBJ_ID_NM,
         no_id: bool = False,
         limit: int = None,
+        proj: list = NO_PROJ,
+        exclude_flds: list = None,
+        skip: int = 0,
     ):
         """
         Returns all docs from a collection.
         `sort` can be DESC, NO_SORT, or ASC.
+        `proj` lists the only fields to read; `exclude_flds` fields not
+        to read.
+        `limit` and `skip` go into the query, so we only read that page.
         """
         all_docs = []
         clct = self.get_collect(clct_nm)
         if clct is None:
             return all_docs
-        stmt = self._asmbl_read_stmt(clct, filters, sort, sort_fld, limit)
+        stmt, params = self._read_stmt(clct, filters, sort, sort_fld, limit,
+                                       proj, exclude_flds, no_id, skip)
         with engine.connect() as conn:
-            res = conn.execute(stmt)
+            res = conn.execute(stmt, params)
             all_docs = self._read_recs_to_objs(res)
         if no_id:
             for rec in all_docs:
@@ -358,6 +908,80 @@ class SqlDB():
             return res.pop()
         return None
 
+    def count_documents(self, db_nm, clct_nm, filters={}) -> int:
+        """
+        Counts the rows in a table, with an optional filter applied.
+        """
+        clct = self.get_collect(clct_nm)
+        if clct is None:
+            return 0
+        stmt, params = self._where_stmt(
+            'count', clct, filters,
+            lambda: sqla.select(sqla.func.count()).select_from(clct))
+        with engine.connect() as conn:
+            return conn.execute(stmt, params).scalar()
+
+    def exists(self, db_nm, clct_nm, filters={}) -> bool:
+        """
+        Does any row meet filters?
+        EXISTS lets the DB stop at the first match.
+        """
+        clct = self.get_collect(clct_nm)
+        if clct is None:
+            return False
+        stmt, params = self._where_stmt(
+            'exists', clct, filters,
+            lambda: sqla.select(clct.c[OBJ_ID_NM]))
+        with engine.connect() as conn:
+            res = conn.execute(sqla.select(stmt.exists()), params)
+            return bool(res.scalar())
+
+    def select_cursor(self, db_nm, clct_nm, filters={}, sort=NO_SORT,
+                      sort_fld=OBJ_ID_NM, proj=NO_PROJ, limit=None, skip=0,
+                      exclude_flds=None):
+        """
+        SQL has no cursor to hand back, so this returns an iterator
+        over the rows read.
+        """
+        clct = self.get_collect(clct_nm)
+        if clct is None:
+            return iter([])
+        stmt, params = self._read_stmt(clct, filters, sort, sort_fld, limit,
+                                       proj, exclude_flds, skip=skip)
+        with engine.connect() as conn:
+            return iter(self._read_recs_to_objs(conn.execute(stmt, params)))
+
+    def stream(self, db_nm, clct_nm, filters={}, sort=NO_SORT,
+               sort_fld=OBJ_ID_NM, no_id=False, proj=NO_PROJ,
+               exclude_flds=None, batch_size=DEF_BATCH_SIZE):
+        """
+        A generator over the matching records.
+        We use a server-side cursor and fetch `batch_size` rows at a
+        time, so we never hold more than a batch.
+        The connection stays checked out until the generator is done (or
+        closed).
+        """
+        clct = self.get_collect(clct_nm)
+        if clct is None:
+            return
+        stmt, params = self._read_stmt(clct, filters, sort, sort_fld, None,
+                                       proj, exclude_flds, no_id)
+        with engine.connect() as conn:
+            res = conn.execution_options(stream_results=True,
+                                         yield_per=batch_size).execute(
+                                             stmt, params)
+            for batch in res.mappings().partitions():
+                for row in batch:
+                    yield dict(row)
+
+    def doc_to_rec(self, doc, no_id=False) -> dict:
+        """
+        Turns a row from a cursor into the record our reads return.
+        """
+        if no_id:
+            self._id_handler(doc, no_id)
+        return doc
+
     def exclude_flds(self, flds, res):
         for fld_nm in flds:
             for rec in res:
@@ -366,19 +990,77 @@ class SqlDB():
 
     def select(self, db_nm, clct_nm, filters={}, sort=NO_SORT,
                sort_fld='_id', proj=NO_PROJ, limit=DOC_LIMIT,
-               no_id=False, exclude_flds=None):
+               no_id=False, exclude_flds=None, skip=0):
         """
         Select records from a collection matching filters.
         """
-        if proj != NO_PROJ:
-            raise NotImplementedError('select() proj, limit params')
-        res = self.read(db_nm, clct_nm, filters=filters,
-                        sort=sort, sort_fld=sort_fld)
-        if exclude_flds:
-            res = self.exclude_flds(exclude_flds, res)
-        if len(res) > limit:
-            return res[:(limit - 1)]
-        return res
+        return self.read(db_nm, clct_nm, filters=filters,
+                         sort=sort, sort_fld=sort_fld, no_id=no_id,
+                         limit=limit, proj=proj, exclude_flds=exclude_flds,
+                         skip=skip)
+
+    def select_page(self, db_nm, clct_nm, filters={}, sort=ASC,
+                    sort_fld=OBJ_ID_NM, page_size=DOC_LIMIT, after=None,
+                    proj=NO_PROJ, exclude_flds=None):
+        """
+        Keyset (seek) pagination: reads the `page_size` records that
+        sort after `after`, the (sort value, id) of the last record of
+        the previous page.
+        We order on the id too, so ties on `sort_fld` still page in a
+        fixed order.
+        As in Mongo, NULLs sort lowest: first going up, last going down.
+        Unlike an offset, the DB can seek straight to the page.
+        """
+        clct = self.get_collect(clct_nm)
+        if clct is None:
+            return []
+        stmt = self._asmbl_read_stmt(clct, filters, NO_SORT, None,
+                                     page_size, proj, exclude_flds)
+        id_col = clct.c[OBJ_ID_NM]
+        field = self._known_field(clct, sort_fld)
+        if field is None:
+            # no values to sort on, so the id will do:
+            field = id_col
+        order = desc if sort == DESC else asc
+        if field is id_col:
+            stmt = stmt.order_by(order(id_col))
+        else:
+            field_order = order(field)
+            # MySQL already sorts NULLs lowest, and has no NULLS FIRST:
+            if engine.dialect.name != 'mysql':
+                field_order = (field_order.nulls_last() if sort == DESC
+                               else field_order.nulls_first())
+            stmt = stmt.order_by(field_order, order(id_col))
+        if after is not None:
+            sort_val, _id = after
+            past = operator.lt if sort == DESC else operator.gt
+            if field is id_col:
+                stmt = stmt.where(past(id_col, _id))
+            else:
+                stmt = stmt.where(self._after_cond(field, id_col, sort,
+                                                   sort_val, _id))
+        with engine.connect() as conn:
+            return self._read_recs_to_objs(conn.execute(stmt))
+
+    @staticmethod
+    def _after_cond(field, id_col, sort, sort_val, _id):
+        """
+        The records that page after (sort_val, _id), with NULLs lowest.
+        Comparisons with NULL are never true, so NULLs need their own
+        branches.
+        """
+        past = operator.lt if sort == DESC else operator.gt
+        tied = past(id_col, _id)
+        if sort_val is None:
+            after_nulls = sqla.and_(field.is_(None), tied)
+            if sort == DESC:
+                return after_nulls
+            return sqla.or_(after_nulls, field.is_not(None))
+        cond = sqla.or_(past(field, sort_val),
+                        sqla.and_(field == sort_val, tied))
+        if sort == DESC:
+            cond = sqla.or_(cond, field.is_(None))
+        return cond
 
     def fetch_by_id(self, db_nm, clct_nm, _id: str, no_id=False):
         return self.read_one(db_nm, clct_nm, {OBJ_ID_NM: _id}, no_id)
@@ -391,14 +1073,31 @@ class SqlDB():
         update_dict: dict,
         upsert: bool = False,
     ):
+        if upsert:
+            self.upsert(db_nm, clct_nm, filters, update_dict)
+            return cmn.UpdateReturn(1, 1)
         collect = self.get_collect(clct_nm)
         if collect is None:
             raise ValueError(f'Cannot update; {clct_nm} does not exist.')
-        stmt = sqla.update(collect)
-        stmt = self._filter_to_where(collect, stmt,
-                                     filters, update_dict)
+        self._add_cols(collect, [update_dict])
+
+        def build(where):
+            return where(sqla.update(collect)).values(
+                {collect.c[fld_nm]: sqla.bindparam(f'_v{i}')
+                 for i, fld_nm in enumerate(update_dict)})
+
+        shaped = self._shaped_stmt(('update', tuple(update_dict)), collect,
+                                   filters, build)
+        if shaped is None:
+            stmt = self._filter_to_where(collect, sqla.update(collect),
+                                         filters, update_dict)
+            params = {}
+        else:
+            stmt, params = shaped
+            params.update({f'_v{i}': val
+                           for i, val in enumerate(update_dict.values())})
         with engine.begin() as conn:
-            res = conn.execute(stmt)
+            res = conn.execute(stmt, params)
         return create_update_ret(res)
 
     def update_fld(self, db_nm, clct_nm, filters, fld_nm, fld_val):
@@ -410,12 +1109,147 @@ class SqlDB():
         return self.update(db_nm, clct_nm, filters=filters,
                            update_dict={fld_nm: fld_val})
 
+    def _unique_keys(self, collect) -> list:
+        """
+        The sets of columns the DB keeps unique: an upsert can key on
+        any of them.
+        """
+        keys = [{col.name for col in collect.primary_key}]
+        keys += [{col.name for col in index.columns}
+                 for index in collect.indexes if index.unique]
+        return keys
+
+    def _upsert_key(self, collect, filters, update_dict):
+        """
+        The columns an upsert of this filter can key on natively, or None
+        if our dialect can't, or no unique index matches the filter.
+        """
+        if engine.dialect.name not in UPSERT_INSERTS:
+            return None
+        if update_dict.get(OBJ_ID_NM) is not None:
+            return [OBJ_ID_NM]
+        if set(filters) in self._unique_keys(collect):
+            return list(filters)
+        return None
+
+    def _upsert_rows(self, collect, rows: list, key_flds: list,
+                     update_flds: list):
+        """
+        Upserts all the rows with one INSERT ... ON CONFLICT DO UPDATE
+        (ON DUPLICATE KEY UPDATE for MySQL).
+        New rows need ids, but a row we update keeps its own.
+        Returns the ids of the rows, in order, where the DB can tell us.
+        """
+        stmt, returning = self._upsert_stmt(collect, rows, key_flds,
+                                            update_flds)
+        with engine.begin() as conn:
+            res = execute_upsert(conn, stmt)
+            if returning:
+                return [row[0] for row in res]
+        return None
+
+    def _upsert_stmt(self, collect, rows: list, key_flds: list,
+                     update_flds: list, only_changed=False):
+        """
+        Builds _upsert_rows()'s statement.
+        With `only_changed`, we leave rows that wouldn't change alone, so
+        the row count is of rows inserted or changed, as Mongo counts
+        them (but not on MySQL), and we don't return ids.
+        Returns (statement, whether it returns the ids).
+        """
+        self._add_cols(collect, rows)
+        fld_nms = {fld_nm: None for row in rows for fld_nm in row}
+        rows = [{fld_nm: row.get(fld_nm) for fld_nm in fld_nms}
+                for row in rows]
+        update_flds = [fld_nm for fld_nm in update_flds
+                       if fld_nm not in key_flds and fld_nm != OBJ_ID_NM]
+        stmt = UPSERT_INSERTS[engine.dialect.name](collect).values(rows)
+        if engine.dialect.name == 'mysql':
+            # MySQL takes the key from whichever unique index clashes:
+            stmt = stmt.on_duplicate_key_update(
+                {fld_nm: stmt.inserted[fld_nm] for fld_nm in update_flds}
+                or {OBJ_ID_NM: collect.c[OBJ_ID_NM]})
+        elif update_flds:
+            changed = None
+            if only_changed:
+                changed = sqla.or_(*[
+                    collect.c[fld_nm].is_distinct_from(stmt.excluded[fld_nm])
+                    for fld_nm in update_flds])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=key_flds,
+                set_={fld_nm: stmt.excluded[fld_nm]
+                      for fld_nm in update_flds},
+                where=changed)
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=key_flds)
+        returning = bool(engine.dialect.insert_returning and update_flds
+                         and not only_changed)
+        if returning:
+            stmt = stmt.returning(collect.c[OBJ_ID_NM])
+        return stmt, returning
+
     def upsert(self, db_nm, clct_nm, filters, update_dict):
         """
         Updates a record if it exists, otherwise creates it.
-        Getting it based on read() feels hacky. SQLA has an
-        on_conflict_do_update() but only in the postgres dialect.
-        -Boaz 1/9/25
+        Returns its id.
+        When the DB can, we do it in one statement, keyed on the id if we
+        have it, else on the filter: that needs a unique index on the
+        filter's fields.
+        Otherwise we fall back to reading, then writing.
+        """
+        collect = self.get_collect(clct_nm)
+        if collect is None:
+            return self._upsert_by_read(db_nm, clct_nm, filters, update_dict)
+        key_flds = self._upsert_key(collect, filters, update_dict)
+        if key_flds is None:
+            return self._upsert_by_read(db_nm, clct_nm, filters, update_dict)
+        row = self.add_ids({**filters, **update_dict})
+        ids = self._upsert_rows(collect, [row], key_flds, list(update_dict))
+        if ids:
+            return ids[0]
+        if OBJ_ID_NM in key_flds:
+            return row[OBJ_ID_NM]
+        # our DB can't say which row it wrote, so we must ask:
+        return self.read_one(db_nm, clct_nm, filters=filters)[OBJ_ID_NM]
+
+    def upsert_many(self, db_nm, clct_nm, docs: list, key_flds: list):
+        """
+        Upserts a batch of docs, each matched on its `key_flds`, in one
+        statement.
+        That needs a unique index on `key_flds` (or them to be the id):
+        without one, we upsert the docs one at a time.
+        Like Mongo's, our return counts the docs inserted or changed
+        (mod_count), and the docs matched or inserted (match_count): that
+        is all of them. Upserting one at a time, or on MySQL, we can't
+        tell an unchanged doc from a changed one, so count all as changed.
+        """
+        if not docs:
+            return cmn.UpdateReturn(0, 0)
+        collect = self.get_collect(clct_nm)
+        if collect is None:
+            self.insert_many(db_nm, clct_nm, docs)
+            return cmn.UpdateReturn(len(docs), len(docs))
+        key_flds = list(key_flds)
+        if (engine.dialect.name in UPSERT_INSERTS
+                and set(key_flds) in self._unique_keys(collect)):
+            docs = self.add_ids(docs)
+            fld_nms = {fld_nm: None for doc in docs for fld_nm in doc}
+            stmt, _ = self._upsert_stmt(collect, docs, key_flds,
+                                        list(fld_nms), only_changed=True)
+            with engine.begin() as conn:
+                res = execute_upsert(conn, stmt)
+            if engine.dialect.name != 'mysql':
+                return cmn.UpdateReturn(res.rowcount, len(docs))
+        else:
+            for doc in docs:
+                filters = {fld_nm: doc.get(fld_nm) for fld_nm in key_flds}
+                self.upsert(db_nm, clct_nm, filters, doc)
+        return cmn.UpdateReturn(len(docs), len(docs))
+
+    def _upsert_by_read(self, db_nm, clct_nm, filters, update_dict):
+        """
+        The slow way: two round trips, and another writer can get in
+        between them.
         """
         if not update_dict.get(OBJ_ID_NM):
             readres = self.read_one(db_nm, clct_nm, filters=filters)
@@ -424,8 +1258,9 @@ class SqlDB():
                 OBJ_ID_NM: update_dict[OBJ_ID_NM]
             })
         if not readres:
-            return self.create(db_nm, clct_nm, update_dict)
-        return self.update(db_nm, clct_nm, filters, update_dict)
+            return self.create(db_nm, clct_nm, {**filters, **update_dict})
+        self.update(db_nm, clct_nm, filters, update_dict)
+        return readres[OBJ_ID_NM]
 
     def delete(self, db_nm, clct_nm, filters={}):
         """
@@ -434,10 +1269,10 @@ class SqlDB():
         collect = self.get_collect(clct_nm)
         if collect is None:
             raise ValueError(f'Cannot delete; {clct_nm} does not exist.')
-        stmt = sqla.delete(collect)
-        stmt = self._filter_to_where(collect, stmt, filters)
+        stmt, params = self._where_stmt('delete', collect, filters,
+                                        lambda: sqla.delete(collect))
         with engine.begin() as conn:
-            res = conn.execute(stmt)
+            res = conn.execute(stmt, params)
         return create_del_ret(res)
 
     def delete_by_id(self, db, clct_nm, id):
@@ -460,17 +1295,51 @@ class SqlDB():
         SQLA also offers Alembic for industrial-strength migration
         but for now this is ok. -Boaz 1/10/25
         """
-        tp = type(fld_data)
-        with engine.begin() as conn:
-            conn.execute(
-                sqla.text(f'alter table {clct_nm} add column ' +
-                          f'{fld_nm} {_type_py2sqltext(tp)}')
-            )
         collect = self.get_collect(clct_nm)
-        column = sqla.Column(fld_nm, _type_py2sql(tp))
-        collect.append_column(column, replace_existing=True)
-        self.mdata.create_all(engine)
-        return column
+        self._add_cols(collect, [{fld_nm: fld_data}])
+        return collect.c[fld_nm]
+
+    @staticmethod
+    def index_nm(clct_nm: str, flds: list) -> str:
+        return '_'.join(['ix', clct_nm, *flds])
+
+    def _make_indexes(self, collect):
+        """
+        Makes the wanted indexes on this table whose columns all exist.
+        """
+        have = {index.name for index in collect.indexes}
+        for index_nm, flds, unique in wanted_indexes.get(collect.name, []):
+            if index_nm in have:
+                continue
+            if not all(fld_nm in collect.c for fld_nm in flds):
+                continue
+            index = sqla.Index(index_nm,
+                               *[collect.c[fld_nm] for fld_nm in flds],
+                               unique=unique)
+            try:
+                index.create(engine, checkfirst=True)
+            except sqla.exc.IntegrityError as e:
+                # the rows aren't unique, and won't become so by waiting:
+                print(f'Failed to make {index_nm}: {e}')
+                collect.indexes.discard(index)
+                wanted_indexes[collect.name].remove(
+                    (index_nm, flds, unique))
+
+    def ensure_index(self, db_nm, clct_nm, flds: list, unique=False) -> str:
+        """
+        CREATE INDEX, if it isn't there.
+        If the table or its columns don't exist yet, we make the index
+        when they do.
+        """
+        index_nm = self.index_nm(clct_nm, flds)
+        with engine_lock:
+            wanted = wanted_indexes.setdefault(clct_nm, [])
+            if index_nm not in [index[0] for index in wanted]:
+                wanted.append((index_nm, list(flds), unique))
+        collect = self.get_collect(clct_nm)
+        if collect is not None:
+            self._make_indexes(collect)
+        return index_nm
 
     def add_fld_to_all(self, db_nm, clct_nm, new_fld, value):
         self.add_fld(db_nm, clct_nm, new_fld, value)
@@ -510,6 +1379,7 @@ class SqlDB():
                     sqla.text(f'alter table {clct_nm} change \
                                 {key} {nm_map[key]}')
                 )
+        schema_changed()
 
     def time_str_from_rec(self, date_rec: dict):
         # Not quite sure how this translation works,
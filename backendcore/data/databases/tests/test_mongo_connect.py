@@ -1,11 +1,17 @@
 """
 This module tests our code for managing API categories.
 """
+import datetime
+import json
+import os
 import random
 from copy import deepcopy
+from unittest import mock
 
 import pytest
 import pymongo
+import bson
+import bson.json_util as bsutil
 
 import backendcore.data.databases.mongo_connect as mdb
 
@@ -119,6 +125,151 @@ def test_id_handler_with_id(rec_w_id):
     assert isinstance(new_rec[mdb.DB_ID], str)
 
 
+BSON_DOC = {
+    mdb.DB_ID: bson.ObjectId(),
+    'date': datetime.datetime(2024, 1, 2, 3, 4, 5, 678000),
+    'ref': bson.ObjectId(),
+    'int64': bson.Int64(5),
+    'decimal': bson.Decimal128('1.5'),
+    'nan': float('nan'),
+    'list': [{'ref': bson.ObjectId(), 'none': None, 'flag': True}],
+}
+
+
+def test_to_json_matches_bson_dumps():
+    assert mdb.to_json(BSON_DOC) == json.loads(bsutil.dumps(BSON_DOC))
+
+
+def test_to_rec():
+    rec = mdb.to_rec(BSON_DOC)
+    assert rec == mdb._id_handler(mdb.to_json(BSON_DOC), False)
+    assert rec[mdb.DB_ID] == str(BSON_DOC[mdb.DB_ID])
+
+
+def test_to_rec_no_id():
+    assert mdb.DB_ID not in mdb.to_rec(BSON_DOC, no_id=True)
+
+
+def test_asmbl_proj():
+    assert mdb._asmbl_proj() is None
+    assert mdb._asmbl_proj(['a', 'b'], ['b']) == {'a': 1}
+    assert mdb._asmbl_proj(exclude_flds=['a'], no_id=True) == {
+        'a': 0,
+        mdb.DB_ID: 0,
+    }
+
+
+def test_asmbl_proj_all_excluded():
+    assert mdb._asmbl_proj(['a'], ['a']) == {mdb.DB_ID: 1}
+
+
+def test_asmbl_after_filter():
+    obj_id = bson.ObjectId()
+    when = datetime.datetime(2024, 1, 2)
+    after = (mdb.to_native(when), str(obj_id))
+    assert mdb._asmbl_after_filter(mdb.ASC, 'when', after) == {
+        '$or': [{'when': {'$gt': when}},
+                {'when': when, mdb.DB_ID: {'$gt': obj_id}}],
+    }
+    assert mdb._asmbl_after_filter(mdb.DESC, mdb.DB_ID, after) == {
+        mdb.DB_ID: {'$lt': obj_id},
+    }
+
+
+def test_asmbl_after_filter_null():
+    obj_id = bson.ObjectId()
+    # nulls sort lowest, so going up all the non-nulls are still to come:
+    assert mdb._asmbl_after_filter(mdb.ASC, 'when', (None, str(obj_id))) == {
+        '$or': [{'when': None, mdb.DB_ID: {'$gt': obj_id}},
+                {'when': {'$ne': None}}],
+    }
+    # and going down, only nulls are:
+    assert mdb._asmbl_after_filter(mdb.DESC, 'when', (None, str(obj_id))) \
+        == {'when': None, mdb.DB_ID: {'$lt': obj_id}}
+    assert mdb._asmbl_after_filter(mdb.DESC, 'when', (3, str(obj_id))) == {
+        '$or': [{'when': {'$lt': 3}},
+                {'when': 3, mdb.DB_ID: {'$lt': obj_id}},
+                {'when': None}],
+    }
+
+
+def test_ensure_index():
+    with mock.patch.object(mdb, 'get_client') as mock_client:
+        mdb.MongoDB.ensure_index(None, 'db', 'clct', ['a', 'b'], unique=True)
+    mock_client()['db']['clct'].create_index.assert_called_once_with(
+        [('a', pymongo.ASCENDING), ('b', pymongo.ASCENDING)], unique=True)
+
+
+def test_upsert_many():
+    docs = [{'a': 1, 'b': 2}, {'a': 3, 'b': 4}]
+    with mock.patch.object(mdb, 'get_client') as mock_client:
+        mdb.MongoDB.upsert_many(None, 'db', 'clct', docs, ['a'])
+    ops = mock_client()['db']['clct'].bulk_write.call_args.args[0]
+    assert ops == [pymongo.UpdateOne({'a': 1}, {mdb.SET: docs[0]},
+                                     upsert=True),
+                   pymongo.UpdateOne({'a': 3}, {mdb.SET: docs[1]},
+                                     upsert=True)]
+
+
+def test_upsert_many_w_id():
+    docs = [{mdb.DB_ID: 'some_id', 'a': 1, 'b': 2}, {mdb.DB_ID: 'id2'}]
+    with mock.patch.object(mdb, 'get_client') as mock_client:
+        mdb.MongoDB.upsert_many(None, 'db', 'clct', docs, ['a'])
+    ops = mock_client()['db']['clct'].bulk_write.call_args.args[0]
+    # we can't $set the _id of a doc that is there:
+    assert ops[0] == pymongo.UpdateOne(
+        {'a': 1},
+        {mdb.SET: {'a': 1, 'b': 2},
+         mdb.SET_ON_INSERT: {mdb.DB_ID: 'some_id'}},
+        upsert=True)
+    assert ops[1] == pymongo.UpdateOne(
+        {'a': None},
+        {mdb.SET: {'a': None}, mdb.SET_ON_INSERT: {mdb.DB_ID: 'id2'}},
+        upsert=True)
+
+
+def test_get_pool_settings():
+    with mock.patch.dict(os.environ, {'MONGO_MAX_POOL_SIZE': '20',
+                                      'MONGO_MIN_POOL_SIZE': '2'}):
+        settings = mdb.get_pool_settings()
+    assert settings[mdb.MAX_POOL_SIZE] == 20
+    assert settings[mdb.MIN_POOL_SIZE] == 2
+
+
+def test_get_pool_settings_only_set():
+    with mock.patch.dict(os.environ, {'MONGO_MAX_POOL_SIZE': '20',
+                                      'MONGO_CONN_TIMEOUT': ''}):
+        with mock.patch.object(mdb, 'PA_MONGO', False):
+            assert mdb.get_pool_settings(only_set=True) == {
+                mdb.MAX_POOL_SIZE: 20}
+    with mock.patch.dict(os.environ, {'MONGO_MAX_POOL_SIZE': ''}):
+        with mock.patch.object(mdb, 'PA_MONGO', False):
+            assert mdb.MAX_POOL_SIZE not in mdb.get_pool_settings(
+                only_set=True)
+        with mock.patch.object(mdb, 'PA_MONGO', True):
+            assert mdb.get_pool_settings(only_set=True)[
+                mdb.MAX_POOL_SIZE] == mdb.PA_MAX_POOL_SIZE
+
+
+def test_get_pool_settings_bad_int():
+    with mock.patch.dict(os.environ, {'MONGO_MAX_POOL_SIZE': 'lots'}):
+        with pytest.raises(ValueError):
+            mdb.get_pool_settings()
+
+
+def test_get_pool_settings_min_over_max():
+    with mock.patch.dict(os.environ, {'MONGO_MAX_POOL_SIZE': '2',
+                                      'MONGO_MIN_POOL_SIZE': '20'}):
+        with pytest.raises(ValueError):
+            mdb.get_pool_settings()
+
+
+def test_drop_client():
+    old_client = mdb.MongoDB().client
+    mdb.drop_client()
+    assert mdb.get_client() is not old_client
+
+
 def test_init_mongo():
     assert isinstance(mdb.MongoDB(), mdb.MongoDB)
 
@@ -185,6 +336,13 @@ def test_select_no_filter(mobj, some_docs):
     assert len(recs) >= RECS_TO_TEST
 
 
+def test_stream(mobj, some_docs):
+    recs = list(mobj.stream(TEST_DB, TEST_COLLECT, no_id=True,
+                            batch_size=2))
+    assert len(recs) >= RECS_TO_TEST
+    assert mdb.DB_ID not in recs[0]
+
+
 def test_select_w_filter(mobj, some_docs):
     """
     This should return all records in a collection matching the
@@ -431,3 +589,14 @@ def test_create(mobj):
     recs = mobj.select(TEST_DB, TEST_COLLECT, filters={DEF_FLD: unique_val})
     assert len(recs) >= 1
     mobj.delete(TEST_DB, TEST_COLLECT, {DEF_FLD: unique_val})
+
+
+def test_insert_many(mobj):
+    unique_val = rand_fld_val()
+    docs = [{DEF_FLD: unique_val} for i in range(RECS_TO_TEST)]
+    ids = mobj.insert_many(TEST_DB, TEST_COLLECT, docs, ordered=False)
+    assert len(ids) == RECS_TO_TEST
+    assert all(mdb.is_valid_id(_id) for _id in ids)
+    recs = mobj.select(TEST_DB, TEST_COLLECT, filters={DEF_FLD: unique_val})
+    assert len(recs) == RECS_TO_TEST
+    mobj.delete_many(TEST_DB, TEST_COLLECT, {DEF_FLD: unique_val})
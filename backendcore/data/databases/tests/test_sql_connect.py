@@ -1,3 +1,7 @@
+import os
+import threading
+from unittest.mock import patch
+
 import pytest
 from icecream import ic
 
@@ -80,6 +84,54 @@ def test_connectDB(sqltobj):
     assert connection is not None
 
 
+def test_get_sqlite_pragmas():
+    pragmas = sql.get_sqlite_pragmas()
+    assert pragmas[sql.JOURNAL_MODE] == sql.DEF_JOURNAL_MODE
+    assert pragmas[sql.SYNCHRONOUS] == sql.DEF_SYNCHRONOUS
+    assert sql.JOURNAL_MODE not in sql.get_sqlite_pragmas(in_mem=True)
+    with patch.dict(os.environ, {'SQLITE_SYNCHRONOUS': 'full',
+                                 'SQLITE_CACHE_SIZE': '-2000'}):
+        pragmas = sql.get_sqlite_pragmas()
+    assert pragmas[sql.SYNCHRONOUS] == 'FULL'
+    assert pragmas[sql.CACHE_SIZE] == -2000
+    with patch.dict(os.environ, {'SQLITE_JOURNAL_MODE': 'wal; drop'}):
+        with pytest.raises(ValueError):
+            sql.get_sqlite_pragmas()
+
+
+def test_pragmas_set(sqltobj):
+    with sqltobj._get_engine().connect() as conn:
+        for pragma, val in sql.get_sqlite_pragmas(in_mem=True).items():
+            assert conn.exec_driver_sql(f'PRAGMA {pragma}').scalar() == val
+
+
+def test_mem_db_shared(sqltobj, table_with_docs):
+    """
+    Another thread should see the same in-memory DB.
+    """
+    res = []
+    thread = threading.Thread(
+        target=lambda: res.extend(sqltobj.read(TEST_DB,
+                                               table_with_docs.name)))
+    thread.start()
+    thread.join()
+    assert len(res) == len(TEST_DOCS)
+
+
+def test_mem_db_own_connections(sqltobj, table_with_docs):
+    """
+    Concurrent users get their own connections to the one DB, so their
+    transactions can't interleave.
+    """
+    engine = sqltobj._get_engine()
+    with engine.connect() as conn1, engine.connect() as conn2:
+        assert conn1.connection.dbapi_connection \
+            is not conn2.connection.dbapi_connection
+        stmt = sql.sqla.select(sql.sqla.func.count()).select_from(
+            table_with_docs)
+        assert conn2.execute(stmt).scalar() == len(TEST_DOCS)
+
+
 def test_create(sqltobj, empty_table):
     res = sqltobj.create(TEST_DB, empty_table.name, TEST_DOCS)
     assert res is not None
@@ -96,6 +148,337 @@ def test_read(sqltobj, table_with_docs):
     assert len(res) > 0
 
 
+def test_stream(sqltobj, table_with_docs):
+    res = list(sqltobj.stream(TEST_DB, table_with_docs.name, sort=sql.ASC,
+                              no_id=True, batch_size=2))
+    assert len(res) == len(TEST_DOCS)
+    assert sql.OBJ_ID_NM not in res[0]
+
+
+def test_read_proj(sqltobj, table_with_docs):
+    res = sqltobj.read(TEST_DB, table_with_docs.name, proj=['x'])
+    assert set(res[0]) == {sql.OBJ_ID_NM, 'x'}
+
+
+def test_read_exclude_flds(sqltobj, table_with_docs):
+    res = sqltobj.read(TEST_DB, table_with_docs.name, exclude_flds=['x'],
+                       no_id=True)
+    assert set(res[0]) == {'y'}
+
+
+def test_select_proj(sqltobj, table_with_docs):
+    res = sqltobj.select(TEST_DB, table_with_docs.name, filters={'x': 2},
+                         proj=['y'])
+    assert res == [{sql.OBJ_ID_NM: 1, 'y': 4}]
+
+
+def test_select_limit_skip(sqltobj, table_with_docs):
+    res = sqltobj.select(TEST_DB, table_with_docs.name, sort=sql.ASC,
+                         limit=2)
+    assert [rec[sql.OBJ_ID_NM] for rec in res] == [0, 1]
+    res = sqltobj.select(TEST_DB, table_with_docs.name, sort=sql.ASC,
+                         limit=2, skip=2)
+    assert [rec[sql.OBJ_ID_NM] for rec in res] == [2]
+
+
+def test_select_page(sqltobj, table_with_docs):
+    res = sqltobj.select_page(TEST_DB, table_with_docs.name, sort_fld='y',
+                              page_size=2)
+    assert [rec['y'] for rec in res] == [1, 4]
+    res = sqltobj.select_page(TEST_DB, table_with_docs.name, sort_fld='y',
+                              page_size=2, after=(4, 1))
+    assert [rec['y'] for rec in res] == [9]
+
+
+def test_select_page_desc(sqltobj, table_with_docs):
+    res = sqltobj.select_page(TEST_DB, table_with_docs.name, sort=sql.DESC,
+                              page_size=2, after=(None, 2))
+    assert [rec[sql.OBJ_ID_NM] for rec in res] == [1, 0]
+
+
+NULL_Y_IDS = [1, 4, 6, 8]
+NULL_SORT_DOCS = [{'_id': i, 'x': i, 'y': None if i in NULL_Y_IDS else 10 - i}
+                  for i in range(RECS_TO_TEST)]
+
+
+def page_ids(sqltobj, clct_nm, sort):
+    ids = []
+    after = None
+    while True:
+        res = sqltobj.select_page(TEST_DB, clct_nm, sort=sort, sort_fld='y',
+                                  page_size=3, after=after)
+        if not res:
+            return ids
+        ids += [rec[sql.OBJ_ID_NM] for rec in res]
+        after = (res[-1]['y'], res[-1][sql.OBJ_ID_NM])
+
+
+def test_select_page_null_sort_vals(sqltobj, empty_table):
+    sqltobj.create(TEST_DB, empty_table.name, NULL_SORT_DOCS)
+    # NULLs sort lowest, then ties go by id:
+    asc_ids = NULL_Y_IDS + [9, 7, 5, 3, 2, 0]
+    assert page_ids(sqltobj, empty_table.name, sql.ASC) == asc_ids
+    assert page_ids(sqltobj, empty_table.name, sql.DESC) == asc_ids[::-1]
+
+
+def test_count_documents(sqltobj, table_with_docs):
+    assert sqltobj.count_documents(TEST_DB,
+                                   table_with_docs.name) == len(TEST_DOCS)
+    assert sqltobj.count_documents(TEST_DB, table_with_docs.name,
+                                   filters={'x': 2}) == 1
+    assert sqltobj.count_documents(TEST_DB, 'no_such_table') == 0
+
+
+def test_exists(sqltobj, table_with_docs):
+    assert sqltobj.exists(TEST_DB, table_with_docs.name, filters={'x': 2})
+    assert not sqltobj.exists(TEST_DB, table_with_docs.name,
+                              filters={'x': 17})
+    assert not sqltobj.exists(TEST_DB, 'no_such_table')
+
+
+def index_nms(sqltobj, clct_nm):
+    inspector = sql.sqla.inspect(sqltobj._get_engine())
+    return [index['name'] for index in inspector.get_indexes(clct_nm)]
+
+
+def test_ensure_index(sqltobj, table_with_docs):
+    index_nm = sqltobj.ensure_index(TEST_DB, table_with_docs.name, ['x', 'y'])
+    # a second time does nothing:
+    assert sqltobj.ensure_index(TEST_DB, table_with_docs.name,
+                                ['x', 'y']) == index_nm
+    assert index_nm in index_nms(sqltobj, table_with_docs.name)
+    del sql.wanted_indexes[table_with_docs.name]
+
+
+def test_ensure_index_before_table(sqltobj):
+    clct_nm = 'index_first'
+    index_nm = sqltobj.ensure_index(TEST_DB, clct_nm, [NEW_FLD])
+    sqltobj.create(TEST_DB, clct_nm, {DEF_FLD: DEF_VAL})
+    # the column isn't there yet:
+    assert index_nm not in index_nms(sqltobj, clct_nm)
+    sqltobj.add_fld(TEST_DB, clct_nm, NEW_FLD, NEW_VAL)
+    assert index_nm in index_nms(sqltobj, clct_nm)
+    del sql.wanted_indexes[clct_nm]
+    sqltobj._clear_table(clct_nm)
+    sqltobj.get_collect(clct_nm).drop(sqltobj._get_engine())
+    sqltobj._clear_mdata()
+
+
+@pytest.fixture()
+def unique_x(sqltobj, table_with_docs):
+    sqltobj.ensure_index(TEST_DB, table_with_docs.name, ['x'], unique=True)
+    yield table_with_docs
+    del sql.wanted_indexes[table_with_docs.name]
+
+
+def test_upsert_native(sqltobj, unique_x):
+    with patch.object(sqltobj, '_upsert_by_read') as mock_by_read:
+        assert sqltobj.upsert(TEST_DB, unique_x.name, {'x': 2},
+                              {'y': 5}) == 1
+        new_id = sqltobj.upsert(TEST_DB, unique_x.name, {'x': 7}, {'y': 49})
+    mock_by_read.assert_not_called()
+    assert sqltobj.read_one(TEST_DB, unique_x.name, {'x': 2})['y'] == 5
+    assert sqltobj.read_one(TEST_DB, unique_x.name,
+                            {'x': 7})[sql.OBJ_ID_NM] == new_id
+
+
+def test_upsert_stale_schema(sqltobj, table_with_docs):
+    engine = sqltobj._get_engine()
+    with engine.connect() as stale_conn:
+        # this connection has read the schema before the index exists:
+        stale_conn.execute(table_with_docs.select()).all()
+        stale_conn.commit()
+        sqltobj.ensure_index(TEST_DB, table_with_docs.name, ['x'],
+                             unique=True)
+        stmt, _ = sqltobj._upsert_stmt(table_with_docs,
+                                       [{sql.OBJ_ID_NM: 7, 'x': 2, 'y': 5}],
+                                       ['x'], ['y'])
+        sql.execute_upsert(stale_conn, stmt)
+        stale_conn.commit()
+    del sql.wanted_indexes[table_with_docs.name]
+    assert sqltobj.read_one(TEST_DB, table_with_docs.name, {'x': 2})['y'] == 5
+
+
+def test_upsert_by_read(sqltobj, table_with_docs):
+    # no unique index on y:
+    assert sqltobj.upsert(TEST_DB, table_with_docs.name, {'y': 9},
+                          {'x': 30}) == 2
+    assert sqltobj.read_one(TEST_DB, table_with_docs.name,
+                            {'y': 9})['x'] == 30
+    sqltobj.upsert(TEST_DB, table_with_docs.name, {'y': 16}, {'x': 4})
+    assert sqltobj.read_one(TEST_DB, table_with_docs.name,
+                            {'y': 16})['x'] == 4
+
+
+def test_update_upsert(sqltobj, unique_x):
+    ret = sqltobj.update(TEST_DB, unique_x.name, {'x': 8}, {'y': 64},
+                         upsert=True)
+    assert ret.succeeded()
+    assert sqltobj.read_one(TEST_DB, unique_x.name, {'x': 8})['y'] == 64
+
+
+def test_upsert_many(sqltobj, unique_x):
+    docs = [{'x': 1, 'y': 100}, {'x': 4, 'y': 16}]
+    with patch.object(sqltobj, 'upsert') as mock_upsert:
+        ret = sqltobj.upsert_many(TEST_DB, unique_x.name, docs, ['x'])
+    mock_upsert.assert_not_called()
+    assert ret.mod_count() == len(docs)
+    assert sqltobj.count_documents(TEST_DB, unique_x.name) == 4
+    assert sqltobj.read_one(TEST_DB, unique_x.name, {'x': 1})['y'] == 100
+    # as Mongo does, count only the docs we changed:
+    docs = [{'x': 1, 'y': 100}, {'x': 2, 'y': 5}]
+    ret = sqltobj.upsert_many(TEST_DB, unique_x.name, docs, ['x'])
+    assert ret.mod_count() == 1
+    assert ret.match_count() == len(docs)
+
+
+def col_nms(sqltobj, clct_nm):
+    inspector = sql.sqla.inspect(sqltobj._get_engine())
+    return [col['name'] for col in inspector.get_columns(clct_nm)]
+
+
+def test_read_unknown_fld(sqltobj, table_with_docs):
+    assert sqltobj.read(TEST_DB, table_with_docs.name,
+                        filters={NEW_FLD: NEW_VAL}) == []
+    assert len(sqltobj.read(TEST_DB, table_with_docs.name,
+                            filters={NEW_FLD: None})) == len(TEST_DOCS)
+    assert len(sqltobj.read(TEST_DB, table_with_docs.name, sort=sql.ASC,
+                            sort_fld=NEW_FLD)) == len(TEST_DOCS)
+    # reads don't change the schema:
+    assert NEW_FLD not in col_nms(sqltobj, table_with_docs.name)
+
+
+def test_create_adds_cols(sqltobj, table_with_docs):
+    sqltobj.create(TEST_DB, table_with_docs.name,
+                   {'x': 4, DEF_FLD: DEF_VAL, NEW_FLD: None})
+    cols = col_nms(sqltobj, table_with_docs.name)
+    assert DEF_FLD in cols
+    assert NEW_FLD in cols
+    assert sqltobj.read_one(TEST_DB, table_with_docs.name,
+                            {'x': 4})[DEF_FLD] == DEF_VAL
+
+
+def test_read_col_added_elsewhere(sqltobj, table_with_docs):
+    # as if another process added the column:
+    with sqltobj._get_engine().begin() as conn:
+        conn.execute(sql.sqla.text(
+            f'alter table {table_with_docs.name} add column {DEF_FLD} '
+            + 'VARCHAR'))
+        conn.execute(sql.sqla.text(
+            f"update {table_with_docs.name} set {DEF_FLD} = '{DEF_VAL}'"))
+    sql.schema_checked_at.pop(table_with_docs.name, None)
+    res = sqltobj.read(TEST_DB, table_with_docs.name,
+                       filters={DEF_FLD: DEF_VAL})
+    assert len(res) == len(TEST_DOCS)
+
+
+def test_stmt_cache(sqltobj, table_with_docs):
+    sql.stmt_cache.clear()
+    for doc in TEST_DOCS:
+        res = sqltobj.read(TEST_DB, table_with_docs.name,
+                           filters={'x': doc['x']}, limit=5)
+        assert res == [doc]
+    # one shape, so one statement:
+    assert len(sql.stmt_cache) == 1
+    assert sqltobj.read(TEST_DB, table_with_docs.name,
+                        filters={'x': None}) == []
+    assert len(sql.stmt_cache) == 2
+
+
+def test_stmt_cache_write(sqltobj, table_with_docs):
+    sql.stmt_cache.clear()
+    sqltobj.update(TEST_DB, table_with_docs.name, {'x': 1}, {'y': 10})
+    sqltobj.update(TEST_DB, table_with_docs.name, {'x': 2}, {'y': 20})
+    assert len(sql.stmt_cache) == 1
+    assert sqltobj.read_one(TEST_DB, table_with_docs.name,
+                            {'x': 2})['y'] == 20
+    sqltobj.delete(TEST_DB, table_with_docs.name, {'x': 1})
+    sqltobj.delete(TEST_DB, table_with_docs.name, {'x': 2})
+    assert sqltobj.read(TEST_DB, table_with_docs.name) == [TEST_DOCS[2]]
+
+
+def test_stmt_cache_schema_change(sqltobj, table_with_docs):
+    sqltobj.read(TEST_DB, table_with_docs.name, filters={'x': 1})
+    assert sql.stmt_cache
+    sqltobj.add_fld(TEST_DB, table_with_docs.name, NEW_FLD, NEW_VAL)
+    assert not sql.stmt_cache
+
+
+def ids_for(sqltobj, clct_nm, filters) -> list:
+    return sorted(rec['_id'] for rec in sqltobj.read(TEST_DB, clct_nm,
+                                                     filters=filters))
+
+
+@pytest.mark.parametrize('filters, ids', [
+    ({'x': {'$gt': 1}}, [1, 2]),
+    ({'x': {'$gte': 2, '$lt': 3}}, [1]),
+    ({'x': {'$lte': 2}}, [0, 1]),
+    ({'x': {'$ne': 2}}, [0, 2]),
+    ({'x': {'$in': [1, 3]}}, [0, 2]),
+    ({'x': {'$nin': [1, 3]}}, [1]),
+    ({'x': {'$exists': True}}, [0, 1, 2]),
+    ({'x': {'$exists': False}}, []),
+    ({'$or': [{'x': 1}, {'y': 9}]}, [0, 2]),
+    ({'$and': [{'x': {'$gt': 1}}, {'y': {'$lt': 9}}]}, [1]),
+    ({'x': {'$gt': 1}, '$or': [{'y': 4}, {'y': 1}]}, [1]),
+])
+def test_filter_ops(sqltobj, table_with_docs, filters, ids):
+    assert ids_for(sqltobj, table_with_docs.name, filters) == ids
+
+
+def test_filter_ops_unknown_fld(sqltobj, table_with_docs):
+    """
+    A field with no column is missing from every row.
+    """
+    all_ids = [doc['_id'] for doc in TEST_DOCS]
+    clct_nm = table_with_docs.name
+    assert ids_for(sqltobj, clct_nm, {NEW_FLD: {'$gt': 1}}) == []
+    assert ids_for(sqltobj, clct_nm, {NEW_FLD: {'$ne': 1}}) == all_ids
+    assert ids_for(sqltobj, clct_nm, {NEW_FLD: {'$exists': False}}) == all_ids
+    assert ids_for(sqltobj, clct_nm, {NEW_FLD: {'$in': [None]}}) == all_ids
+    assert ids_for(sqltobj, clct_nm,
+                   {'$or': [{NEW_FLD: 1}, {'x': 1}]}) == [0]
+    assert NEW_FLD not in col_nms(sqltobj, clct_nm)
+
+
+def test_filter_ops_nulls(sqltobj, table_with_docs):
+    sqltobj.create(TEST_DB, table_with_docs.name,
+                   {'_id': 3, 'x': None, DEF_FLD: 'Abc'})
+    clct_nm = table_with_docs.name
+    assert ids_for(sqltobj, clct_nm, {'x': {'$ne': 1}}) == [1, 2, 3]
+    assert ids_for(sqltobj, clct_nm, {'x': {'$nin': [1]}}) == [1, 2, 3]
+    assert ids_for(sqltobj, clct_nm, {'x': {'$nin': [1, None]}}) == [1, 2]
+    assert ids_for(sqltobj, clct_nm, {'x': {'$in': [1, None]}}) == [0, 3]
+    assert ids_for(sqltobj, clct_nm, {'x': {'$exists': False}}) == [3]
+    assert ids_for(sqltobj, clct_nm,
+                   {DEF_FLD: {'$regex': '^a', '$options': 'i'}}) == [3]
+    assert ids_for(sqltobj, clct_nm, {DEF_FLD: {'$regex': '^a'}}) == []
+
+
+def test_filter_ops_write(sqltobj, table_with_docs):
+    clct_nm = table_with_docs.name
+    sqltobj.update(TEST_DB, clct_nm, {'x': {'$gte': 3}}, {'y': 0})
+    assert sqltobj.read_one(TEST_DB, clct_nm, {'x': 3})['y'] == 0
+    assert sqltobj.count_documents(TEST_DB, clct_nm,
+                                   {'y': {'$in': [0, 1]}}) == 2
+    sqltobj.delete_many(TEST_DB, clct_nm, {'x': {'$lt': 3}})
+    assert ids_for(sqltobj, clct_nm, {}) == [2]
+
+
+def test_filter_bad_op(sqltobj, table_with_docs):
+    with pytest.raises(ValueError):
+        sqltobj.read(TEST_DB, table_with_docs.name,
+                     filters={'x': {'$near': 1}})
+
+
+def test_create_filters(sqltobj, table_with_docs):
+    filters = sqltobj.create_or_filter(
+        sqltobj.create_in_filter('x', [1, 2]),
+        sqltobj.create_and_filter(sqltobj.create_exists_filter('y'),
+                                  {'y': 9}))
+    assert ids_for(sqltobj, table_with_docs.name, filters) == [0, 1, 2]
+
+
 def test_read_sorted_ascending(sqltobj, table_with_docs):
     res = sqltobj.read(TEST_DB, table_with_docs.name, sort=sql.ASC)
     assert res is not None
@@ -166,3 +549,15 @@ def test_read_with_limit(sqltobj, table_with_docs):
     res = sqltobj.read(TEST_DB, table_with_docs.name, limit=LIMIT)
     assert res is not None
     assert len(res) == LIMIT
+
+
+def test_insert_many(sqltobj, empty_table):
+    docs = [{'x': 4, 'y': 16}, {'x': 5}]
+    ids = sqltobj.insert_many(TEST_DB, empty_table.name, docs)
+    assert len(ids) == len(docs)
+    res = sqltobj.read(TEST_DB, empty_table.name)
+    assert len(res) == len(docs)
+
+
+def test_insert_many_empty(sqltobj, empty_table):
+    assert sqltobj.insert_many(TEST_DB, empty_table.name, []) == []
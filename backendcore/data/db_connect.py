@@ -1,13 +1,23 @@
 """
 This is the interface to our database, whatever our database may be.
 """
+import asyncio
+import base64
+import binascii
+import contextvars
+import inspect
+import json
 import os
+import random
+import threading
+import time
 from functools import wraps
 
 import backendcore.common.time_fmts as tfmt
 import backendcore.data.databases.mongo_connect as mdb
 import backendcore.data.databases.sql_connect as sdb
 
+from backendcore.common.constants import OBJ_ID_NM
 # For now, get the following from mongo:
 from backendcore.data.databases.mongo_connect import (  # noqa F401
     DATE,
@@ -56,12 +66,24 @@ LISTS_IN_DB_DICT = {
 # DB messages:
 DUP = "Can't add duplicate"
 
-# For now database is a global singleton.
-# Maybe one day we will need a... database per thread? I dunno.
-database = None
 db_type = os.environ.get('DATABASE', MONGO)
 
+# How many times we try a DB call that fails with a transient error:
 MAX_CONNECT_RETRIES = 2
+# We back off exponentially (with jitter) between tries:
+RETRY_BASE_SECS = 0.1
+RETRY_MAX_SECS = 2.0
+
+# After this many transient failures in a row, we fail fast...
+BREAKER_MAX_FAILURES = 5
+# ... for this long, before trying the DB again:
+BREAKER_RESET_SECS = 30.0
+
+# How many docs we send to the DB at once in bulk operations:
+DEF_CHUNK_SIZE = 1000
+# How many docs a streaming read fetches at once:
+DEF_BATCH_SIZE = 1000
+DEF_PAGE_SIZE = 100
 
 
 def setup_connection(db_nm: str):
@@ -75,37 +97,246 @@ def get_db(db_type):
     Sets up connection to appropriate DB.
     """
     db = None
-    print(f'{db_type=}')
     if db_type == MONGO:
         local = os.environ.get("LOCAL_MONGO", REMOTE) == LOCAL
         db = mdb.MongoDB(local_db=local)
     else:
         db = sdb.SqlDB(variant=db_type)
-    print(f'{db=}')
     os.environ[LISTS_IN_DB] = LISTS_IN_DB_DICT[db_type]
     os.environ[NO_LISTS_REASON] = "DB does not support lists as values"
     return db
 
 
+class ConnectionManager(object):
+    """
+    Hands out the process's DB handle.
+    A handle wraps the process's one client (Mongo) or engine (SQL), and
+    so its connection pool: those are thread-safe, so every thread (and
+    asyncio task) shares the one handle. What is really per call, such as
+    whether we are retrying (see in_db_call), is kept in context
+    variables instead.
+    """
+    def __init__(self, db_type, make_db=None):
+        self.db_type = db_type
+        # how we make a handle: get_db() unless told otherwise
+        self.make_db = make_db if make_db else get_db
+        self.handle = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        handle = self.handle
+        if handle is None:
+            with self.lock:
+                if self.handle is None:
+                    self.handle = self.make_db(self.db_type)
+                handle = self.handle
+        return handle
+
+    def reset(self):
+        """
+        Drops the handle: the next get() makes a new one.
+        """
+        self.handle = None
+
+    def after_fork(self):
+        """
+        A forked child can't use its parent's sockets: drop the pools,
+        and the handle over them.
+        (mongo_connect drops its own client.)
+        """
+        # another thread may have held the lock when we forked:
+        self.lock = threading.Lock()
+        sdb.dispose_engine()
+        self.reset()
+
+
+connections = ConnectionManager(db_type)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=connections.after_fork)
+
+
+class DatabaseProxy(object):
+    """
+    Stands in for the DB handle, so `database.read()` etc. work as they
+    did when there was a single global database, but we connect lazily.
+    """
+    def __init__(self, connections):
+        self.connections = connections
+
+    def __getattr__(self, attr):
+        return getattr(self.connections.get(), attr)
+
+
+database = DatabaseProxy(connections)
+
+
+def init_app(app):
+    """
+    Sets up a Flask app's DB use.
+    We don't connect here: under a pre-fork server that would happen
+    before the fork.
+    """
+    app.extensions['db_connections'] = connections
+
+    # so each process makes the declared indexes once it is serving:
+    # this only starts a thread, so no request waits on an index build.
+    @app.before_request
+    def make_indexes():
+        ensure_indexes_in_background()
+
+    return app
+
+
+class DBUnavailable(ConnectionError):
+    """
+    Raised, without trying the DB, while the circuit breaker is open.
+    """
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    Fails fast while the DB is down, rather than have every call wait
+    out its retries.
+    After `max_failures` transient failures in a row we "open", and
+    refuse calls for `reset_secs`: then we let a call through to test
+    the DB. If it fails, we open again.
+    """
+    def __init__(self, max_failures=BREAKER_MAX_FAILURES,
+                 reset_secs=BREAKER_RESET_SECS):
+        self.max_failures = max_failures
+        self.reset_secs = reset_secs
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def check(self):
+        if self.opened_at is None:
+            return
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_secs:
+                raise DBUnavailable('Database is down: failing fast.')
+            # let this call test the DB, but hold off the rest:
+            self.opened_at = time.monotonic()
+
+    def succeeded(self):
+        if self.failures or self.opened_at is not None:
+            with self.lock:
+                self.failures = 0
+                self.opened_at = None
+
+    def failed(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker()
+
+
+def is_transient(err: Exception) -> bool:
+    """
+    Is this an error that retrying might fix?
+    Bad filters, duplicate keys, and the like are not!
+    Nor is the breaker being open: it stays open a while.
+    """
+    if isinstance(err, DBUnavailable):
+        return False
+    return (isinstance(err, (ConnectionError, TimeoutError))
+            or isinstance(err, mdb.TRANSIENT_ERRORS)
+            or sdb.is_transient(err))
+
+
+def retry_delay(attempt: int) -> float:
+    """
+    Exponential backoff with "full jitter", so clients that failed
+    together don't all retry together.
+    """
+    return random.uniform(0, min(RETRY_MAX_SECS,
+                                 RETRY_BASE_SECS * 2 ** attempt))
+
+
+# Are we inside a needs_db call? Then it does the retrying.
+in_db_call = contextvars.ContextVar('in_db_call', default=False)
+
+
+def _retry_delay_or_raise(err: Exception, attempt: int) -> float:
+    """
+    What needs_db does when a try fails: re-raise errors retrying won't
+    fix, else count the failure and return how long to wait before the
+    next try.
+    """
+    if not is_transient(err):
+        raise err
+    print(f"Connection Error: {err}, trying to re-connect")
+    breaker.failed()
+    if breaker.is_open():
+        raise DBUnavailable('Database is down: failing fast.') from err
+    if attempt == MAX_CONNECT_RETRIES - 1:
+        raise ConnectionError("Failed to connect to database") from err
+    return retry_delay(attempt)
+
+
 def needs_db(fn):
     """
     Should be used to decorate any function that directly uses the DB.
     Functions that call functions that use the DB don't need this
     decorator.
-    """
+    We retry transient errors: other errors are the caller's, and go
+    straight back to them.
+    When one needs_db function calls another, only the outer one
+    retries, and the breaker hears of each failure once.
+    We keep our handle when we retry: the client or engine's pool
+    replaces bad connections itself.
+    Coroutine functions get the same policy, but back off without
+    blocking the event loop.
+    """
+    if inspect.iscoroutinefunction(fn):
+        return _needs_db_async(fn)
+
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        global database
-        if not database:
-            database = get_db(db_type)
-        for i in range(MAX_CONNECT_RETRIES):
-            try:
-                return fn(*args, **kwargs)
-            except Exception as e:
-                print(f"Connection Error: {e}, trying to re-connect")
-                if i != MAX_CONNECT_RETRIES - 1:
-                    database = get_db(db_type)
-        raise ConnectionError("Failed to connect to database")
+        if in_db_call.get():
+            return fn(*args, **kwargs)
+        breaker.check()
+        token = in_db_call.set(True)
+        try:
+            for attempt in range(MAX_CONNECT_RETRIES):
+                try:
+                    ret = fn(*args, **kwargs)
+                    breaker.succeeded()
+                    return ret
+                except Exception as e:
+                    time.sleep(_retry_delay_or_raise(e, attempt))
+        finally:
+            in_db_call.reset(token)
+
+    return wrapper
+
+
+def _needs_db_async(fn):
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        if in_db_call.get():
+            return await fn(*args, **kwargs)
+        breaker.check()
+        token = in_db_call.set(True)
+        try:
+            for attempt in range(MAX_CONNECT_RETRIES):
+                try:
+                    ret = await fn(*args, **kwargs)
+                    breaker.succeeded()
+                    return ret
+                except Exception as e:
+                    await asyncio.sleep(_retry_delay_or_raise(e, attempt))
+        finally:
+            in_db_call.reset(token)
 
     return wrapper
 
@@ -147,20 +378,24 @@ def create_id_filter(_id: str):
     return database.create_id_filter(_id)
 
 
-# def create_in_filter(fld_nm: str, values: list):
-#     return {fld_nm: {'$in': values}}
+@needs_db
+def create_in_filter(fld_nm: str, values: list):
+    return database.create_in_filter(fld_nm, values)
 
 
-# def create_exists_filter(fld_nm: str, predicate: bool = True):
-#     return {fld_nm: {'$exists': predicate}}
+@needs_db
+def create_exists_filter(fld_nm: str, predicate: bool = True):
+    return database.create_exists_filter(fld_nm, predicate)
 
 
-# def create_or_filter(filt1: dict, filt2: dict):
-#     return {'$or': [filt1, filt2]}
+@needs_db
+def create_or_filter(filt1: dict, filt2: dict):
+    return database.create_or_filter(filt1, filt2)
 
 
-# def create_and_filter(filt1: dict, filt2: dict):
-#     return {'$and': [filt1, filt2]}
+@needs_db
+def create_and_filter(filt1: dict, filt2: dict):
+    return database.create_and_filter(filt1, filt2)
 
 
 @needs_db
@@ -230,9 +465,13 @@ def read(
     no_id: bool = False,
     limit: int = None,
     filters: dict = {},
+    proj: list = NO_PROJ,
+    exclude_flds: list = None,
 ):
-    if not database:
-        raise ValueError('No database is connected')
+    """
+    `proj` lists the only fields to read; `exclude_flds` fields not to
+    read. Either way, the DB leaves the other fields behind.
+    """
     return database.read(
         db_nm,
         clct_nm,
@@ -241,35 +480,77 @@ def read(
         no_id=no_id,
         limit=limit,
         filters=filters,
+        proj=proj,
+        exclude_flds=exclude_flds,
     )
 
 
 @needs_db
 def fetch_all(db_nm, clct_nm, sort=NO_SORT, sort_fld=None,
-              no_id=False):
+              no_id=False, proj=NO_PROJ, exclude_flds=None):
     return read(db_nm, clct_nm, sort=sort,
-                sort_fld=sort_fld, no_id=no_id)
+                sort_fld=sort_fld, no_id=no_id,
+                proj=proj, exclude_flds=exclude_flds)
 
 
 @needs_db
 def select_cursor(db_nm, clct_nm, filters={}, sort=NO_SORT,
-                  sort_fld='_id', proj=NO_PROJ, limit=MAX_DB_INT):
+                  sort_fld='_id', proj=NO_PROJ, limit=MAX_DB_INT, skip=0,
+                  exclude_flds=None):
     """
     A select that directly returns the db cursor.
+    `skip` is how many matching docs to pass over first.
+    Use `doc_to_rec()` on what the cursor returns.
     """
     return database.select_cursor(db_nm, clct_nm,
                                   filters=filters,
                                   sort=sort,
                                   sort_fld=sort_fld,
                                   proj=proj,
-                                  limit=limit)
+                                  limit=limit,
+                                  skip=skip,
+                                  exclude_flds=exclude_flds)
+
+
+@needs_db
+def doc_to_rec(doc, no_id=False) -> dict:
+    """
+    Turns a doc from a cursor into the record our reads return.
+    """
+    return database.doc_to_rec(doc, no_id=no_id)
+
+
+def stream(db_nm, clct_nm, filters={}, sort=NO_SORT, sort_fld='_id',
+           no_id=False, proj=NO_PROJ, exclude_flds=None,
+           batch_size=DEF_BATCH_SIZE):
+    """
+    A generator over the records matching filters, for reads too big to
+    hold in memory at once: the DB sends them `batch_size` at a time.
+    We can't retry a read part way through, as the caller has already
+    seen some of the records, so errors go straight to the caller.
+    """
+    if batch_size < 1:
+        raise ValueError(f'Bad {batch_size=}')
+    breaker.check()
+    yield from database.stream(db_nm, clct_nm,
+                               filters=filters,
+                               sort=sort,
+                               sort_fld=sort_fld,
+                               no_id=no_id,
+                               proj=proj,
+                               exclude_flds=exclude_flds,
+                               batch_size=batch_size)
 
 
 @needs_db
 def select(db_nm, clct_nm, filters={}, sort=NO_SORT, sort_fld='_id',
-           proj=NO_PROJ, limit=DOC_LIMIT, no_id=False, exclude_flds=None):
+           proj=NO_PROJ, limit=DOC_LIMIT, no_id=False, exclude_flds=None,
+           skip=0):
     """
     Select records from a collection matching filters.
+    `limit` and `skip` are done by the DB, so we only read that page.
+    A large `skip` still has the DB walk past the skipped records: to
+    page deep into a big collection, use select_page().
     """
     return database.select(db_nm, clct_nm,
                            filters=filters,
@@ -278,14 +559,189 @@ def select(db_nm, clct_nm, filters={}, sort=NO_SORT, sort_fld='_id',
                            proj=proj,
                            limit=limit,
                            no_id=no_id,
-                           exclude_flds=exclude_flds)
+                           exclude_flds=exclude_flds,
+                           skip=skip)
 
 
-# def count_documents(db_nm, clct_nm, filters={}):
-#     """
-#     Counts the documents in a collection, with an optional filter applied.
-#     """
-#     return database[db_nm][clct_nm].count_documents(filters)
+def encode_page_token(rec: dict, sort_fld: str = OBJ_ID_NM) -> str:
+    """
+    A page token marks where a page ended: the sort value and id of its
+    last record. It is opaque to callers, and safe to put in a URL.
+    """
+    after = [rec.get(sort_fld), rec[OBJ_ID_NM]]
+    return base64.urlsafe_b64encode(json.dumps(after).encode()).decode()
+
+
+def decode_page_token(page_token: str) -> tuple:
+    try:
+        sort_val, _id = json.loads(base64.urlsafe_b64decode(page_token))
+    except (binascii.Error, TypeError, ValueError):
+        raise ValueError(f'Bad {page_token=}')
+    return sort_val, _id
+
+
+@needs_db
+def _select_page(db_nm, clct_nm, filters, sort, sort_fld, page_size, after,
+                 proj, exclude_flds):
+    return database.select_page(db_nm, clct_nm,
+                                filters=filters,
+                                sort=sort,
+                                sort_fld=sort_fld,
+                                page_size=page_size,
+                                after=after,
+                                proj=proj,
+                                exclude_flds=exclude_flds)
+
+
+def select_page(db_nm, clct_nm, filters={}, sort=ASC, sort_fld=OBJ_ID_NM,
+                page_size=DEF_PAGE_SIZE, page_token=None, no_id=False,
+                proj=NO_PROJ, exclude_flds=None):
+    """
+    Keyset pagination: returns one page of the records matching filters
+    and a token for the next page (None on the last page).
+    Pass the token back to get the next page: the DB seeks straight to
+    it, so each page costs the same however deep we are.
+    For the pages to be stable, `sort_fld` should not change under us.
+    """
+    if page_size < 1:
+        raise ValueError(f'Bad {page_size=}')
+    after = None
+    if page_token is not None:
+        after = decode_page_token(page_token)
+    # we need the sort value and id of the last record to make the token:
+    key_flds = [OBJ_ID_NM, sort_fld]
+    drop_flds = set()
+    if no_id:
+        drop_flds.add(OBJ_ID_NM)
+    if proj and sort_fld not in proj:
+        proj = list(proj) + [sort_fld]
+        drop_flds.add(sort_fld)
+    if exclude_flds:
+        drop_flds.update(fld for fld in key_flds if fld in exclude_flds)
+        exclude_flds = [fld for fld in exclude_flds if fld not in key_flds]
+    # one extra record tells us if there is a next page:
+    recs = _select_page(db_nm, clct_nm, filters, sort, sort_fld,
+                        page_size + 1, after, proj, exclude_flds)
+    next_token = None
+    if len(recs) > page_size:
+        recs = recs[:page_size]
+        next_token = encode_page_token(recs[-1], sort_fld)
+    for rec in recs:
+        for fld in drop_flds:
+            rec.pop(fld, None)
+    return recs, next_token
+
+
+@needs_db
+def count_documents(db_nm, clct_nm, filters={}) -> int:
+    """
+    Counts the documents in a collection, with an optional filter applied.
+    The DB does the counting: no records come back to us.
+    """
+    return database.count_documents(db_nm, clct_nm, filters=filters)
+
+
+@needs_db
+def exists(db_nm, clct_nm, filters={}) -> bool:
+    """
+    Does any record meet filters?
+    Cheaper than read_one() when we don't need the record itself.
+    """
+    return database.exists(db_nm, clct_nm, filters=filters)
+
+
+# The indexes our modules' hot queries need, as
+# (db_nm, clct_nm, flds, unique) tuples:
+declared_indexes = []
+indexes_ensured = False
+index_lock = threading.Lock()
+# The thread making them, and how long it waits to try again when the DB
+# is down:
+index_thread = None
+index_thread_lock = threading.Lock()
+INDEX_RETRY_SECS = 60
+
+
+def declare_index(db_nm: str, clct_nm: str, flds: list, unique=False):
+    """
+    Modules declare the indexes they need when they load, and
+    ensure_indexes() makes them.
+    """
+    global indexes_ensured
+    if not flds:
+        raise ValueError(f'No fields to index {clct_nm} on.')
+    index = (db_nm, clct_nm, tuple(flds), unique)
+    with index_lock:
+        if index not in declared_indexes:
+            declared_indexes.append(index)
+            indexes_ensured = False
+
+
+@needs_db
+def ensure_index(db_nm: str, clct_nm: str, flds: list, unique=False):
+    """
+    Creates an index on flds, in that order, if there isn't one.
+    Returns the index name.
+    """
+    if not flds:
+        raise ValueError(f'No fields to index {clct_nm} on.')
+    return database.ensure_index(db_nm, clct_nm, list(flds), unique=unique)
+
+
+def ensure_indexes() -> list:
+    """
+    Makes any declared index that isn't there yet: cheap to call again.
+    We report failures rather than raise them, as we can run without an
+    index, just slower. If the DB was down, we try again on the next
+    call; other failures (e.g., a unique index over duplicate values)
+    won't fix themselves, so we give up on that index.
+    Returns the names of the indexes ensured.
+    """
+    global indexes_ensured
+    if indexes_ensured:
+        return []
+    with index_lock:
+        if indexes_ensured:
+            return []
+        names = []
+        ok = True
+        for db_nm, clct_nm, flds, unique in list(declared_indexes):
+            try:
+                names.append(ensure_index(db_nm, clct_nm, flds,
+                                          unique=unique))
+            except Exception as e:
+                print(f'Failed to index {clct_nm} on {flds}: {e}')
+                if is_transient(e):
+                    ok = False
+                else:
+                    declared_indexes.remove((db_nm, clct_nm, flds, unique))
+        indexes_ensured = ok
+        return names
+
+
+def _make_indexes():
+    while not indexes_ensured:
+        ensure_indexes()
+        if not indexes_ensured:
+            time.sleep(INDEX_RETRY_SECS)
+
+
+def ensure_indexes_in_background():
+    """
+    Runs ensure_indexes() on a daemon thread, trying again until the DB
+    lets it finish. Cheap to call again: we start at most one thread
+    per process.
+    """
+    global index_thread
+    if indexes_ensured:
+        return
+    with index_thread_lock:
+        # a thread from before a fork is not alive in the child
+        if index_thread is None or not index_thread.is_alive():
+            index_thread = threading.Thread(target=_make_indexes,
+                                            name='ensure_indexes',
+                                            daemon=True)
+            index_thread.start()
 
 
 @needs_db
@@ -311,6 +767,30 @@ def insert_doc(db_nm: str, clct_nm: str, doc: dict, with_date=False):
     return create(db_nm, clct_nm, doc, with_date=with_date)
 
 
+@needs_db
+def _insert_chunk(db_nm: str, clct_nm: str, docs: list, ordered=True):
+    return database.insert_many(db_nm, clct_nm, docs, ordered=ordered)
+
+
+def insert_many(db_nm: str, clct_nm: str, docs: list, ordered=True,
+                chunk_size=DEF_CHUNK_SIZE, with_date=False):
+    """
+    Inserts docs in batches of `chunk_size`: one round trip per batch.
+    If `ordered`, we stop at the first failure.
+    Returns the list of inserted IDs.
+    """
+    if chunk_size < 1:
+        raise ValueError(f'Bad {chunk_size=}')
+    if with_date:
+        for doc in docs:
+            doc[DATE] = str(tfmt.today())
+    ids = []
+    for i in range(0, len(docs), chunk_size):
+        ids.extend(_insert_chunk(db_nm, clct_nm, docs[i:i + chunk_size],
+                                 ordered=ordered))
+    return ids
+
+
 @needs_db
 def add_fld_to_all(db_nm, clct_nm, new_fld, value):
     return database.add_fld_to_all(db_nm, clct_nm, new_fld, value)
@@ -362,6 +842,31 @@ def upsert_doc(db_nm, clct_nm, filters, update_dict):
     return upsert(db_nm, clct_nm, filters, update_dict)
 
 
+@needs_db
+def _upsert_chunk(db_nm: str, clct_nm: str, docs: list, key_flds: list):
+    return database.upsert_many(db_nm, clct_nm, docs, key_flds)
+
+
+def upsert_many(db_nm: str, clct_nm: str, docs: list, key_flds: list,
+                chunk_size=DEF_CHUNK_SIZE) -> int:
+    """
+    Upserts docs in batches of `chunk_size`, matching each doc on its
+    `key_flds`: one round trip per batch.
+    Returns how many docs were inserted or changed (see the drivers'
+    upsert_many() for when SQL can't tell).
+    """
+    if chunk_size < 1:
+        raise ValueError(f'Bad {chunk_size=}')
+    if not key_flds:
+        raise ValueError(f'No key fields to upsert {clct_nm} on.')
+    num_written = 0
+    for i in range(0, len(docs), chunk_size):
+        ret = _upsert_chunk(db_nm, clct_nm, docs[i:i + chunk_size],
+                            key_flds)
+        num_written += num_updated(ret)
+    return num_written
+
+
 def update_success(update_obj):
     return update_obj.succeeded()
 
@@ -5,6 +5,7 @@ The actual caches appear in the modules dealing with the relevant data entity.
 import re
 import warnings
 from copy import deepcopy
+from functools import lru_cache
 
 import backendcore.data.db_connect as dbc
 
@@ -13,6 +14,10 @@ from backendcore.common.constants import (
     NAME,
 )
 
+REGEX_CACHE_SIZE = 256
+NGRAM_LEN = 3
+REGEX_SPECIAL_CHARS = set('.^$*+?{}[]\\|()')
+
 
 def fetch_list(db_nm: str, collect_nm: str, sort_fld=NAME):
     """
@@ -77,15 +82,153 @@ def delete_by_code(db_nm: str, collect_nm: str, code: str, code_nm=CODE):
     return dbc.del_one(db_nm, collect_nm, {code_nm: code})
 
 
+@lru_cache(maxsize=REGEX_CACHE_SIZE)
+def compile_regex(pattern: str, flags=re.IGNORECASE):
+    """
+    Compiled regexes, with the most recently used ones kept around.
+    """
+    return re.compile(pattern, flags)
+
+
+def is_literal(pattern: str) -> bool:
+    """
+    Does pattern match just itself?
+    """
+    return not (set(pattern) & REGEX_SPECIAL_CHARS)
+
+
+def ngrams(text: str, n: int = NGRAM_LEN) -> set:
+    text = text.lower()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class NgramIndex(object):
+    """
+    An n-gram index over some string fields of a set of records.
+    It lets a search for a literal string skip the records
+    that can't possibly contain it.
+    Once readers may be using an index, change a copy() of it instead.
+    """
+    def __init__(self, flds: list, n: int = NGRAM_LEN):
+        self.n = n
+        # fld_nm -> ngram -> {key: None}
+        self.postings = {fld_nm: {} for fld_nm in flds}
+        # the (fld_nm, ngram) key sets this index doesn't share:
+        self.owned = None
+
+    def copy(self):
+        """
+        A copy we can change without disturbing readers of this one.
+        Key sets are shared until the copy changes them.
+        """
+        new_index = NgramIndex([], self.n)
+        new_index.postings = {fld_nm: dict(postings)
+                              for fld_nm, postings in self.postings.items()}
+        new_index.owned = set()
+        return new_index
+
+    def _keys(self, fld_nm: str, gram: str) -> dict:
+        postings = self.postings[fld_nm]
+        keys = postings.get(gram)
+        if self.owned is not None and (fld_nm, gram) not in self.owned:
+            keys = dict(keys) if keys is not None else {}
+            postings[gram] = keys
+            self.owned.add((fld_nm, gram))
+        elif keys is None:
+            keys = postings[gram] = {}
+        return keys
+
+    def add(self, key, rec: dict):
+        for fld_nm in self.postings:
+            val = rec.get(fld_nm)
+            if isinstance(val, str):
+                for gram in ngrams(val, self.n):
+                    self._keys(fld_nm, gram)[key] = None
+
+    def remove(self, key, rec: dict):
+        for fld_nm, postings in self.postings.items():
+            val = rec.get(fld_nm)
+            if isinstance(val, str):
+                for gram in ngrams(val, self.n):
+                    if gram in postings:
+                        keys = self._keys(fld_nm, gram)
+                        keys.pop(key, None)
+                        if not keys:
+                            del postings[gram]
+
+    def candidates(self, fld_nm: str, pattern: str):
+        """
+        The keys of the records that might match pattern in fld_nm,
+        or None if we can't narrow them down.
+        """
+        if fld_nm not in self.postings:
+            return None
+        if not is_literal(pattern) or len(pattern) < self.n:
+            return None
+        keys = None
+        for gram in ngrams(pattern, self.n):
+            gram_keys = self.postings[fld_nm].get(gram, {})
+            if keys is None:
+                keys = set(gram_keys)
+            else:
+                keys &= gram_keys.keys()
+            if not keys:
+                break
+        return keys
+
+
+class SearchEngine(object):
+    """
+    Runs case-insensitive regex searches over a dict of records.
+    Patterns are compiled once, and, if we have an n-gram index,
+    it prunes the records we run the regexes over.
+    """
+    def __init__(self, ngram_index: NgramIndex = None):
+        self.ngram_index = ngram_index
+
+    def candidates(self, fld_dict: dict, data: dict) -> dict:
+        """
+        The records in data that the n-gram index can't rule out.
+        """
+        if self.ngram_index is None:
+            return data
+        keys = None
+        for fld_nm, srch in fld_dict.items():
+            if not srch:
+                continue
+            fld_keys = self.ngram_index.candidates(fld_nm, srch)
+            if fld_keys is not None:
+                keys = fld_keys if keys is None else keys & fld_keys
+        if keys is None:
+            return data
+        return {key: data[key] for key in data if key in keys}
+
+    def search(self, fld_dict: dict, data: dict) -> dict:
+        """
+        Returns the records in data that match every search in fld_dict.
+        """
+        patterns = {fld_nm: srch if srch else ""
+                    for fld_nm, srch in fld_dict.items()}
+        regexes = [(fld_nm, compile_regex(srch))
+                   for fld_nm, srch in patterns.items()]
+        matches = {}
+        for key, rec in self.candidates(patterns, data).items():
+            for fld_nm, regex in regexes:
+                if not regex.search(rec.get(fld_nm, '')):
+                    break
+            else:
+                matches[key] = rec
+        return matches
+
+
+search_engine = SearchEngine()
+
+
 def regex_search(fld_nm: str, val: str, data: dict):
     """
     We can add consider case later, if we need to.
     """
-    matches = {}
-    for key, rec in data.items():
-        if re.search(val, rec.get(fld_nm, ''), re.IGNORECASE):
-            matches[key] = rec
-    return matches
+    return search_engine.search({fld_nm: val}, data)
 
 
 def regex_intersect_search(fld_dict, data):
@@ -95,17 +238,7 @@ def regex_intersect_search(fld_dict, data):
     Runs multiple regex searched on several fields, and only returns items that
     match all searches
     """
-    matches = {}
-    for key, rec in data.items():
-        match_flag = True
-        for fld_nm, srch in fld_dict.items():
-            if not srch:
-                srch = ""
-            if not re.search(srch, rec.get(fld_nm, ''), re.IGNORECASE):
-                match_flag = False
-        if match_flag is True:
-            matches[key] = rec
-    return matches
+    return search_engine.search(fld_dict, data)
 
 
 def fetch_by_fld_val(fld_nm: str,
@@ -0,0 +1,111 @@
+"""
+This module tests our asyncio interface to the database.
+The async drivers are optional, so we mock the DB handle.
+"""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+import backendcore.data.async_db_connect as adbc
+
+TEST_DB = 'test_db'
+TEST_COLLECT = 'test_collect'
+
+TEST_REC = {'fld0': 'def_val'}
+
+
+def mock_db():
+    db = MagicMock()
+    db.read_one = AsyncMock(return_value=TEST_REC)
+    db.read = AsyncMock(return_value=[TEST_REC])
+    return db
+
+
+def test_read_one():
+    db = mock_db()
+    with patch.object(adbc.connections, 'get', return_value=db):
+        rec = asyncio.run(adbc.read_one(TEST_DB, TEST_COLLECT))
+    assert rec == TEST_REC
+
+
+def test_fetch_all():
+    db = mock_db()
+    with patch.object(adbc.connections, 'get', return_value=db):
+        recs = asyncio.run(adbc.fetch_all(TEST_DB, TEST_COLLECT))
+    assert recs == [TEST_REC]
+
+
+def test_concurrent_reads():
+    db = mock_db()
+
+    async def read_many():
+        return await asyncio.gather(*[adbc.read_one(TEST_DB, TEST_COLLECT)
+                                      for i in range(10)])
+
+    with patch.object(adbc.connections, 'get', return_value=db):
+        recs = asyncio.run(read_many())
+    assert len(recs) == 10
+
+
+def test_disconnect_catch():
+    db = mock_db()
+    db.read_one = AsyncMock(side_effect=[ConnectionError, TEST_REC])
+    with patch.object(adbc.connections, 'get', return_value=db):
+        rec = asyncio.run(adbc.read_one(TEST_DB, TEST_COLLECT))
+    assert rec == TEST_REC
+
+
+def test_logic_error_not_retried():
+    db = mock_db()
+    db.read_one = AsyncMock(side_effect=ValueError('Bad filter'))
+    with patch.object(adbc.connections, 'get', return_value=db):
+        with pytest.raises(ValueError):
+            asyncio.run(adbc.read_one(TEST_DB, TEST_COLLECT))
+    assert db.read_one.call_count == 1
+
+
+def test_nested_calls_retry_once():
+    db = mock_db()
+    db.read_one = AsyncMock(side_effect=ConnectionError)
+
+    @adbc.needs_db
+    async def outer():
+        return await adbc.read_one(TEST_DB, TEST_COLLECT)
+
+    with patch.object(adbc.connections, 'get', return_value=db):
+        with patch.object(adbc.dbc, 'breaker', adbc.dbc.CircuitBreaker()):
+            with patch.object(adbc.dbc, 'retry_delay', return_value=0):
+                with pytest.raises(ConnectionError):
+                    asyncio.run(outer())
+    assert db.read_one.call_count == adbc.dbc.MAX_CONNECT_RETRIES
+
+
+@pytest.fixture()
+def sql_db():
+    """
+    A real async SQL handle, over the in-memory DB, if we have the driver.
+    """
+    asdb = adbc.asdb
+    if asdb.create_async_engine is None:
+        pytest.skip('No async SQL driver.')
+    db = asdb.AsyncSqlDB(variant=asdb.sdb.SQLITE_MEM)
+    yield db
+    asyncio.run(db.engine.dispose())
+    asdb.async_engine = None
+
+
+def test_sql_upsert(sql_db):
+    async def upsert_twice():
+        rec_id = await sql_db.upsert(TEST_DB, TEST_COLLECT,
+                                     {'fld0': 'upsert_val'}, {'n': 1})
+        await sql_db.update(TEST_DB, TEST_COLLECT, {'fld0': 'upsert_val'},
+                            {'n': 2}, upsert=True)
+        recs = await sql_db.read(TEST_DB, TEST_COLLECT,
+                                 filters={'fld0': 'upsert_val'})
+        await sql_db.delete(TEST_DB, TEST_COLLECT, {'_id': rec_id})
+        return recs
+
+    recs = asyncio.run(upsert_twice())
+    assert len(recs) == 1
+    assert recs[0]['n'] == 2
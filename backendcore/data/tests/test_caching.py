@@ -1,6 +1,9 @@
+import asyncio
+import threading
+import time
 from copy import deepcopy
 
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 import pytest
 
@@ -131,6 +134,31 @@ def test_init():
     assert isinstance(dcollect, cach.DataCollection)
 
 
+def test_init_declares_no_index():
+    with patch.object(cach.dbc, 'declare_index') as mock_declare:
+        cach.DataCollection(TEMP_DB, 'Index collection', key_fld=KEY_FLD)
+        mock_declare.assert_not_called()
+
+
+def test_declare_indexes():
+    dcollect = cach.DataCollection(TEMP_DB, 'Unique key collection',
+                                   key_fld=KEY_FLD, versioned=True,
+                                   unique_key=True)
+    with patch.object(cach.dbc, 'declare_index') as mock_declare:
+        dcollect.declare_indexes()
+    mock_declare.assert_any_call(TEMP_DB, 'Unique key collection',
+                                 [KEY_FLD], unique=True)
+    mock_declare.assert_any_call(TEMP_DB, cach.VERSION_COLLECT,
+                                 [cach.CACHE_NM])
+
+
+def test_declare_indexes_not_unique(new_dcollect):
+    with patch.object(cach.dbc, 'declare_index') as mock_declare:
+        new_dcollect.declare_indexes()
+    mock_declare.assert_called_once_with(TEMP_DB, TEMP_COLLECT, [KEY_FLD],
+                                         unique=False)
+
+
 def test_init_dup_collection(new_dcollect):
     with pytest.raises(ValueError):
         cach.DataCollection(TEMP_DB, TEMP_COLLECT)
@@ -308,3 +336,642 @@ def test_clear_cache(mock_fetch, new_dcollect):
     assert new_dcollect.exists(VAL1)
     new_dcollect.clear_cache()
     assert new_dcollect.data_dict is None
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=deepcopy(TEST_LIST))
+def test_fetch_list_read_only(mock_fetch, new_dcollect):
+    ret = new_dcollect.fetch_list(read_only=True)
+    assert isinstance(ret, cach.ListView)
+    assert len(ret) == len(TEST_LIST)
+    assert ret[0] == new_dcollect.data_list[0]
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=deepcopy(TEST_LIST))
+def test_fetch_dict_read_only(mock_fetch, new_dcollect):
+    ret = new_dcollect.fetch_dict(read_only=True)
+    assert isinstance(ret, cach.DictView)
+    assert VAL1 in ret
+    assert ret[VAL1] == new_dcollect.data_dict[VAL1]
+    assert ret.to_dict() == new_dcollect.data_dict
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=deepcopy(TEST_LIST))
+def test_read_only_rec_copy_on_write(mock_fetch, new_dcollect):
+    rec = new_dcollect.fetch_by_key(VAL1, read_only=True)
+    assert isinstance(rec, cach.CowRecord)
+    rec[FLD2] = 'a changed value'
+    assert rec[FLD2] == 'a changed value'
+    # the cache must be untouched:
+    assert new_dcollect.fetch_by_key(VAL1)[FLD2] == VAL2
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=deepcopy(TEST_LIST))
+def test_fetch_by_key_copies_rec(mock_fetch, new_dcollect):
+    rec = new_dcollect.fetch_by_key(VAL1)
+    assert isinstance(rec, dict)
+    rec[FLD2] = 'a changed value'
+    assert new_dcollect.fetch_by_key(VAL1)[FLD2] == VAL2
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=deepcopy(TEST_LIST))
+def test_add_to_cache_keeps_sort(mock_fetch, new_dcollect):
+    new_dcollect.fetch_list()
+    first_rec = {KEY_FLD: 'first', FLD2: 'a sorts first'}
+    new_dcollect._add_to_cache(first_rec)
+    assert new_dcollect.data_list[0] is first_rec
+    new_dcollect.clear_cache()
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=deepcopy(TEST_LIST))
+def test_add_to_cache_dup(mock_fetch, new_dcollect):
+    new_dcollect.fetch_list()
+    new_dcollect.fetch_dict()
+    with pytest.raises(ValueError):
+        new_dcollect._add_to_cache(deepcopy(REC1))
+    new_dcollect.clear_cache()
+
+
+def test_add_keeps_cache(some_recs):
+    """
+    An add should go into the cache, not clear it.
+    """
+    some_recs.add(DIFF_REC)
+    assert some_recs.data_list is not None
+    assert DIFF_KEY_VAL in some_recs.data_dict
+    some_recs.delete(DIFF_KEY_VAL)
+    assert DIFF_KEY_VAL not in some_recs.data_dict
+
+
+def test_update_keeps_cache(some_recs):
+    NEW_VAL = 'zzz new value'
+    some_recs.fetch_list()
+    some_recs.update_fld(VAL1, FLD2, NEW_VAL)
+    assert some_recs.data_list is not None
+    assert some_recs.data_dict[VAL1][FLD2] == NEW_VAL
+    # we sort on FLD2, so the rec should have moved to the end:
+    assert some_recs.data_list[-1][KEY_FLD] == VAL1
+
+
+def test_update_by_id_clears_cache(some_recs):
+    some_recs.fetch_list()
+    some_recs._maintain(some_recs._cache_update, 'some id', {FLD2: VAL2},
+                        True, False)
+    assert some_recs.data_list is None
+
+
+def test_delete_many_keeps_cache(new_dcollect):
+    new_dcollect.clear_cache()
+    new_dcollect.add(deepcopy(REC1))
+    new_dcollect.add(deepcopy(REC2))
+    new_dcollect.fetch_list()
+    new_dcollect.delete_many({FLD2: VAL2})
+    assert new_dcollect.data_list is not None
+    assert not new_dcollect.exists(VAL1)
+    assert new_dcollect.exists(VAL3)
+    new_dcollect.delete(VAL3)
+
+
+TTL_COLLECT = cach.DataCollection(TEMP_DB,
+                                  'TempTTLCollection',
+                                  key_fld=KEY_FLD,
+                                  sort_fld=FLD2,
+                                  ttl=60,
+                                  )
+
+VERSIONED_COLLECT = cach.DataCollection(TEMP_DB,
+                                        'TempVersionedCollection',
+                                        key_fld=KEY_FLD,
+                                        sort_fld=FLD2,
+                                        versioned=True,
+                                        version_check_secs=0,
+                                        )
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=TEST_LIST)
+def test_ttl_expired(mock_fetch):
+    ttl_collect = deepcopy(TTL_COLLECT)
+    ttl_collect.fetch_list()
+    assert not ttl_collect.is_stale()
+    ttl_collect.loaded_at -= ttl_collect.ttl
+    assert ttl_collect.is_stale()
+    ttl_collect.fetch_list()
+    assert mock_fetch.call_count == 2
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=TEST_LIST)
+def test_version_changed_elsewhere(mock_fetch):
+    versioned_collect = deepcopy(VERSIONED_COLLECT)
+    versioned_collect.fetch_list()
+    assert not versioned_collect.is_stale()
+    # pretend another process wrote to the collection:
+    cach.dbc.upsert(TEMP_DB, cach.VERSION_COLLECT,
+                    {cach.CACHE_NM: versioned_collect.cache_nm},
+                    {cach.CACHE_NM: versioned_collect.cache_nm,
+                     cach.VERSION: 'a new version'})
+    assert versioned_collect.is_stale()
+    versioned_collect.fetch_list()
+    assert mock_fetch.call_count == 2
+    assert versioned_collect.version == 'a new version'
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=TEST_LIST)
+def test_version_changed_elsewhere_check_secs(mock_fetch):
+    versioned_collect = deepcopy(VERSIONED_COLLECT)
+    versioned_collect.version_check_secs = 60
+    versioned_collect.fetch_list()
+    cach.dbc.upsert(TEMP_DB, cach.VERSION_COLLECT,
+                    {cach.CACHE_NM: versioned_collect.cache_nm},
+                    {cach.CACHE_NM: versioned_collect.cache_nm,
+                     cach.VERSION: 'a newer version'})
+    # not due for a check yet:
+    versioned_collect.fetch_list()
+    assert mock_fetch.call_count == 1
+    versioned_collect.version_checked_at -= 60
+    # the check on the lock-free path must carry through the fill:
+    versioned_collect.fetch_list()
+    assert mock_fetch.call_count == 2
+    assert versioned_collect.version == 'a newer version'
+    versioned_collect.fetch_dict()
+    assert mock_fetch.call_count == 2
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=TEST_LIST)
+def test_own_write_keeps_version(mock_fetch):
+    versioned_collect = deepcopy(VERSIONED_COLLECT)
+    versioned_collect.fetch_list()
+    versioned_collect._publish_write()
+    assert versioned_collect.data_list is not None
+    assert not versioned_collect.is_stale()
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=TEST_LIST)
+def test_version_io_outside_lock(mock_fetch):
+    versioned_collect = deepcopy(VERSIONED_COLLECT)
+    versioned_collect.fetch_list()
+    upsert = cach.dbc.upsert
+    held = []
+
+    def check_lock(*args, **kwargs):
+        held.append(versioned_collect.lock._is_owned())
+        return upsert(*args, **kwargs)
+
+    with patch.object(cach.dbc, 'upsert', side_effect=check_lock):
+        versioned_collect._maintain(versioned_collect._cache_delete, VAL1,
+                                    False)
+    assert held == [False]
+    # our own write still leaves the cache fresh:
+    assert versioned_collect.data_list is not None
+    assert not versioned_collect.is_stale()
+
+
+LIST_FLD = 'list_fld'
+INDEXED_LIST = [
+    {KEY_FLD: VAL1, FLD2: VAL2, LIST_FLD: [VAL3, VAL4]},
+    {KEY_FLD: VAL3, FLD2: VAL4, LIST_FLD: [VAL4]},
+]
+
+INDEXED_COLLECT = cach.DataCollection(TEMP_DB,
+                                      'TempIndexedCollection',
+                                      key_fld=KEY_FLD,
+                                      sort_fld=FLD2,
+                                      index_flds=[FLD2, LIST_FLD],
+                                      )
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=INDEXED_LIST)
+def test_read_only_rec_nested_write(mock_fetch):
+    indexed_collect = deepcopy(INDEXED_COLLECT)
+    rec = indexed_collect.fetch_by_key(VAL1, read_only=True)
+    rec[LIST_FLD].append('a new member')
+    assert rec[LIST_FLD] == [VAL3, VAL4, 'a new member']
+    nested = indexed_collect.fetch_list(read_only=True)[0][LIST_FLD]
+    nested.clear()
+    # the cache must be untouched:
+    assert indexed_collect.fetch_by_key(VAL1)[LIST_FLD] == [VAL3, VAL4]
+    assert INDEXED_LIST[0][LIST_FLD] == [VAL3, VAL4]
+
+
+def test_fld_index_lookup():
+    data_dict = {rec[KEY_FLD]: rec for rec in INDEXED_LIST}
+    index = cach.FldIndex(LIST_FLD)
+    for key_val, rec in data_dict.items():
+        index.add(key_val, rec)
+    assert list(index.lookup(VAL4, data_dict, test_membership=True)) \
+        == [VAL1, VAL3]
+    index.remove(VAL1, data_dict[VAL1])
+    assert list(index.lookup(VAL4, data_dict, test_membership=True)) \
+        == [VAL3]
+
+
+def test_fld_index_copy_on_write():
+    data_dict = {rec[KEY_FLD]: rec for rec in INDEXED_LIST}
+    index = cach.FldIndex(LIST_FLD)
+    for key_val, rec in data_dict.items():
+        index.add(key_val, rec)
+    new_index = index.copy()
+    new_index.remove(VAL1, data_dict[VAL1])
+    assert list(new_index.lookup(VAL4, data_dict, test_membership=True)) \
+        == [VAL3]
+    # readers of the old index don't see the change:
+    assert list(index.lookup(VAL4, data_dict, test_membership=True)) \
+        == [VAL1, VAL3]
+
+
+def test_fld_index_unhashable_val():
+    index = cach.FldIndex(FLD2)
+    assert index.lookup([VAL1], {}) is None
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=INDEXED_LIST)
+def test_fetch_by_fld_val_indexed(mock_fetch):
+    indexed_collect = deepcopy(INDEXED_COLLECT)
+    ret = indexed_collect.fetch_by_fld_val(FLD2, VAL2)
+    assert list(ret) == [VAL1]
+    ret = indexed_collect.fetch_by_fld_val(LIST_FLD, VAL4,
+                                           test_membership=True)
+    assert len(ret) == 2
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=INDEXED_LIST)
+def test_index_maintained(mock_fetch):
+    indexed_collect = deepcopy(INDEXED_COLLECT)
+    indexed_collect.fetch_dict()
+    indexed_collect._add_to_cache({KEY_FLD: DIFF_KEY_VAL, FLD2: VAL2})
+    assert len(indexed_collect.fetch_by_fld_val(FLD2, VAL2)) == 2
+    indexed_collect._remove_from_cache([VAL1])
+    assert list(indexed_collect.fetch_by_fld_val(FLD2, VAL2)) \
+        == [DIFF_KEY_VAL]
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=INDEXED_LIST)
+def test_indexed_read_is_lock_free(mock_fetch):
+    indexed_collect = deepcopy(INDEXED_COLLECT)
+    indexed_collect.fetch_by_fld_val(FLD2, VAL2)
+    results = []
+
+    def read():
+        results.append(indexed_collect.fetch_by_fld_val(FLD2, VAL2))
+        results.append(indexed_collect.regex_search({FLD2: VAL2}))
+
+    with indexed_collect.lock:
+        # as though a writer or a slow fill held the lock:
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(timeout=5)
+        assert not reader.is_alive()
+    assert [list(res) for res in results] == [[VAL1], [VAL1]]
+
+
+SEARCH_COLLECT = cach.DataCollection(TEMP_DB,
+                                     'TempSearchCollection',
+                                     key_fld=KEY_FLD,
+                                     sort_fld=FLD2,
+                                     search_flds=[FLD2],
+                                     )
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=TEST_LIST)
+def test_regex_search(mock_fetch):
+    search_collect = deepcopy(SEARCH_COLLECT)
+    ret = search_collect.regex_search({FLD2: VAL2.upper()})
+    assert list(ret) == [VAL1]
+    assert search_collect.search_index is not None
+
+
+def test_add_many(new_dcollect):
+    new_dcollect.clear_cache()
+    new_dcollect.fetch_list()
+    ids = new_dcollect.add_many([deepcopy(REC2), deepcopy(REC1)])
+    assert len(ids) == 2
+    assert new_dcollect.data_list is not None
+    # the cache should have stayed sorted on FLD2:
+    assert [rec[KEY_FLD] for rec in new_dcollect.data_list] == [VAL1, VAL3]
+    new_dcollect.delete_many({})
+    assert len(new_dcollect) == 0
+
+
+def test_add_many_fails_part_way():
+    versioned_collect = cach.DataCollection(TEMP_DB,
+                                            'TempPartialCollection',
+                                            key_fld=KEY_FLD,
+                                            sort_fld=FLD2,
+                                            versioned=True,
+                                            version_check_secs=0,
+                                            )
+    versioned_collect.fetch_list()
+    old_version = versioned_collect._fetch_version()
+    insert_chunk = cach.dbc._insert_chunk
+    calls = []
+
+    def fail_second_chunk(*args, **kwargs):
+        calls.append(args)
+        if len(calls) > 1:
+            raise ConnectionError('Lost the DB!')
+        return insert_chunk(*args, **kwargs)
+
+    try:
+        with patch.object(cach.dbc, '_insert_chunk',
+                          side_effect=fail_second_chunk):
+            with pytest.raises(ConnectionError):
+                versioned_collect.add_many([deepcopy(REC1), deepcopy(REC2)],
+                                           chunk_size=1)
+        # the first chunk went in, so the cache must not hide it:
+        assert versioned_collect.data_list is None
+        assert versioned_collect._fetch_version() != old_version
+        assert list(versioned_collect.fetch_dict()) == [VAL1]
+    finally:
+        versioned_collect.delete_many({})
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=TEST_LIST)
+def test_add_many_dup(mock_fetch, new_dcollect):
+    with pytest.raises(ValueError):
+        new_dcollect.add_many([deepcopy(DIFF_REC), deepcopy(DIFF_REC)])
+    with pytest.raises(ValueError):
+        new_dcollect.add_many([deepcopy(REC1)])
+
+
+PAGED_COLLECT = cach.PagedCollection(TEMP_DB,
+                                     'TempPagedCollection',
+                                     key_fld=KEY_FLD,
+                                     sort_fld=KEY_FLD,
+                                     page_size=2,
+                                     max_hot_recs=2,
+                                     )
+
+NUM_PAGED_RECS = 5
+
+
+@pytest.fixture(scope='function')
+def paged_recs():
+    paged_collect = deepcopy(PAGED_COLLECT)
+    paged_collect.add_many([{KEY_FLD: f'key{i}', FLD2: VAL2}
+                            for i in range(NUM_PAGED_RECS)])
+    yield paged_collect
+    paged_collect.delete_many({})
+
+
+def test_paged_fetch_list(paged_recs):
+    ret = paged_recs.fetch_list()
+    assert not isinstance(ret, list)
+    assert len(list(ret)) == NUM_PAGED_RECS
+
+
+def test_paged_fetch_page(paged_recs):
+    page = paged_recs.fetch_page(1)
+    assert [rec[KEY_FLD] for rec in page] == ['key2', 'key3']
+    last_page = paged_recs.fetch_page(2)
+    assert len(last_page) == 1
+
+
+def test_paged_fetch_by_key(paged_recs):
+    assert paged_recs.fetch_by_key('key3')[FLD2] == VAL2
+    assert paged_recs.fetch_by_key('key4')[FLD2] == VAL2
+    assert paged_recs.fetch_by_key('Not a key!') is None
+    # we only keep max_hot_recs records around:
+    assert len(paged_recs) == paged_recs.max_hot_recs
+    assert 'key4' in paged_recs.hot_recs
+
+
+def test_paged_exists(paged_recs):
+    with patch('backendcore.data.db_connect.read_one',
+               autospec=True) as mock_read:
+        assert paged_recs.exists('key0')
+        assert not paged_recs.exists('Not a key!')
+    # we only need to know it's there, not what it is:
+    mock_read.assert_not_called()
+    assert 'key0' not in paged_recs.hot_recs
+
+
+def test_paged_update_forgets_rec(paged_recs):
+    paged_recs.fetch_by_key('key1')
+    paged_recs.update_fld('key1', FLD2, VAL4)
+    assert 'key1' not in paged_recs.hot_recs
+    assert paged_recs.fetch_by_key('key1')[FLD2] == VAL4
+
+
+def test_paged_fetch_dict(paged_recs):
+    ret = paged_recs.fetch_dict()
+    # paged by id, so in no particular order:
+    assert sorted(ret) == [f'key{i}' for i in range(NUM_PAGED_RECS)]
+    ret = paged_recs.fetch_dict(filters={KEY_FLD: 'key3'}, read_only=True)
+    assert isinstance(ret, cach.DictView)
+    assert list(ret) == ['key3']
+
+
+def test_paged_load_list_by_page(paged_recs):
+    with patch('backendcore.data.db_connect.select_page',
+               wraps=cach.dbc.select_page) as mock_page:
+        assert len(paged_recs._load_list()) == NUM_PAGED_RECS
+    # 5 records in pages of 2:
+    assert mock_page.call_count == 3
+
+
+def test_paged_fetch_dict_null_sort_vals():
+    # sort_fld defaults to NAME, which these records lack:
+    paged_collect = cach.PagedCollection(TEMP_DB, 'TempNamelessCollection',
+                                         key_fld=KEY_FLD, page_size=2)
+    paged_collect.add_many([{KEY_FLD: f'key{i}'}
+                            for i in range(NUM_PAGED_RECS)])
+    try:
+        ret = paged_collect.fetch_dict()
+        assert len(ret) == NUM_PAGED_RECS
+    finally:
+        paged_collect.delete_many({})
+
+
+def test_paged_fetch_list_streams(paged_recs):
+    with patch('backendcore.data.db_connect.stream',
+               wraps=cach.dbc.stream) as mock_stream:
+        assert len(list(paged_recs.fetch_list())) == NUM_PAGED_RECS
+    mock_stream.assert_called_once()
+
+
+def test_paged_regex_search(paged_recs):
+    ret = paged_recs.regex_search({KEY_FLD: 'KEY[13]'})
+    assert sorted(ret) == ['key1', 'key3']
+
+
+WARM_CACHE_NM = 'TempWarmCollection'
+
+
+def a_cached_fn():
+    return cach.get_cache(WARM_CACHE_NM)
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=TEST_LIST)
+def test_warm_up_declared(mock_fetch):
+    cach.needs_cache(a_cached_fn, WARM_CACHE_NM, TEMP_DB, WARM_CACHE_NM,
+                     key_fld=KEY_FLD, sort_fld=FLD2)
+    assert not cach.is_registered(WARM_CACHE_NM)
+    ret = cach.warm_up([WARM_CACHE_NM], max_workers=2)
+    assert ret == {WARM_CACHE_NM: len(TEST_LIST)}
+    assert cach.get_cache(WARM_CACHE_NM).data_dict is not None
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=TEST_LIST)
+def test_refresh_swaps_cache(mock_fetch, new_dcollect):
+    old_list = new_dcollect.fetch_list(read_only=True)
+    new_dcollect.refresh()
+    assert mock_fetch.call_count == 2
+    assert new_dcollect.data_dict is not None
+    # readers of the old cache are unaffected:
+    assert len(old_list) == len(TEST_LIST)
+
+
+def test_refresher_start_stop():
+    refresher = cach.start_refresher(60, cache_nms=[])
+    assert refresher.thread.is_alive()
+    refresher.stop(timeout=5)
+    assert not refresher.thread.is_alive()
+
+
+NUM_THREADS = 8
+
+
+def slow_fetch_all(*args, **kwargs):
+    time.sleep(.1)
+    return deepcopy(TEST_LIST)
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       side_effect=slow_fetch_all)
+def test_single_flight_fill(mock_fetch, new_dcollect):
+    new_dcollect.clear_cache()
+    results = []
+
+    def read():
+        results.append(new_dcollect.fetch_dict(read_only=True))
+
+    threads = [threading.Thread(target=read) for i in range(NUM_THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert mock_fetch.call_count == 1
+    assert len(results) == NUM_THREADS
+    assert all(len(res) == len(TEST_LIST) for res in results)
+
+
+def test_deepcopy_gets_new_lock(new_dcollect):
+    assert new_dcollect.lock is not TEST_DCOLLECT.lock
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=deepcopy(TEST_LIST))
+def test_metrics(mock_fetch, new_dcollect):
+    new_dcollect.clear_cache()
+    new_dcollect.metrics = cach.CacheMetrics()
+    new_dcollect.fetch_dict(read_only=True)
+    new_dcollect.fetch_dict(read_only=True)
+    metrics = new_dcollect.get_metrics()
+    assert metrics[cach.MISSES] == 1
+    assert metrics[cach.HITS] == 1
+    assert metrics[cach.LOADS] == 1
+    assert metrics[cach.NUM_RECS] == len(TEST_LIST)
+    assert metrics[cach.APPROX_BYTES] > 0
+    new_dcollect.clear_cache()
+    assert new_dcollect.get_metrics()[cach.CLEARS] == 1
+
+
+def test_get_metrics_all():
+    metrics = cach.get_metrics()
+    assert TEST_DCOLLECT.cache_nm in metrics
+
+
+def test_get_metrics_no_such_cache():
+    with pytest.raises(ValueError):
+        cach.get_metrics('No such cache')
+
+
+@patch('backendcore.data.async_db_connect.fetch_all', new_callable=AsyncMock,
+       return_value=deepcopy(TEST_LIST))
+def test_warm_up_async(mock_fetch, new_dcollect):
+    new_dcollect.clear_cache()
+    assert asyncio.run(new_dcollect.warm_up_async()) == len(TEST_LIST)
+    assert new_dcollect.exists(VAL1)
+    # now it's loaded, we shouldn't read again:
+    asyncio.run(new_dcollect.warm_up_async())
+    assert mock_fetch.await_count == 1
+
+
+PROJ_COLLECT = cach.DataCollection(TEMP_DB,
+                                   'TempProjCollection',
+                                   key_fld=KEY_FLD,
+                                   sort_fld=FLD2,
+                                   exclude_flds=[FLD2],
+                                   )
+
+
+@patch('backendcore.data.db_connect.fetch_all', autospec=True,
+       return_value=[{KEY_FLD: VAL1}])
+def test_exclude_flds_pushed_down(mock_fetch):
+    PROJ_COLLECT.clear_cache()
+    PROJ_COLLECT.fetch_dict()
+    assert mock_fetch.call_args.kwargs['exclude_flds'] == [FLD2]
+
+
+def test_cache_rec_projected():
+    assert FLD2 not in PROJ_COLLECT._cache_rec(REC1)
+
+
+SECRET_FLD = 'secret'
+
+
+def test_update_keeps_projection():
+    proj_collect = cach.DataCollection(TEMP_DB, 'TempUpdateProjCollection',
+                                       key_fld=KEY_FLD,
+                                       sort_fld=KEY_FLD,
+                                       exclude_flds=[SECRET_FLD],
+                                       )
+    proj_collect.add(deepcopy(REC1))
+    try:
+        proj_collect.fetch_list()
+        proj_collect.update(VAL1, {FLD2: VAL4, SECRET_FLD: 'shh'})
+        assert proj_collect.data_list is not None
+        assert proj_collect.data_dict[VAL1][FLD2] == VAL4
+        assert SECRET_FLD not in proj_collect.data_dict[VAL1]
+    finally:
+        proj_collect.delete(VAL1)
+
+
+def test_upsert_keeps_projection():
+    proj_collect = cach.DataCollection(TEMP_DB, 'TempUpsertProjCollection',
+                                       key_fld=KEY_FLD,
+                                       sort_fld=KEY_FLD,
+                                       no_id=True,
+                                       exclude_flds=[SECRET_FLD],
+                                       )
+    proj_collect.empty_cache()
+    try:
+        proj_collect.update(VAL1, {FLD2: VAL4, SECRET_FLD: 'shh'},
+                            upsert=True)
+        assert proj_collect.data_dict[VAL1][FLD2] == VAL4
+        assert SECRET_FLD not in proj_collect.data_dict[VAL1]
+    finally:
+        proj_collect.delete(VAL1)
+
+
+def test_cannot_exclude_key():
+    with pytest.raises(ValueError):
+        cach.DataCollection(TEMP_DB, 'TempBadProjCollection',
+                            key_fld=KEY_FLD, exclude_flds=[KEY_FLD])
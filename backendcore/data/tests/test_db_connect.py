@@ -3,6 +3,7 @@ This module tests our code for database connectivity.
 For the moment, the tests will assume MongoDB.
 """
 import random
+import threading
 
 from unittest.mock import patch
 import pytest
@@ -323,6 +324,223 @@ def test_insert_doc_w_date():
     dbc.delete_by_id(TEST_DB, TEST_COLLECT, ret)
 
 
+def test_insert_many():
+    unique_val = rand_fld_val()
+    docs = [{DEF_FLD: unique_val} for i in range(5)]
+    ids = dbc.insert_many(TEST_DB, TEST_COLLECT, docs, chunk_size=2)
+    assert len(ids) == len(docs)
+    recs = dbc.select(TEST_DB, TEST_COLLECT, filters={DEF_FLD: unique_val})
+    assert len(recs) == len(docs)
+    dbc.delete_many(TEST_DB, TEST_COLLECT, {DEF_FLD: unique_val})
+
+
+def test_select_proj():
+    unique_val = rand_fld_val()
+    dbc.insert_many(TEST_DB, TEST_COLLECT,
+                    [{DEF_FLD: unique_val, NEW_FLD: NEW_VAL}])
+    recs = dbc.select(TEST_DB, TEST_COLLECT, filters={DEF_FLD: unique_val},
+                      proj=[NEW_FLD], no_id=True)
+    assert recs == [{NEW_FLD: NEW_VAL}]
+    recs = dbc.read(TEST_DB, TEST_COLLECT, filters={DEF_FLD: unique_val},
+                    exclude_flds=[NEW_FLD], no_id=True)
+    assert len(recs) == 1
+    assert recs[0][DEF_FLD] == unique_val
+    assert NEW_FLD not in recs[0]
+    dbc.delete_many(TEST_DB, TEST_COLLECT, {DEF_FLD: unique_val})
+
+
+def test_insert_many_bad_chunk_size():
+    with pytest.raises(ValueError):
+        dbc.insert_many(TEST_DB, TEST_COLLECT, [DEF_PAIR], chunk_size=0)
+
+
+def test_stream():
+    unique_val = rand_fld_val()
+    docs = [{DEF_FLD: unique_val, NEW_FLD: NEW_VAL} for i in range(5)]
+    dbc.insert_many(TEST_DB, TEST_COLLECT, docs)
+    recs = list(dbc.stream(TEST_DB, TEST_COLLECT,
+                           filters={DEF_FLD: unique_val},
+                           exclude_flds=[NEW_FLD],
+                           batch_size=2))
+    assert len(recs) == len(docs)
+    for rec in recs:
+        assert NEW_FLD not in rec
+    dbc.delete_many(TEST_DB, TEST_COLLECT, {DEF_FLD: unique_val})
+
+
+def test_stream_bad_batch_size():
+    with pytest.raises(ValueError):
+        next(dbc.stream(TEST_DB, TEST_COLLECT, batch_size=0))
+
+
+def test_select_skip():
+    unique_val = rand_fld_val()
+    docs = [{DEF_FLD: unique_val, NEW_FLD: str(i)} for i in range(5)]
+    dbc.insert_many(TEST_DB, TEST_COLLECT, docs)
+    recs = dbc.select(TEST_DB, TEST_COLLECT, filters={DEF_FLD: unique_val},
+                      sort=dbc.ASC, sort_fld=NEW_FLD, limit=2, skip=2)
+    assert [rec[NEW_FLD] for rec in recs] == ['2', '3']
+    dbc.delete_many(TEST_DB, TEST_COLLECT, {DEF_FLD: unique_val})
+
+
+def test_select_page():
+    unique_val = rand_fld_val()
+    docs = [{DEF_FLD: unique_val, NEW_FLD: str(i // 2)} for i in range(5)]
+    dbc.insert_many(TEST_DB, TEST_COLLECT, docs)
+    seen = []
+    page_token = None
+    while True:
+        recs, page_token = dbc.select_page(TEST_DB, TEST_COLLECT,
+                                           filters={DEF_FLD: unique_val},
+                                           sort_fld=NEW_FLD, page_size=2,
+                                           page_token=page_token,
+                                           proj=[DEF_FLD], no_id=True)
+        assert len(recs) <= 2
+        seen.extend(recs)
+        if page_token is None:
+            break
+    assert seen == [{DEF_FLD: unique_val}] * len(docs)
+    dbc.delete_many(TEST_DB, TEST_COLLECT, {DEF_FLD: unique_val})
+
+
+def test_select_page_bad_token():
+    with pytest.raises(ValueError):
+        dbc.select_page(TEST_DB, TEST_COLLECT, page_token='not a token!')
+
+
+def test_page_token_round_trip():
+    rec = {dbc.OBJ_ID_NM: 7, NEW_FLD: NEW_VAL}
+    page_token = dbc.encode_page_token(rec, NEW_FLD)
+    assert dbc.decode_page_token(page_token) == (NEW_VAL, 7)
+
+
+def test_count_documents():
+    unique_val = rand_fld_val()
+    docs = [{DEF_FLD: unique_val, NEW_FLD: NEW_VAL} for i in range(3)]
+    dbc.insert_many(TEST_DB, TEST_COLLECT, docs)
+    assert dbc.count_documents(TEST_DB, TEST_COLLECT,
+                               filters={DEF_FLD: unique_val}) == len(docs)
+    dbc.delete_many(TEST_DB, TEST_COLLECT, {DEF_FLD: unique_val})
+    assert dbc.count_documents(TEST_DB, TEST_COLLECT,
+                               filters={DEF_FLD: unique_val}) == 0
+
+
+def test_exists():
+    unique_val = rand_fld_val()
+    assert not dbc.exists(TEST_DB, TEST_COLLECT, {DEF_FLD: unique_val})
+    dbc.insert_doc(TEST_DB, TEST_COLLECT, {DEF_FLD: unique_val})
+    assert dbc.exists(TEST_DB, TEST_COLLECT, {DEF_FLD: unique_val})
+    dbc.delete_many(TEST_DB, TEST_COLLECT, {DEF_FLD: unique_val})
+
+
+def test_filter_ops():
+    unique_val = rand_fld_val()
+    docs = [{DEF_FLD: unique_val, NEW_FLD: str(i)} for i in range(3)]
+    dbc.insert_many(TEST_DB, TEST_COLLECT, docs)
+    filters = dbc.create_and_filter(
+        {DEF_FLD: unique_val},
+        dbc.create_in_filter(NEW_FLD, ['0', '2']))
+    assert dbc.count_documents(TEST_DB, TEST_COLLECT, filters) == 2
+    filters = {DEF_FLD: unique_val, NEW_FLD: {'$gte': '1'}}
+    assert dbc.count_documents(TEST_DB, TEST_COLLECT, filters) == 2
+    dbc.delete_many(TEST_DB, TEST_COLLECT, {DEF_FLD: unique_val})
+
+
+def test_declare_index():
+    dbc.declare_index(TEST_DB, TEST_COLLECT, [DEF_FLD])
+    assert not dbc.indexes_ensured
+    dbc.ensure_indexes()
+    assert dbc.indexes_ensured
+    with patch.object(dbc, 'ensure_index') as mock_ensure:
+        # already done:
+        assert dbc.ensure_indexes() == []
+        mock_ensure.assert_not_called()
+    dbc.declared_indexes.remove((TEST_DB, TEST_COLLECT, (DEF_FLD,), False))
+
+
+def test_ensure_indexes_retries_failures():
+    dbc.declare_index(TEST_DB, TEST_COLLECT, [NEW_FLD])
+    with patch.object(dbc, 'ensure_index', side_effect=ConnectionError):
+        assert dbc.ensure_indexes() == []
+    assert not dbc.indexes_ensured
+    dbc.declared_indexes.remove((TEST_DB, TEST_COLLECT, (NEW_FLD,), False))
+
+
+def test_ensure_indexes_gives_up():
+    dbc.declare_index(TEST_DB, TEST_COLLECT, [NEW_FLD], unique=True)
+    with patch.object(dbc, 'ensure_index', side_effect=ValueError):
+        dbc.ensure_indexes()
+    # that won't fix itself, so we stop trying:
+    assert dbc.indexes_ensured
+    assert ((TEST_DB, TEST_COLLECT, (NEW_FLD,), True)
+            not in dbc.declared_indexes)
+
+
+def test_ensure_indexes_in_background():
+    dbc.declare_index(TEST_DB, TEST_COLLECT, [DEF_FLD])
+    dbc.ensure_indexes_in_background()
+    dbc.index_thread.join(timeout=5)
+    assert dbc.indexes_ensured
+    with patch.object(dbc.threading, 'Thread') as mock_thread:
+        # already done:
+        dbc.ensure_indexes_in_background()
+        mock_thread.assert_not_called()
+    dbc.declared_indexes.remove((TEST_DB, TEST_COLLECT, (DEF_FLD,), False))
+
+
+def test_ensure_indexes_in_background_retries():
+    dbc.declare_index(TEST_DB, TEST_COLLECT, [NEW_FLD])
+    with patch.object(dbc, 'ensure_index',
+                      side_effect=[ConnectionError, 'ix']):
+        with patch.object(dbc, 'INDEX_RETRY_SECS', 0):
+            dbc.ensure_indexes_in_background()
+            dbc.index_thread.join(timeout=5)
+    assert dbc.indexes_ensured
+    dbc.declared_indexes.remove((TEST_DB, TEST_COLLECT, (NEW_FLD,), False))
+
+
+def test_upsert_many():
+    unique_val = rand_fld_val()
+    docs = [{DEF_FLD: unique_val, NEW_FLD: str(i)} for i in range(3)]
+    dbc.upsert_many(TEST_DB, TEST_COLLECT, docs, [DEF_FLD, NEW_FLD],
+                    chunk_size=2)
+    dbc.upsert_many(TEST_DB, TEST_COLLECT, docs, [DEF_FLD, NEW_FLD])
+    assert dbc.count_documents(TEST_DB, TEST_COLLECT,
+                               {DEF_FLD: unique_val}) == len(docs)
+    dbc.delete_many(TEST_DB, TEST_COLLECT, {DEF_FLD: unique_val})
+
+
+def test_upsert_many_no_key_flds():
+    with pytest.raises(ValueError):
+        dbc.upsert_many(TEST_DB, TEST_COLLECT, [DEF_PAIR], [])
+
+
+def test_ensure_index_no_flds():
+    with pytest.raises(ValueError):
+        dbc.ensure_index(TEST_DB, TEST_COLLECT, [])
+
+
+def test_handle_shared_by_threads():
+    handle = dbc.connections.get()
+    assert dbc.connections.get() is handle
+    other_handles = []
+    thread = threading.Thread(
+        target=lambda: other_handles.append(dbc.connections.get()))
+    thread.start()
+    thread.join()
+    assert other_handles[0] is handle
+
+
+def test_handle_reset():
+    handle = dbc.connections.get()
+    dbc.connections.reset()
+    assert dbc.connections.get() is not handle
+
+
+def test_database_proxy():
+    assert dbc.database.read_one == dbc.connections.get().read_one
+
+
 def test_cleanup():
     """
     Makes sure there are no documents left in the database after testing is
@@ -360,3 +578,75 @@ def test_disconnect_catch_too_many_retries(mock_mongo_disconnect):
     """
     with pytest.raises(ConnectionError):
         dbc.read_one(TEST_DB, TEST_COLLECT, filters={})
+
+
+@patch(
+    f'{DB_OBJ}.read_one',
+    autospec=True,
+    side_effect=ValueError('Bad filter'),
+)
+def test_logic_error_not_retried(mock_read_one):
+    with pytest.raises(ValueError):
+        dbc.read_one(TEST_DB, TEST_COLLECT, filters={})
+    assert mock_read_one.call_count == 1
+
+
+def test_retry_delay():
+    for attempt in range(10):
+        assert 0 <= dbc.retry_delay(attempt) <= dbc.RETRY_MAX_SECS
+
+
+def test_breaker_opens():
+    breaker = dbc.CircuitBreaker(max_failures=2, reset_secs=60)
+    breaker.failed()
+    breaker.check()
+    breaker.failed()
+    assert breaker.is_open()
+    with pytest.raises(dbc.DBUnavailable):
+        breaker.check()
+
+
+def test_breaker_half_open():
+    breaker = dbc.CircuitBreaker(max_failures=1, reset_secs=0)
+    breaker.failed()
+    assert breaker.is_open()
+    breaker.check()  # let through to test the DB
+    breaker.succeeded()
+    assert not breaker.is_open()
+
+
+@patch(f'{DB_OBJ}.read_one', autospec=True, return_value={})
+def test_needs_db_fails_fast(mock_read_one):
+    with patch.object(dbc, 'breaker',
+                      dbc.CircuitBreaker(max_failures=1, reset_secs=60)):
+        dbc.breaker.failed()
+        with pytest.raises(dbc.DBUnavailable):
+            dbc.read_one(TEST_DB, TEST_COLLECT, filters={})
+    assert mock_read_one.call_count == 0
+
+
+def test_nested_needs_db_retries_once():
+    calls = []
+
+    @dbc.needs_db
+    def inner():
+        calls.append(1)
+        raise ConnectionError
+
+    @dbc.needs_db
+    def outer():
+        return inner()
+
+    with patch.object(dbc, 'breaker', dbc.CircuitBreaker()):
+        with patch.object(dbc, 'retry_delay', return_value=0):
+            with pytest.raises(ConnectionError):
+                outer()
+        # only the outer call retried, and failures were counted once:
+        assert len(calls) == dbc.MAX_CONNECT_RETRIES
+        assert dbc.breaker.failures == dbc.MAX_CONNECT_RETRIES
+    assert not dbc.in_db_call.get()
+
+
+def test_breaker_open_not_transient():
+    assert not dbc.is_transient(dbc.DBUnavailable())
+    assert dbc.is_transient(ConnectionError())
@@ -259,3 +259,46 @@ def test_regex_intersect_search_nonexistant_fld():
     assert KEY1 not in res
     assert KEY2 not in res
     assert KEY3 not in res
+
+
+def test_compile_regex_cached():
+    assert qry.compile_regex(VAL1) is qry.compile_regex(VAL1)
+
+
+def test_is_literal():
+    assert qry.is_literal(VAL1)
+    assert not qry.is_literal('val.*')
+
+
+def test_ngram_index_candidates():
+    index = qry.NgramIndex([FLD1])
+    for key, rec in TEST_DICT_VALS.items():
+        index.add(key, rec)
+    assert index.candidates(FLD1, VAL1.upper()) == {KEY1, KEY3}
+    # regexes and short patterns can't be pruned:
+    assert index.candidates(FLD1, 'val.*') is None
+    assert index.candidates(FLD1, 'v') is None
+    index.remove(KEY1, TEST_DICT_VALS[KEY1])
+    assert index.candidates(FLD1, VAL1) == {KEY3}
+
+
+def test_ngram_index_copy_on_write():
+    index = qry.NgramIndex([FLD1])
+    for key, rec in TEST_DICT_VALS.items():
+        index.add(key, rec)
+    new_index = index.copy()
+    new_index.remove(KEY1, TEST_DICT_VALS[KEY1])
+    assert new_index.candidates(FLD1, VAL1) == {KEY3}
+    # readers of the old index don't see the change:
+    assert index.candidates(FLD1, VAL1) == {KEY1, KEY3}
+
+
+def test_search_engine_with_index():
+    index = qry.NgramIndex([FLD1, FLD2])
+    for key, rec in TEST_DICT_VALS.items():
+        index.add(key, rec)
+    engine = qry.SearchEngine(index)
+    res = engine.search({FLD1: VAL1, FLD2: VAL4}, TEST_DICT_VALS)
+    assert list(res) == [KEY3]
+    res = engine.search({FLD1: 'val[13]'}, TEST_DICT_VALS)
+    assert len(res) == len(TEST_DICT_VALS)
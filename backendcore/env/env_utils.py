@@ -10,11 +10,14 @@ FLAG_ON = '1'
 CICD_VAR = 'CI'
 
 
-def is_flag_on(var: str) -> bool:
+def is_flag_on(var: str, default: bool = False) -> bool:
     """
     Determines whether a env flag is "on".
+    An unset flag is `default`.
     """
-    raw_val = os.getenv(var, '')
+    raw_val = os.getenv(var)
+    if raw_val is None:
+        return default
     try:
         val = int(raw_val)
     except ValueError:
@@ -22,5 +25,18 @@ def is_flag_on(var: str) -> bool:
     return bool(val)
 
 
+def get_int(var: str, default: int = None) -> int:
+    """
+    Gets an int from the env: an unset (or empty) var is `default`.
+    """
+    raw_val = os.getenv(var, '')
+    if raw_val == '':
+        return default
+    try:
+        return int(raw_val)
+    except ValueError:
+        raise ValueError(f'Env var {var} must be an int, not {raw_val}')
+
+
 def is_cicd_env():
     return is_flag_on(CICD_VAR)
@@ -1,5 +1,7 @@
 import os
 
+import pytest
+
 import backendcore.env.env_utils as envu
 import unittest.mock as mock
 
@@ -79,3 +81,24 @@ def test_is_not_cicd_env():
             {envu.CICD_VAR: '0'},
             clear=True):
         assert not envu.is_cicd_env()
+
+
+def test_is_flag_on_default():
+    with mock.patch.dict(os.environ, {}, clear=True):
+        assert envu.is_flag_on(TEST_VAR, default=True)
+
+
+def test_get_int():
+    with mock.patch.dict(os.environ, {TEST_VAR: '46'}, clear=True):
+        assert envu.get_int(TEST_VAR) == 46
+
+
+def test_get_int_default():
+    with mock.patch.dict(os.environ, {}, clear=True):
+        assert envu.get_int(TEST_VAR, 17) == 17
+
+
+def test_get_int_bad():
+    with mock.patch.dict(os.environ, {TEST_VAR: 'forty-six'}, clear=True):
+        with pytest.raises(ValueError):
+            envu.get_int(TEST_VAR)
@@ -25,6 +25,13 @@ FEATURES = [ADD_DSRC]  # just one as of now
 FT_PW_DB = dbc.USER_DB  # in case we ever move it!
 
 
+def declare_indexes():
+    """
+    Declares the index fetch_by_password() needs, for dbc.ensure_indexes().
+    """
+    dbc.declare_index(FT_PW_DB, FT_PW_COLLECTION, [PSWD, USER])
+
+
 def fetch_by_password(password: str, user_id: str):
     """
     Fetch a record based upon a unique password.
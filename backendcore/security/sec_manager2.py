@@ -78,6 +78,14 @@ def is_valid_action(action: str):
     return action in VALID_ACTIONS
 
 
+def declare_indexes():
+    """
+    add_user() and delete_user() find protocols by name: declares that
+    index, for dbc.ensure_indexes().
+    """
+    dbc.declare_index(SEC_DB, SEC_COLLECT, [PROT_NM])
+
+
 class ActionChecks(object):
     """
     The defaults will mean no checks.
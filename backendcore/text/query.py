@@ -5,7 +5,11 @@ so we make no provisions for that.
 """
 import backendcore.common.time_fmts as tfmt
 
-from backendcore.data.caching import needs_cache, get_cache
+from backendcore.data.caching import (
+    declare_indexes as declare_cache_indexes,
+    get_cache,
+    needs_cache,
+)
 
 from backendcore.text.fields import (
     EDITOR,
@@ -26,7 +30,16 @@ def needs_text_cache(fn):
     return needs_cache(fn, CACHE_NM, DB,
                        COLLECT,
                        key_fld=TITLE,
-                       sort_fld=TITLE)
+                       sort_fld=TITLE,
+                       unique_key=True)
+
+
+def declare_indexes():
+    """
+    Declares our unique index on TITLE, for dbc.ensure_indexes().
+    It lets an upsert go to SQL as one statement.
+    """
+    declare_cache_indexes([CACHE_NM])
 
 
 def is_valid(code):
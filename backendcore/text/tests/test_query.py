@@ -1,4 +1,5 @@
 from copy import deepcopy
+from unittest.mock import patch
 
 import pytest
 
@@ -46,3 +47,10 @@ def test_update_text_bad_title(temp_text):
     NEW_TEXT = 'Some new text'
     with pytest.raises(ValueError):
         qry.update('Not an existing title', NEW_TEXT, NEW_ED)
+
+
+def test_declare_indexes():
+    with patch('backendcore.data.db_connect.declare_index') as mock_declare:
+        qry.declare_indexes()
+    mock_declare.assert_called_once_with(qry.DB, qry.COLLECT, [qry.TITLE],
+                                         unique=True)
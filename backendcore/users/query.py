@@ -46,6 +46,14 @@ RECIP_EMAIL = 'recip_email'
 db_name = None
 
 
+def declare_indexes():
+    """
+    Declares the indexes our lookups need, for dbc.ensure_indexes().
+    """
+    for fld_nm in [EMAIL, KEY, PAY_PROV_SID]:
+        dbc.declare_index(get_client_db(), USER_COLLECT, [fld_nm])
+
+
 def needs_db_name(fn):
     """
     Should be used to decorate any function that directly uses the db name.
@@ -133,12 +141,13 @@ def del_user(user_id: str):
     return delete(user_id)
 
 
+@needs_db_name
 def exists(user_id: str):
     """
     Is this id already in the user DB?
     Returns True is so, else False.
     """
-    return fetch_user(user_id) is not None
+    return dbc.exists(db_name, USER_COLLECT, filters={EMAIL: user_id})
 
 
 def user_exists(user_id: str):
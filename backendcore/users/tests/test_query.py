@@ -6,6 +6,7 @@ import random
 
 import pytest
 import os
+from unittest.mock import patch
 
 import backendcore.data.db_connect as dbc
 import backendcore.users.query as usr
@@ -74,6 +75,13 @@ def test_user_not_exists(a_user):
     assert not usr.user_exists(GARBAGE_TEST_USER)
 
 
+def test_declare_indexes():
+    with patch.object(dbc, 'declare_index') as mock_declare:
+        usr.declare_indexes()
+    declared = [call.args[2] for call in mock_declare.call_args_list]
+    assert declared == [[usr.EMAIL], [usr.KEY], [usr.PAY_PROV_SID]]
+
+
 @pytest.mark.skip("Can't use login in users tests: reversed heirarchy!")
 def test_fetch_logins(a_user, some_logins):
     logins = usr.fetch_logins(A_USERS_EMAIL)
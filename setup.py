@@ -18,4 +18,12 @@ setup(
         'SQLAlchemy',
         'sendgrid',
     ],
+    extras_require={
+        # for async_db_connect:
+        'async': [
+            'aiosqlite',
+            'motor==3.5.1',  # the last motor for our pymongo
+            'SQLAlchemy[asyncio]',
+        ],
+    },
 )